@@ -6,15 +6,22 @@ import sys
 
 sys.path.append('./code')
 
-from tools import Experiment, preprocess, mapp, logmeanexp
-from numpy import load, mean, log, min, max, std, sqrt
+from tools import Experiment, Evaluation, preprocess, mapp, logmeanexp
+from numpy import load, save, mean, log, min, max, std, sqrt
+from os import path
 from models import Distribution 
 
 Distribution.VERBOSITY = 0
 mapp.max_processes = 2#10
 
 NUM_AIS_SAMPLES = 300
-NUM_AIS_STEPS = 300
+
+# finished shards of data points are stored so that evaluations can be resumed
+SHARD_SIZE = 50
+
+# annealing schedule is tuned on a subset of the data points
+ANNEALING_ESS = 0.99
+NUM_TUNING_POINTS = 100
 
 def main(argv):
 	if len(argv) < 2:
@@ -42,9 +49,27 @@ def main(argv):
 	data = load('data/vanhateren.{0}.0.npz'.format(results['parameters'][0]))['data']
 	data = preprocess(data, shuffle=False)
 
+	model = results['model']
+
+	directory = argv[1][:-4] + '{0}-{1}'.format(fr, to)
+	schedule = path.join(directory, 'annealing_weights.npy')
+
+	if path.exists(schedule):
+		# resume evaluation with the same annealing schedule
+		model.annealing_weights = load(schedule)
+
+	elif model.annealing_weights is None:
+		# choose annealing schedule using a pilot run
+		model.tune_annealing_weights(data[:, indices[:NUM_TUNING_POINTS]], ess=ANNEALING_ESS)
+
 	# compute importance weights estimating likelihoods
-	ais_weights = results['model'].loglikelihood(data[:, indices],
-		num_samples=NUM_AIS_SAMPLES, sampling_method=('ais', {'num_steps': NUM_AIS_STEPS}), return_all=True)
+	evaluation = Evaluation(directory, model, data[:, indices], shard_size=SHARD_SIZE,
+		num_samples=NUM_AIS_SAMPLES,
+		sampling_method=('ais', {'annealing_weights': model.annealing_weights}))
+	save(schedule, model.annealing_weights)
+	evaluation.run()
+
+	ais_weights = evaluation.merge()[1]
 
 	# average log-likelihood in [bit/pixel]
 	loglik = mean(logmeanexp(ais_weights, 0)) / log(2.) / data.shape[0]
@@ -53,6 +78,7 @@ def main(argv):
 	# store save results
 	experiment['indices'] = indices
 	experiment['ais_weights'] = ais_weights
+	experiment['annealing_weights'] = model.annealing_weights
 	experiment['loglik'] = loglik
 	experiment['sem'] = sem
 	experiment['fixed'] = True
@@ -9,7 +9,7 @@ import sys
 sys.path.append('./code')
 
 from models import ISA, MoGaussian, StackedModel, ConcatModel, Distribution
-from tools import preprocess, Experiment, mapp, imsave, imformat, stitch
+from tools import preprocess, Experiment, mapp, imsave, imformat, stitch, Checkpoint, Metrics
 from transforms import LinearTransform, WhiteningTransform
 from numpy import seterr, sqrt, dot, load, hstack, eye
 from numpy.random import rand
@@ -17,6 +17,9 @@ from numpy.random import rand
 # controls parallelization
 mapp.max_processes = 8
 
+# memory available to the Gibbs sampler (shared by all processes)
+MAX_BYTES = 8 * 2**30
+
 # controls how much information is printed during training
 Distribution.VERBOSITY = 2
 
@@ -72,6 +75,10 @@ def main(argv):
 	# start experiment
 	experiment = Experiment()
 
+	# log training progress and show it on the experiment server
+	Distribution.METRICS = Metrics('results/vanhateren.{0}/metrics.log'.format(argv[1]),
+		experiment=experiment)
+
 	# hyperparameters
 	patch_size, \
 	overcompleteness, \
@@ -186,10 +193,6 @@ def main(argv):
 			isa.orthogonalize()
 
 		else:
-			if patch_size == '16x16':
-				# prevents out-of-memory
-				mapp.max_processes = 1
-
 			# train model using a subset of the data
 			model.train(data[:, :20000], 1,
 				max_iter=max_iter,
@@ -198,14 +201,11 @@ def main(argv):
 				init_sampling_steps=5,
 				method=('sgd', {'momentum': 0.8}),
 				callback=lambda isa, iteration: callback(0, isa, iteration),
-				sampling_method=('gibbs', {'num_steps': 1}))
+				checkpoint=Checkpoint('results/vanhateren.{0}/checkpoints.0/'.format(argv[1])),
+				sampling_method=('gibbs', {'num_steps': 1, 'max_bytes': MAX_BYTES}))
 
 	experiment.progress(50)
 
-	if patch_size == '16x16':
-		# prevents out-of-memory
-		mapp.max_processes = 1
-
 	# disable regularization
 	for gsm in isa.subspaces:
 		gsm.gamma = 0.
@@ -219,7 +219,8 @@ def main(argv):
 		init_sampling_steps=10 if not len(argv) > 2 and (sparse_coding or not train_prior) else 50,
 		method=('lbfgs', {'max_fun': 50}),
 		callback=lambda isa, iteration: callback(1, isa, iteration),
-		sampling_method=('gibbs', {'num_steps': 2}))
+		checkpoint=Checkpoint('results/vanhateren.{0}/checkpoints.1/'.format(argv[1])),
+		sampling_method=('gibbs', {'num_steps': 2, 'max_bytes': MAX_BYTES}))
 
 	experiment.save('results/vanhateren/vanhateren.{0}.{{0}}.{{1}}.xpck'.format(argv[1]))
 
@@ -6,6 +6,7 @@ from distribution import Distribution
 from isa import ISA
 from ica import ICA
 from gsm import GSM
+from gsmbank import GSMBank
 from mogaussian import MoGaussian
 from concatmodel import ConcatModel
 from stackedmodel import StackedModel
@@ -40,10 +40,15 @@ class ConcatModel(Distribution):
 		model with the index given by the first element is trained and the remainder of the list
 		given as a parameter to that model.
 
+		If a L{Checkpoint} is given, each model stores its state in a subdirectory named after
+		the model's index.
+
 		@type  model: int/list/None
 		@param model: specifies which model to train
 		"""
 
+		checkpoint = kwargs.pop('checkpoint', None)
+
 		if isinstance(model, list):
 			if model:
 				if model[1:]:
@@ -53,6 +58,8 @@ class ConcatModel(Distribution):
 				model = None
 		for i, m in enumerate(self.models):
 			if model is None or model == i:
+				if checkpoint is not None:
+					kwargs['checkpoint'] = checkpoint.child(str(i))
 				m.train(data[:m.dim], **kwargs)
 			data = data[m.dim:]
 
@@ -91,3 +98,33 @@ class ConcatModel(Distribution):
 			data = data[m.dim:]
 
 		return loglik
+
+
+
+	def energy(self, data):
+		energy = zeros([1, data.shape[1]])
+
+		for m in self.models:
+			energy += m.energy(data[:m.dim])
+			data = data[m.dim:]
+
+		return energy
+
+
+
+	def energy_gradient(self, data):
+		return self.energy_and_gradient(data)[1]
+
+
+
+	def energy_and_gradient(self, data):
+		energy = zeros([1, data.shape[1]])
+		gradient = []
+
+		for m in self.models:
+			e, g = m.energy_and_gradient(data[:m.dim])
+			energy += e
+			gradient.append(g)
+			data = data[m.dim:]
+
+		return energy, vstack(gradient)
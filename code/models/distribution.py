@@ -6,14 +6,26 @@ __license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
 __author__ = 'Lucas Theis <lucas@bethgelab.org>'
 __docformat__ = 'epytext'
 
-from numpy import mean, log
+from numpy import mean, log, sum
+from tools.dataset import Dataset
 
 class Distribution(object):
 	"""
 	Provides an interface and common functionality for probabilistic models.
+
+	The floating point precision used for data, samples and large intermediate results is
+	controlled by C{DTYPE}. It can be set globally (C{Distribution.DTYPE = 'float32'}) or
+	for individual models. Parameters and numerically fragile computations such as
+	log-determinants and the marginalization of mixture components remain in double
+	precision, and energies and log-likelihoods are always returned in double precision.
+
+	If C{METRICS} is set to a L{Metrics} object, training methods pass it records of
+	their progress (e.g., one record per iteration).
 	"""
 
 	VERBOSITY = 1
+	DTYPE = 'float64'
+	METRICS = None
 
 	def __init__(self):
 		raise NotImplementedError(str(self.__class__) + ' is an abstract class.')
@@ -74,12 +86,17 @@ class Distribution(object):
 
 	def evaluate(self, data, **kwargs):
 		"""
-		Return average negative log-likelihood in bits per component.
+		Return average negative log-likelihood in bits per component. Data sets stored on
+		disk are evaluated chunk by chunk.
 
-		@type  data: array_like
+		@type  data: array_like/Dataset
 		@param data: data stored in columns
 		"""
 
+		if isinstance(data, Dataset):
+			loglik = sum([sum(self.loglikelihood(chunk, **kwargs)) for chunk in data.chunks()])
+			return -loglik / data.shape[1] / data.shape[0] / log(2.)
+
 		return -mean(self.loglikelihood(data, **kwargs)) / data.shape[0] / log(2.)
 
 
@@ -89,6 +106,32 @@ class Distribution(object):
 
 
 
+	def _record(self, **values):
+		"""
+		Passes a record of the training progress to C{METRICS}, if set.
+		"""
+
+		if self.METRICS is not None:
+			self.METRICS.record(model=self.__class__.__name__, **values)
+
+
+
 	def energy_gradient(self, data):
 		raise NotImplementedError('Abstract method \'energy_gradient\' not implemented in '
 			+ str(self.__class__))
+
+
+
+	def energy_and_gradient(self, data):
+		"""
+		Computes energy and energy gradient at once. Subclasses should override this
+		method if both share intermediate results.
+
+		@type  data: array_like
+		@param data: data stored in columns
+
+		@rtype: tuple
+		@return: energy of each data point and gradient with respect to the data
+		"""
+
+		return self.energy(data), self.energy_gradient(data)
@@ -7,7 +7,7 @@ __author__ = 'Lucas Theis <lucas@theis.io>'
 __docformat__ = 'epytext'
 
 from distribution import Distribution
-from numpy.random import rand, randint, randn
+from tools.rng import rand, randint, randn
 from numpy import *
 from numpy import min, max
 from scipy.stats import gamma, rayleigh
@@ -96,6 +96,9 @@ class GSM(Distribution):
 			value_ = -mean(self.loglikelihood(data)) \
 				+ self.gamma * (self.alpha + 1.) * sum(log(self.scales)) \
 				+ self.gamma / 2. * sum(self.beta / square(self.scales))
+
+			self._record(iteration=i + 1, value=value_)
+
 			if value - value_ < tol:
 				break
 			value = value_
@@ -132,7 +135,7 @@ class GSM(Distribution):
 		scales = self.scales[randint(self.num_scales, size=num_samples)]
 
 		# sample data points
-		return randn(self.dim, num_samples) * scales
+		return randn(self.dim, num_samples, dtype=self.DTYPE) * scales.astype(self.DTYPE)
 
 
 
@@ -189,7 +192,7 @@ class GSM(Distribution):
 		scales = self.scales.reshape(self.num_scales, 1)
 
 		# compute unnormalized log-likelihoods
-		sqnorms = sum(square(data), 0).reshape(1, -1)
+		sqnorms = sum(square(data), 0, dtype=float64).reshape(1, -1)
 		uloglik = -0.5 * sqnorms / square(scales) - self.dim * log(scales)
 
 		# average over scales
@@ -198,14 +201,23 @@ class GSM(Distribution):
 
 
 	def energy_gradient(self, data):
+		return self.energy_and_gradient(data)[1]
+
+
+
+	def energy_and_gradient(self, data):
 		scales = self.scales.reshape(self.num_scales, 1)
 
-		# compute posterior over scales
-		sqnorms = sum(square(data), 0).reshape(1, -1)
+		# compute posterior over scales (in double precision)
+		sqnorms = sum(square(data), 0, dtype=float64).reshape(1, -1)
 
 		# slow, but stable
-		post = -0.5 * sqnorms / square(scales) - self.dim * log(scales)
-		post = exp(post - logsumexp(post, 0))
+		uloglik = -0.5 * sqnorms / square(scales) - self.dim * log(scales)
+		lse = logsumexp(uloglik, 0)
+		post = exp(uloglik - lse)
+
+		# precision of the gradient is that of the data
+		precisions = dot(1. / square(scales).T, post).astype(result_type(data, float32))
 
-		# compute energy gradient
-		return multiply(dot(1. / square(scales).T, post), data)
+		# average over scales and compute energy gradient
+		return -(lse - log(self.num_scales)).reshape(1, -1), multiply(precisions, data)
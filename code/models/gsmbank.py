@@ -0,0 +1,427 @@
+"""
+Many isotropic GSMs packed into a single set of arrays.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+from distribution import Distribution
+from tools.rng import rand, randn
+from tools import profiler
+from numpy import *
+from numpy import min, max
+
+class GSMBank(Distribution):
+	"""
+	Represents a product of isotropic L{GSM}s modeling consecutive subspaces. The scales of
+	all GSMs are stored in a single 2D array so that energies, gradients, posterior samples
+	and EM updates of all subspaces can be computed with a few vectorized operations instead
+	of one call per subspace. Subspaces may differ in dimensionality and number of scales.
+
+	@type scales: ndarray
+	@ivar scales: standard deviations of the GSMs, one row per subspace
+
+	@type logweights: ndarray
+	@ivar logweights: log-prior weights of the scales (-inf marks padding)
+
+	@type dims: ndarray
+	@ivar dims: dimensionality of each subspace
+
+	@type offsets: ndarray
+	@ivar offsets: index of the first dimension of each subspace
+
+	@type indices: ndarray
+	@ivar indices: index of the subspace each dimension belongs to
+	"""
+
+	def __init__(self, subspaces):
+		"""
+		@type  subspaces: list
+		@param subspaces: L{GSM}s whose parameters will be copied into the bank
+		"""
+
+		self.dims = array([gsm.dim for gsm in subspaces])
+		self.dim = sum(self.dims)
+		self.num_scales = array([len(gsm.scales) for gsm in subspaces])
+
+		self.offsets = cumsum(self.dims) - self.dims
+		self.indices = repeat(arange(len(subspaces)), self.dims)
+
+		if all(self.num_scales == self.num_scales[0]):
+			self.scales = array([gsm.scales for gsm in subspaces], dtype=float)
+		else:
+			# pad missing scales with ones of zero weight
+			self.scales = ones([len(subspaces), max(self.num_scales)])
+			for k, gsm in enumerate(subspaces):
+				self.scales[k, :self.num_scales[k]] = gsm.scales
+
+		self.logweights = -log(self.num_scales).reshape(-1, 1) + zeros_like(self.scales)
+		self.logweights[arange(self.scales.shape[1]) >= self.num_scales.reshape(-1, 1)] = -inf
+
+		# parameters of inverse Gamma priors over scales
+		self.alpha = array([gsm.alpha for gsm in subspaces], dtype=float)
+		self.beta = array([gsm.beta for gsm in subspaces], dtype=float)
+		self.gamma = array([gsm.gamma for gsm in subspaces], dtype=float)
+
+
+
+	def __len__(self):
+		return len(self.dims)
+
+
+
+	def unpack(self, subspaces):
+		"""
+		Copies the scales back into the given GSMs.
+
+		@type  subspaces: list
+		@param subspaces: the L{GSM}s the bank was created from
+		"""
+
+		for k, gsm in enumerate(subspaces):
+			gsm.scales = self.scales[k, :self.num_scales[k]].copy()
+
+
+
+	def std(self):
+		"""
+		Returns the standard deviation of each GSM.
+
+		@rtype: ndarray
+		@return: one standard deviation per subspace
+		"""
+
+		return sqrt(sum(exp(self.logweights) * square(self.scales), 1))
+
+
+
+	def normalize(self):
+		"""
+		Normalizes the scales so that the standard deviation of each GSM becomes 1.
+		"""
+
+		self.scales /= self.std().reshape(-1, 1)
+
+
+
+	def sample(self, num_samples=1):
+		"""
+		Generate data samples.
+		"""
+
+		# sample scales
+		indices = floor(rand(len(self), num_samples) * self.num_scales.reshape(-1, 1))
+		scales = self.scales[arange(len(self)).reshape(-1, 1), indices.astype(int)]
+
+		# sample data points
+		return randn(self.dim, num_samples) * scales[self.indices]
+
+
+
+	@profiler.timed()
+	def sample_posterior(self, data, return_energy=False):
+		"""
+		Draw samples from posterior over scales.
+
+		@type  return_energy: boolean
+		@param return_energy: if true, also return the energy of the data points
+
+		@rtype: ndarray/tuple
+		@return: one row of scales for each subspace (and the energy)
+		"""
+
+		sqnorms = self._sqnorms(data)
+		lse = self._logsumexp(sqnorms)
+
+		# sample posterior by comparing uniform samples to cumulative posterior
+		uni = rand(len(self), data.shape[1])
+		cmf = zeros(uni.shape)
+		indices = zeros(uni.shape, 'int32')
+
+		for j in range(self.scales.shape[1] - 1):
+			cmf += exp(self._logjoint(sqnorms, j) - lse)
+			indices += uni > cmf
+
+		# numerical errors should not lead to padded scales
+		indices = minimum(indices, self.num_scales.reshape(-1, 1) - 1)
+
+		scales = self.scales[arange(len(self)).reshape(-1, 1), indices]
+
+		if return_energy:
+			return scales, -sum(lse, 0).reshape(1, -1)
+		return scales
+
+
+
+	def posterior(self, data):
+		"""
+		Calculate posterior over scales.
+
+		@type  data: array_like
+		@param data: data points stored in columns
+
+		@rtype: ndarray
+		@return: posterior over scales, one row per subspace and scale
+		"""
+
+		sqnorms = self._sqnorms(data)
+		lse = self._logsumexp(sqnorms)
+
+		return exp(dstack([self._logjoint(sqnorms, j) - lse
+			for j in range(self.scales.shape[1])]).transpose([0, 2, 1]))
+
+
+
+	@profiler.timed()
+	def train(self, data, max_iter=10, tol=1e-5):
+		"""
+		Fits the parameters of all GSMs to the given data using EM. Each GSM stops
+		being updated once its performance improves less than C{tol}.
+
+		@type  data: array_like
+		@param data: data stored in columns
+
+		@type  max_iter: integer
+		@param max_iter: the maximum number of EM iterations
+
+		@type  tol: float
+		@param tol: stop if performance improves less than this threshold
+		"""
+
+		sqnorms = self._sqnorms(data)
+		value = self._objective(sqnorms)
+
+		if Distribution.VERBOSITY > 2:
+			print 0, mean(value)
+
+		# GSMs which haven't converged yet
+		active = ones(len(self), dtype=bool)
+
+		for i in range(max_iter):
+			lse = self._logsumexp(sqnorms[active], active)
+
+			# calculate posterior over scales and sufficient statistics (E)
+			weights = zeros([sum(active), self.scales.shape[1]])
+			energies = zeros([sum(active), self.scales.shape[1]])
+
+			for j in range(self.scales.shape[1]):
+				post = exp(self._logjoint(sqnorms[active], j, active) - lse)
+				weights[:, j] = mean(post, 1)
+				energies[:, j] = mean(post * sqnorms[active], 1)
+
+			# adjust parameters (M)
+			self._maximize(weights, energies, active)
+
+			# check for convergence
+			value_ = self._objective(sqnorms)
+			active = logical_and(active, value - value_ >= tol)
+			value = value_
+
+			if not any(active):
+				break
+
+			if Distribution.VERBOSITY > 2:
+				print i + 1, mean(value)
+
+
+
+	def statistics(self, data):
+		"""
+		Computes the expected sufficient statistics used by EM. Averaging statistics of
+		different batches of data and passing them to L{maximize} allows the GSMs to be
+		trained online.
+
+		@type  data: array_like
+		@param data: data stored in columns
+
+		@rtype: tuple
+		@return: average posterior probabilities of the scales and average squared norms
+		weighted by these probabilities, one row per subspace
+		"""
+
+		sqnorms = self._sqnorms(data)
+		lse = self._logsumexp(sqnorms)
+
+		weights = zeros(self.scales.shape)
+		energies = zeros(self.scales.shape)
+
+		for j in range(self.scales.shape[1]):
+			post = exp(self._logjoint(sqnorms, j) - lse)
+			weights[:, j] = mean(post, 1)
+			energies[:, j] = mean(post * sqnorms, 1)
+
+		return weights, energies
+
+
+
+	def maximize(self, weights, energies):
+		"""
+		Updates the scales given expected sufficient statistics (see L{statistics}).
+		"""
+
+		self._maximize(weights, energies, ones(len(self), dtype=bool))
+
+
+
+	def loglikelihood(self, data):
+		return -self.energy(data) - self.dim / 2. * log(2. * pi)
+
+
+
+	def energy(self, data):
+		"""
+		Computes the energy summed over all subspaces.
+		"""
+
+		return -sum(self._logsumexp(self._sqnorms(data)), 0).reshape(1, -1)
+
+
+
+	def energy_gradient(self, data):
+		return self.energy_and_gradient(data)[1]
+
+
+
+	@profiler.timed()
+	def energy_and_gradient(self, data):
+		"""
+		Computes energy and gradient, sharing the posterior over scales.
+		"""
+
+		sqnorms = self._sqnorms(data)
+		lse = self._logsumexp(sqnorms)
+
+		# posterior expectation of inverse variances
+		precisions = zeros(sqnorms.shape)
+		for j in range(self.scales.shape[1]):
+			precisions += exp(self._logjoint(sqnorms, j) - lse) \
+				/ square(self.scales[:, [j]])
+
+		# precision of the gradient is that of the data
+		precisions = precisions.astype(result_type(data, float32))
+
+		return -sum(lse, 0).reshape(1, -1), multiply(precisions[self.indices], data)
+
+
+
+	def posterior_precisions(self, data):
+		"""
+		Computes posterior means and variances of the precisions (inverse variances) of
+		each subspace. With C{a} and C{b} denoting mean and variance for a subspace, the
+		Hessian of the energy with respect to the subspace's data is C{a I - b y y^T}.
+
+		@type  data: array_like
+		@param data: data points stored in columns
+
+		@rtype: tuple
+		@return: means and variances, one row per subspace
+		"""
+
+		sqnorms = self._sqnorms(data)
+		lse = self._logsumexp(sqnorms)
+
+		# first and second moments of the precisions
+		moment1 = zeros(sqnorms.shape)
+		moment2 = zeros(sqnorms.shape)
+
+		for j in range(self.scales.shape[1]):
+			post = exp(self._logjoint(sqnorms, j) - lse)
+			precision = 1. / square(self.scales[:, [j]])
+
+			moment1 += post * precision
+			moment2 += post * square(precision)
+
+		return moment1, (moment2 - square(moment1)).clip(0.)
+
+
+
+	def _sqnorms(self, data):
+		"""
+		Computes squared norms of the data points restricted to each subspace (in
+		double precision, since they enter the marginalization of the scales).
+		"""
+
+		return add.reduceat(square(data), self.offsets, 0, dtype=float64)
+
+
+
+	def _logjoint(self, sqnorms, j, active=None):
+		"""
+		Computes the unnormalized log-joint of the j-th scale and the data.
+		"""
+
+		if active is None:
+			scales = self.scales[:, [j]]
+			logweights = self.logweights[:, [j]]
+			dims = self.dims.reshape(-1, 1)
+		else:
+			scales = self.scales[active, j].reshape(-1, 1)
+			logweights = self.logweights[active, j].reshape(-1, 1)
+			dims = self.dims[active].reshape(-1, 1)
+
+		return logweights - 0.5 * sqnorms / square(scales) - dims * log(scales)
+
+
+
+	def _logsumexp(self, sqnorms, active=None):
+		"""
+		Computes unnormalized log-likelihoods by marginalizing the scales.
+		"""
+
+		# largest log-joint, subtracted for numerical stability
+		lmax = self._logjoint(sqnorms, 0, active)
+		for j in range(1, self.scales.shape[1]):
+			lmax = maximum(lmax, self._logjoint(sqnorms, j, active))
+
+		lse = zeros_like(lmax)
+		for j in range(self.scales.shape[1]):
+			lse += exp(self._logjoint(sqnorms, j, active) - lmax)
+		return log(lse) + lmax
+
+
+
+	def _maximize(self, weights, energies, active):
+		"""
+		Updates the scales of the selected GSMs (M-step).
+		"""
+
+		alpha = self.alpha[active].reshape(-1, 1)
+		beta = self.beta[active].reshape(-1, 1)
+		gamma = self.gamma[active].reshape(-1, 1)
+		dims = self.dims[active].reshape(-1, 1)
+
+		numer = energies + gamma * beta
+		denom = dims * weights + gamma * (alpha + 1.)
+
+		# scales which didn't explain any data
+		degenerated = logical_and(denom <= 0., isfinite(self.logweights[active]))
+
+		if any(degenerated):
+			if Distribution.VERBOSITY > 0:
+				print 'Degenerated scales {0}.'.format(self.scales[active][degenerated])
+
+			# reset problematic scales
+			numer[degenerated] = square(0.75 + rand(sum(degenerated)) / 2.)
+			denom[degenerated] = 1.
+
+		# padded scales remain untouched
+		padded = isinf(self.logweights[active])
+		numer[padded] = 1.
+		denom[padded] = 1.
+
+		self.scales[active] = sqrt(numer / denom)
+
+
+
+	def _objective(self, sqnorms):
+		"""
+		Regularized negative log-likelihood of each GSM (up to a constant).
+		"""
+
+		logscales = where(isfinite(self.logweights), log(self.scales), 0.)
+		invscales = where(isfinite(self.logweights), 1. / square(self.scales), 0.)
+
+		return -mean(self._logsumexp(sqnorms), 1) \
+			+ self.gamma * (self.alpha + 1.) * sum(logscales, 1) \
+			+ self.gamma / 2. * self.beta * sum(invscales, 1)
@@ -8,12 +8,13 @@ __docformat__ = 'epytext'
 
 from numpy import *
 from numpy.linalg import inv, det, slogdet
-from numpy.random import *
+from tools.rng import randn
 from scipy.optimize import fmin_l_bfgs_b
 from scipy.stats import laplace, t
 from distribution import Distribution
 from mogaussian import MoGaussian
-from tools import mapp
+from tools import mapp, Minibatches, profiler
+from time import time
 
 class ICA(Distribution):
 	def __init__(self, dim):
@@ -64,9 +65,23 @@ class ICA(Distribution):
 			print 0, self.evaluate(X)
 
 		for i in range(max_iter):
+			# wall time of each phase
+			times = [time()]
+
+			if train_prior or self.METRICS is not None:
+				Y = self.sample_posterior(X)
+
+			if self.METRICS is not None:
+				energy = mean(self.prior_energy(Y))
+
 			# optimize parameters of the prior (M)
 			if train_prior:
-				self.train_prior(self.sample_posterior(X))
+				self.train_prior(Y)
+
+			times.append(time())
+
+			# whether the pocket algorithm accepted the new filters
+			improved = None
 
 			# optimize linear features (M)
 			if method[0].lower() == 'sgd':
@@ -77,21 +92,35 @@ class ICA(Distribution):
 					method[1]['step_width'] *= 1.1 if improved else 0.5
 
 			elif method[0].lower() == 'lbfgs':
-				self.train_lbfgs(X, **method[1])
+				improved = self.train_lbfgs(X, **method[1])
+
+			times.append(time())
+
+			if self.METRICS is not None:
+				self._record(
+					iteration=i + 1,
+					energy=energy,
+					step_width=method[1].get('step_width', None),
+					improved=improved,
+					time_prior=times[1] - times[0],
+					time_basis=times[2] - times[1])
 
 			if Distribution.VERBOSITY > 0:
 				print i + 1, self.evaluate(X)
 
 
 
+	@profiler.timed()
 	def train_prior(self, Y, **kwargs):
+		# threads update the marginals in place
 		def parfor(i):
 			self.marginals[i].train(Y[[i]], **kwargs)
 			self.marginals[i].normalize()
-		mapp(parfor, range(self.dim))
+		mapp(parfor, range(self.dim), backend='threads')
 
 
 
+	@profiler.timed()
 	def train_sgd(self, X, **kwargs):
 		# hyperparameters
 		max_iter = kwargs.get('max_iter', 1)
@@ -111,22 +140,17 @@ class ICA(Distribution):
 		if pocket:
 			energy = mean(self.prior_energy(dot(W, X))) - slogdet(W)[1]
 
-		for j in range(max_iter):
-			if shuffle:
-				# randomize order of data
-				X = X[:, permutation(X.shape[1])]
-
-			for i in range(0, X.shape[1], batch_size):
-				batch = X[:, i:i + batch_size]
+		batches = Minibatches(X, batch_size, shuffle)
 
-				if not batch.shape[1] < batch_size:
-					# calculate gradient
-					P = momentum * P + A.T - \
-						dot(self.prior_energy_gradient(dot(W, batch)), batch.T) / batch_size
+		for j in range(max_iter):
+			for batch in batches:
+				# calculate gradient
+				P = momentum * P + A.T - \
+					dot(self.prior_energy_gradient(dot(W, batch)), batch.T) / batch_size
 
-					# update parameters
-					W += step_width * P
-					A = inv(W)
+				# update parameters
+				W += step_width * P
+				A = inv(W)
 
 		if pocket:
 			# test for improvement of lower bound
@@ -144,6 +168,7 @@ class ICA(Distribution):
 
 
 
+	@profiler.timed()
 	def train_lbfgs(self, X, **kwargs):
 		# hyperparameters
 		max_iter = kwargs.get('max_iter', 1)
@@ -152,40 +177,30 @@ class ICA(Distribution):
 		shuffle = kwargs.get('shuffle', True)
 		pocket = kwargs.get('pocket', shuffle)
 
-		# objective function
+		# objective function and its gradient
 		def f(W, X):
 			W = W.reshape(self.dim, self.dim)
-			return mean(self.prior_energy(dot(W, X))) - slogdet(W)[1]
-
-		# objective function gradient
-		def df(W, X):
-			W = W.reshape(self.dim, self.dim)
-			A = inv(W)
-			g = dot(self.prior_energy_gradient(dot(W, X)), X.T) / X.shape[1]
-			return (g - A.T).flatten()
+			energy, gradient = self.prior_energy_and_gradient(dot(W, X))
+			g = dot(gradient, X.T) / X.shape[1]
+			return mean(energy) - slogdet(W)[1], (g - inv(W).T).flatten()
 
 		# completed filter matrix
 		W = inv(self.A)
 
 		if pocket:
-			energy = f(W, X)
+			energy = f(W, X)[0]
 
-		for _ in range(max_iter):
-			if shuffle:
-				# randomize order of data
-				X = X[:, permutation(X.shape[1])]
+		batches = Minibatches(X, batch_size, shuffle)
 
+		for _ in range(max_iter):
 			# split data in batches and perform L-BFGS on batches
-			for i in range(0, X.shape[1], batch_size):
-				batch = X[:, i:i + batch_size]
-
-				if not batch.shape[1] < batch_size:
-					W, _, _ = fmin_l_bfgs_b(f, W.flatten(), df, (batch,), maxfun=max_fun,
-						disp=1 if Distribution.VERBOSITY > 1 else 0, iprint=0)
+			for batch in batches:
+				W, _, _ = fmin_l_bfgs_b(f, W.flatten(), None, (batch,), maxfun=max_fun,
+					disp=1 if Distribution.VERBOSITY > 1 else 0, iprint=0)
 
 		if pocket:
 			# test for improvement of lower bound
-			if f(W, X) > energy:
+			if f(W, X)[0] > energy:
 				# don't update parameters
 				return False
 
@@ -226,6 +241,7 @@ class ICA(Distribution):
 
 
 
+	@profiler.timed()
 	def sample_posterior(self, X):
 		return dot(inv(self.A), X) # faster than `solve` for large `X`
 
@@ -243,6 +259,27 @@ class ICA(Distribution):
 
 
 
+	def prior_energy_and_gradient(self, Y):
+		"""
+		Computes energy and gradient of the hidden states at once.
+
+		@type  Y: array_like
+		@param Y: a number of hidden states stored in columns
+
+		@rtype: tuple
+		@return: the energy of each data point and the gradient
+		"""
+
+		energy = zeros([1, Y.shape[1]])
+		energy_gradient = zeros([self.dim, Y.shape[1]])
+		for i in range(self.dim):
+			e, g = self.marginals[i].energy_and_gradient(Y[[i]])
+			energy += e
+			energy_gradient[i] = g
+		return energy, energy_gradient
+
+
+
 	def prior_energy(self, Y):
 		"""
 		For given hidden states, calculates the negative log-probability plus some constant.
@@ -281,3 +318,28 @@ class ICA(Distribution):
 
 	def loglikelihood(self, X):
 		return self.prior_loglikelihood(dot(inv(self.A), X)) - slogdet(self.A)[1]
+
+
+
+	def energy_gradient(self, X):
+		return self.energy_and_gradient(X)[1]
+
+
+
+	def energy_and_gradient(self, X):
+		"""
+		Computes the negative log-likelihood and its gradient with respect to the data.
+
+		@type  X: array_like
+		@param X: data points stored in columns
+
+		@rtype: tuple
+		@return: energy of each data point and gradient
+		"""
+
+		W = inv(self.A)
+
+		# the marginals are Gaussian mixtures, whose energy lacks the normalization constant
+		energy, gradient = self.prior_energy_and_gradient(dot(W, X))
+
+		return energy + self.dim / 2. * log(2. * pi) + slogdet(self.A)[1], dot(W.T, gradient)
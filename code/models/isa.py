@@ -9,23 +9,44 @@ __docformat__ = 'epytext'
 from distribution import Distribution
 from numpy import *
 from numpy import min, max, round
-from numpy.random import randint, randn, rand, logseries, permutation, gamma
-from numpy.linalg import svd, pinv, inv, det, slogdet, cholesky, eig
+from tools.rng import randint, randn, rand, logseries, permutation, gamma, getstate, setstate
+from numpy.linalg import svd, pinv, inv, det, slogdet, cholesky, eig, eigh, qr
 from scipy.linalg import solve
 from scipy.optimize import fmin_l_bfgs_b, fmin_cg, check_grad
 from scipy.stats import laplace, t, cauchy, exponpow
-from tools import gaborf, mapp, logmeanexp, asshmarray, sqrtmi, sqrtm
+from tools import gaborf, mapp, logmeanexp, asshared, sqrtmi, sqrtm, cholesky_solve, Dataset, \
+	Minibatches, profiler
 from warnings import warn
 from gsm import GSM
-from copy import deepcopy
+from gsmbank import GSMBank
 from time import time
+from multiprocessing import current_process
+from tempfile import TemporaryFile
+from numpy.lib.format import open_memmap
+from os import path
 
 class ISA(Distribution):
 	"""
 	An implementation of overcomplete ISA using Gaussian scale mixtures.
-	"""
 
-	global_time = 0
+	Samplers respect the precision set via C{DTYPE}, while the features are stored and
+	factorized in double precision. Laplace approximations always use double precision.
+
+	@type peak_bytes: integer
+	@ivar peak_bytes: estimated peak memory used by the last call to a memory-budgeted sampler
+
+	@type annealing_weights: ndarray
+	@ivar annealing_weights: annealing schedule chosen by the last adaptive run of AIS
+
+	@type lf_step_size: float/ndarray
+	@ivar lf_step_size: leap-frog step size chosen by the last adaptive run of HMC
+
+	@type mala_step_width: float/ndarray
+	@ivar mala_step_width: step width chosen by the last adaptive run of MALA
+
+	@type acceptance_rate: float
+	@ivar acceptance_rate: average acceptance rate of the last run of HMC or MALA
+	"""
 
 	def __init__(self, num_visibles, num_hiddens=None, ssize=1, num_scales=10, noise=False):
 		"""
@@ -52,6 +73,13 @@ class ISA(Distribution):
 		self.num_visibles = num_visibles
 		self.num_hiddens = num_hiddens
 
+		# matrices derived from the linear features
+		self._version = 0
+		self._cache = {}
+
+		# subspaces and scales from which the cached prior was created
+		self._bank = None
+
 		# random linear feature 
 		self.A = randn(self.num_visibles, self.num_hiddens) / 10.
 
@@ -65,6 +93,12 @@ class ISA(Distribution):
 		self._noise = False
 		self.noise = noise
 
+		self.peak_bytes = 0
+		self.annealing_weights = None
+		self.lf_step_size = None
+		self.mala_step_width = None
+		self.acceptance_rate = None
+
 
 
 	def initialize(self, X=None, method='data'):
@@ -175,6 +209,8 @@ class ISA(Distribution):
 			# don't initialize noise covariance
 			self.A[:, :self.num_visibles] = L
 
+		self._version += 1
+
 
 
 	def train(self, X, method=('sgd', {}), sampling_method=('gibbs', {}), **kwargs):
@@ -185,8 +221,33 @@ class ISA(Distribution):
 		The callback function takes two arguments: the model and the current iteration of the
 		EM algorithm. It is called before the training starts and then after every iteration.
 
+		If C{batch_size} is given, stochastic EM is used. Each iteration samples hidden states
+		only for a minibatch of data points, continuing the persistent Markov chains of these
+		data points. The prior is trained by online EM: expected sufficient statistics of
+		minibatches are averaged with step sizes M{(1 + i)^-step_size_decay} before the scales
+		are updated. The features are updated by the given method using only the minibatch.
+		If C{X} is a L{Dataset} stored on disk, only minibatches are loaded into memory and
+		the persistent chains are kept in a temporary file.
+
+		If a L{Checkpoint} is given, the state of the optimization (parameters, persistent
+		samples, step width, random number generator and, for stochastic EM, the order of
+		data points and the sufficient statistics) is stored after every iteration. If the
+		checkpoint already contains a state, training is resumed from there and continues
+		exactly as the interrupted training would have. The persistent chains of stochastic
+		EM are kept in the checkpoint's directory and updated in place, so that checkpoints
+		only store the chains of data points visited before the next checkpoint.
+
+		@type  X: array_like/Dataset
+		@param X: data points stored in columns
+
 		@type  max_iter: integer
-		@param max_iter: maximum number of iterations through the dataset
+		@param max_iter: maximum number of iterations through the dataset (or of minibatches)
+
+		@type  batch_size: integer
+		@param batch_size: number of data points processed per iteration (default: all)
+
+		@type  step_size_decay: float
+		@param step_size_decay: controls how quickly old statistics are forgotten, between 0.5 and 1 (default: 0.6)
 
 		@type  method: tuple
 		@param method: optimization method used to optimize basis
@@ -217,6 +278,9 @@ class ISA(Distribution):
 
 		@type  callback: function
 		@param callback: called after every iteration
+
+		@type  checkpoint: Checkpoint
+		@param checkpoint: used to store and resume the state of the optimization
 		"""
 
 		max_iter = kwargs.get('max_iter', 100)
@@ -228,6 +292,13 @@ class ISA(Distribution):
 		persistent = kwargs.get('persistent', True)
 		init_sampling_steps = kwargs.get('init_sampling_steps', 0)
 		callback = kwargs.get('callback', None)
+		batch_size = kwargs.get('batch_size', None)
+		step_size_decay = kwargs.get('step_size_decay', 0.6)
+		checkpoint = kwargs.get('checkpoint', None)
+
+		if batch_size is None and isinstance(X, Dataset):
+			# full-batch training needs all data points
+			X = asarray(X)
 
 		if Distribution.VERBOSITY > 0:
 			if self.num_hiddens > self.num_visibles:
@@ -245,35 +316,174 @@ class ISA(Distribution):
 			self.train_of(X, **method[1])
 			return
 
-		if callback:
-			callback(self, 0)
-
 		if isinstance(sampling_method, str):
 			sampling_method = (sampling_method, {})
 
-		if persistent and init_sampling_steps:
-			# initialize samples
-			sampling_method[1]['Z'] = self.sample_nullspace(X,
-				method=(sampling_method[0], dict(sampling_method[1], num_steps=init_sampling_steps)))
+		# number of completed iterations and state of an interrupted training
+		start, state = (checkpoint and checkpoint.load()) or (0, None)
+
+		if state is None:
+			if callback:
+				callback(self, 0)
+
+			if persistent and init_sampling_steps and batch_size is None:
+				# initialize samples
+				sampling_method[1]['Z'] = self.sample_nullspace(X, method=(sampling_method[0],
+					dict(sampling_method[1], num_steps=init_sampling_steps)))
+
+		else:
+			self.__setstate__(state['model'])
+
+			if 'step_width' in state:
+				method[1]['step_width'] = state['step_width']
+
+			if 'Z' in state:
+				sampling_method[1]['Z'] = state['Z']
+
+			if 'Y' in state:
+				sampling_method[1]['Y'] = state['Y']
 
 		if adaptive and 'step_width' not in method[1]:
 			method[1]['step_width'] = 0.001
 
-		for i in range(max_iter):
-			# complete data (E)
-			Y = self.sample_posterior(X, method=sampling_method)
+		if batch_size is not None:
+			# persistent samples of all data points, stored as hidden states since the
+			# nullspace basis changes before a minibatch is visited again
+			chains = sampling_method[1].pop('Y', None)
+			Z = sampling_method[1].pop('Z', None)
+
+			if not persistent:
+				# each minibatch is initialized with fresh samples from the prior
+				chains = None
+
+			elif checkpoint and state is not None and 'chain_columns' in state:
+				# the chains were updated in place after the checkpoint was written,
+				# so the columns visited since then are reverted
+				chains = open_memmap(path.join(checkpoint.directory, 'chains.npy'), mode='r+')
+				chains[:, state['chain_columns']] = state['chain_states']
+				chains = _Chains(chains)
+
+			elif chains is not None and not checkpoint:
+				chains = _Chains(chains)
+
+			else:
+				Y, shape = chains, (self.num_hiddens, X.shape[1])
+
+				if checkpoint:
+					# checkpoints only store the chains of the data points visited next
+					chains = open_memmap(path.join(checkpoint.directory, 'chains.npy'),
+						mode='w+', dtype=float64, shape=shape)
+				elif isinstance(X, Dataset):
+					# chains of data sets stored on disk are kept on disk as well
+					chains = memmap(TemporaryFile(), dtype=float64, mode='w+', shape=shape)
+				else:
+					chains = empty(shape)
+
+				# data sets are processed chunk by chunk and never loaded completely
+				chunk_size = X.block_size if isinstance(X, Dataset) else X.shape[1]
+
+				for offset in range(0, X.shape[1], chunk_size):
+					columns = slice(offset, offset + chunk_size)
+
+					if Y is not None:
+						chains[:, columns] = Y[:, columns]
+					elif state is None and init_sampling_steps:
+						chains[:, columns] = self.sample_posterior(X[:, columns],
+							method=(sampling_method[0],
+								dict(sampling_method[1], num_steps=init_sampling_steps)))
+					elif Z is not None:
+						chains[:, columns] = dot(self.nullspace_basis().T, Z[:, columns])
+					else:
+						chains[:, columns] = self.sample_prior(chains[:, columns].shape[1])
+
+				chains = _Chains(chains)
+
+			if state is None:
+				# minibatches cycle through the data in random order
+				order = permutation(X.shape[1])
+
+				# running averages of the prior's sufficient statistics
+				statistics = None
+
+			else:
+				order = state['order']
+
+				if chains is not None and 'chain_scales' in state:
+					chains.scales, chains.rows = state['chain_scales'], state['chain_rows']
+				statistics = [state['weights'], state['energies']] if 'weights' in state else None
+
+		if state is not None:
+			# continue with the same random numbers
+			setstate(state['rng'])
+
+		for i in range(start, max_iter):
+			# wall time of each phase
+			times = [time()]
+
+			# set by samplers which use Metropolis steps
+			self.acceptance_rate = None
+
+			if batch_size is None:
+				# complete data (E)
+				Y = self.sample_posterior(X, method=sampling_method)
+
+			else:
+				batch = order[(i * batch_size + arange(batch_size)) % X.shape[1]]
+
+				# complete data of minibatch (E), the chains are projected onto the
+				# hidden states consistent with the data under the current features
+				Y = self.sample_posterior(X[:, batch],
+					method=(sampling_method[0], dict(sampling_method[1],
+						Y=self.sample_prior(len(batch)) if chains is None else chains[batch])))
+
+			times.append(time())
+
+			if self.METRICS is not None:
+				energy = mean(self.prior_energy(Y))
 
 			if train_prior:
 				# optimize parameters of the prior (M)
-				self.train_prior(Y)
+				if batch_size is None:
+					self.train_prior(Y)
+
+				else:
+					bank = GSMBank(self.subspaces)
+
+					# stochastic approximation of sufficient statistics
+					step_size = (1. + i)**-step_size_decay
+					statistics = [(1. - step_size) * s + step_size * s_
+						for s, s_ in zip(statistics or (0., 0.), bank.statistics(Y))]
+
+					bank.maximize(*statistics)
+					bank.unpack(self.subspaces)
+
+			times.append(time())
 
 			if train_subspaces:
+				A = self.A
+
 				# learn subspaces (M)
 				Y = self.train_subspaces(Y)
 
+				if batch_size is not None:
+					# statistics of old subspaces are useless
+					statistics = None
+
+					# hidden units of all chains are rearranged like the features
+					if chains is not None:
+						chains.permute(_permutation(A, self.A))
+
+			times.append(time())
+
 			if persistent:
 				# initializes samples in next iteration
-				sampling_method[1]['Z'] = dot(self.nullspace_basis(), Y)
+				if batch_size is None:
+					sampling_method[1]['Z'] = dot(self.nullspace_basis(), Y)
+				else:
+					chains[batch] = Y
+
+			# whether the pocket algorithm accepted the new features
+			improved = None
 
 			# optimize linear features (M)
 			if train_basis:
@@ -288,7 +498,7 @@ class ISA(Distribution):
 						method[1]['step_width'] *= 1.1 if improved else 0.5
 
 				elif method[0].lower() == 'lbfgs':
-					self.train_lbfgs(Y, **method[1])
+					improved = self.train_lbfgs(Y, **method[1])
 
 				else:
 					raise ValueError('Unknown training method \'{0}\'.'.format(method[0]))
@@ -298,9 +508,35 @@ class ISA(Distribution):
 					self.orthogonalize()
 
 			if train_basis and train_prior and (not orthogonalize):
+				if batch_size is not None:
+					bank = self._prior()
+
+					# hidden states and their squared norms change with the normalization
+					if statistics is not None:
+						statistics[1] /= square(bank.std()).reshape(-1, 1)
+					if chains is not None:
+						chains.rescale(1. / bank.std()[bank.indices])
+
 				# normalize variances of marginals
 				self.normalize_prior()
 
+			times.append(time())
+
+			profiler.add('ISA.train.E-step', times[1] - times[0])
+			profiler.add('ISA.train.M-step', times[4] - times[1])
+
+			if self.METRICS is not None:
+				self._record(
+					iteration=i + 1,
+					energy=energy,
+					step_width=method[1].get('step_width', None),
+					improved=improved,
+					acceptance_rate=self.acceptance_rate,
+					time_sampling=times[1] - times[0],
+					time_prior=times[2] - times[1],
+					time_subspaces=times[3] - times[2],
+					time_basis=times[4] - times[3])
+
 			if callback:
 				callback(self, i + 1)
 
@@ -310,8 +546,43 @@ class ISA(Distribution):
 				else:
 					print i + 1, self.evaluate(X)
 
+			if checkpoint:
+				state = {'model': self.__getstate__(), 'rng': getstate()}
+
+				if 'step_width' in method[1]:
+					state['step_width'] = method[1]['step_width']
+
+				if batch_size is None:
+					if 'Z' in sampling_method[1]:
+						state['Z'] = sampling_method[1]['Z']
+				else:
+					state['order'] = order
+
+					if chains is not None:
+						state.update(chain_scales=chains.scales, chain_rows=chains.rows)
+
+						if (i + 1) % checkpoint.every == 0:
+							# chains are updated in place, so that only the data points
+							# visited before the next checkpoint need to be stored
+							columns = unique(order[((i + 1) * batch_size
+								+ arange(checkpoint.every * batch_size)) % X.shape[1]])
+							state.update(chain_columns=columns,
+								chain_states=chains.states[:, columns])
 
+							if isinstance(chains.states, memmap):
+								chains.states.flush()
 
+					if statistics is not None:
+						state.update(weights=statistics[0], energies=statistics[1])
+
+				checkpoint.save(i + 1, state)
+
+		if checkpoint:
+			checkpoint.wait()
+
+
+
+	@profiler.timed()
 	def train_prior(self, Y, **kwargs):
 		"""
 		Optimize parameters of the marginal distribution over the hidden variables.
@@ -325,15 +596,10 @@ class ISA(Distribution):
 		max_iter = kwargs.get('max_iter', 10)
 		tol = kwargs.get('tol', 1e-7)
 
-		offset = [0]
-		for model in self.subspaces:
-			offset.append(offset[-1] + model.dim)
-
-		def parfor(i):
-			model = self.subspaces[i]
-			model.train(Y[offset[i]:offset[i] + model.dim], max_iter=max_iter, tol=tol)
-			return model
-		self.subspaces = mapp(parfor, range(len(self.subspaces)))
+		# train all subspace GSMs at once
+		bank = GSMBank(self.subspaces)
+		bank.train(Y, max_iter=max_iter, tol=tol)
+		bank.unpack(self.subspaces)
 
 
 
@@ -342,18 +608,18 @@ class ISA(Distribution):
 		Normalizes the standard deviation of each subspace distribution.
 		"""
 
-		A = self.A
+		bank = GSMBank(self.subspaces)
 
-		for gsm in self.subspaces:
-			# update basis
-			A[:, :gsm.dim] *= gsm.std()
-			A = A[:, gsm.dim:]
+		# update basis
+		self.A *= bank.std()[bank.indices]
 
-			# update marginals
-			gsm.normalize()
+		# update marginals
+		bank.normalize()
+		bank.unpack(self.subspaces)
 
 
 
+	@profiler.timed()
 	def train_subspaces(self, Y, **kwargs):
 		"""
 		Improves likelihood through spliting and merging of subspaces. This function
@@ -465,6 +731,7 @@ class ISA(Distribution):
 
 
 
+	@profiler.timed()
 	def train_analytic(self, Y, **kwargs):
 		"""
 		Optimizes linear filters analytically. This only works if the model 
@@ -501,10 +768,13 @@ class ISA(Distribution):
 			# update covariance
 			self.A[:, :self.num_visibles] = sqrtm(cov(X - dot(A, Y)))
 
+		self._version += 1
+
 		return True
 
 
 
+	@profiler.timed()
 	def train_lbfgs(self, Y, **kwargs):
 		"""
 		A stochastic variant of L-BFGS. If additive Gaussian noise is enabled, this method
@@ -536,57 +806,47 @@ class ISA(Distribution):
 		weight_decay = kwargs.get('weight_decay', 0.)
 		max_stored = kwargs.get('max_stored', 10)
 
-		# objective function and gradient
+		# objective function and its gradient
 		def f(W, X):
 			W = W.reshape(self.num_hiddens, self.num_hiddens)
-			v = mean(self.prior_energy(dot(W, X))) - slogdet(W)[1]
-
-			if weight_decay > 0.:
-				v += weight_decay / 2. * sum(square(inv(W)))
+			A = inv(W)
 
-			return v
+			energy, gradient = self.prior_energy_and_gradient(dot(W, X))
 
-		# objective function gradient
-		def df(W, X):
-			W = W.reshape(self.num_hiddens, self.num_hiddens)
-			A = inv(W)
-			g = dot(self.prior_energy_gradient(dot(W, X)), X.T) / X.shape[1] - A.T
+			v = mean(energy) - slogdet(W)[1]
+			g = dot(gradient, X.T) / X.shape[1] - A.T
 
 			if weight_decay > 0.:
+				v += weight_decay / 2. * sum(square(A))
 				g -= weight_decay * dot(A.T, dot(A, A.T))
 
-			return g.ravel()
+			return v, g.ravel()
 
 		# complete basis
 		A = vstack([self.A, self.nullspace_basis()])
 		W = inv(A)
 
-		# complete data
-		X = dot(A, Y)
+		# complete data, stored in Fortran order so that data points are contiguous
+		X = dot(Y.T, A.T).T
 
 		if pocket:
-			energy = f(W, X)
+			energy = f(W, X)[0]
 
-		for _ in range(max_iter):
-			if shuffle:
-				# randomize order of data
-				X = X[:, permutation(X.shape[1])]
+		batches = Minibatches(X, batch_size, shuffle)
 
+		for _ in range(max_iter):
 			# split data in batches and perform L-BFGS on batches
-			for i in range(0, X.shape[1], batch_size):
-				batch = X[:, i:i + batch_size]
-
-				if not batch.shape[1] < batch_size:
-					W, _, _ = fmin_l_bfgs_b(f, W.ravel(), df, (batch,),
-						maxfun=max_fun,
-						m=max_stored,
-						pgtol=1e-5,
-						disp=1 if Distribution.VERBOSITY > 2 else 0,
-						iprint=0)
+			for batch in batches:
+				W, _, _ = fmin_l_bfgs_b(f, W.ravel(), None, (batch,),
+					maxfun=max_fun,
+					m=max_stored,
+					pgtol=1e-5,
+					disp=1 if Distribution.VERBOSITY > 2 else 0,
+					iprint=0)
 
 		if pocket:
 			# test for improvement of lower bound
-			if f(W, X) > energy:
+			if f(W, X)[0] > energy:
 				# don't update parameters
 				return False
 
@@ -597,6 +857,7 @@ class ISA(Distribution):
 
 
 
+	@profiler.timed()
 	def train_sgd(self, Y, **kwargs):
 		"""
 		Optimize linear features to maximize the joint log-likelihood of visible
@@ -655,18 +916,10 @@ class ISA(Distribution):
 				energy = mean(sqrt(sum(square(dot(inv(B), X - dot(A, Y))), 0))) - slogdet(S)[1] \
 					+ weight_decay / 2. * sum(square(A))
 
-			for _ in range(max_iter):
-				if shuffle:
-					# randomize order of data
-					indices = permutation(X.shape[1])
-					X = X[:, indices]
-					Y = Y[:, indices]
-
-				for i in range(0, X.shape[1], batch_size):
-					# batches
-					X_ = X[:, i:i + batch_size]
-					Y_ = Y[:, i:i + batch_size]
+			batches = Minibatches((X, Y), batch_size, shuffle, incomplete=True)
 
+			for _ in range(max_iter):
+				for X_, Y_ in batches:
 					P = momentum * P + dot(S, dot(X_ - dot(A, Y_), Y_.T)) / batch_size
 
 					if weight_decay > 0.:
@@ -697,6 +950,8 @@ class ISA(Distribution):
 				self.A[:, :self.num_visibles] = B
 			self.A[:, self.num_visibles:] = A
 
+			self._version += 1
+
 		else:
 			# nullspace basis
 			B = self.nullspace_basis()
@@ -705,8 +960,8 @@ class ISA(Distribution):
 			A = vstack([self.A, B])
 			W = inv(A)
 
-			# completed data
-			X = dot(A, Y)
+			# completed data, stored in Fortran order so that data points are contiguous
+			X = dot(Y.T, A.T).T
 
 			# initial direction of momentum
 			P = 0.
@@ -715,33 +970,28 @@ class ISA(Distribution):
 				energy = mean(self.prior_energy(Y)) - slogdet(W)[1] \
 					+ weight_decay / 2. * sum(square(A))
 
-			for j in range(max_iter):
-				if shuffle:
-					# randomize order of data
-					X = X[:, permutation(X.shape[1])]
-
-				for i in range(0, X.shape[1], batch_size):
-					batch = X[:, i:i + batch_size]
+			batches = Minibatches(X, batch_size, shuffle)
 
-					if not batch.shape[1] < batch_size:
-						if natural_gradient:
-							# calculate gradient
-							P = momentum * P + W - \
-								dot(dot(self.prior_energy_gradient(dot(W, batch)), batch.T) / batch_size, dot(W.T, W))
-
-							# update parameters
-							W += step_width * P
-						else:
-							# calculate gradient
-							P = momentum * P + A.T - \
-								dot(self.prior_energy_gradient(dot(W, batch)), batch.T) / batch_size
+			for j in range(max_iter):
+				for batch in batches:
+					if natural_gradient:
+						# calculate gradient
+						P = momentum * P + W - \
+							dot(dot(self.prior_energy_gradient(dot(W, batch)), batch.T) / batch_size, dot(W.T, W))
+
+						# update parameters
+						W += step_width * P
+					else:
+						# calculate gradient
+						P = momentum * P + A.T - \
+							dot(self.prior_energy_gradient(dot(W, batch)), batch.T) / batch_size
 
-							if weight_decay > 0.:
-								P -= weight_decay * dot(A.T, dot(A, A.T))
+						if weight_decay > 0.:
+							P -= weight_decay * dot(A.T, dot(A, A.T))
 
-							# update parameters
-							W += step_width * P
-							A = inv(W)
+						# update parameters
+						W += step_width * P
+						A = inv(W)
 
 			if natural_gradient:
 				A = inv(W)
@@ -819,8 +1069,10 @@ class ISA(Distribution):
 				return grad.ravel()
 
 			# initial hidden states
-			Y = asshmarray(dot(A.T, X) / sum(square(A), 0).reshape(-1, 1))
+			Y = asshared(dot(A.T, X) / sum(square(A), 0).reshape(-1, 1))
 
+			# most of the time is spent in BLAS, which releases the GIL
+			@mapp.releases_gil
 			def parfor(i):
 				Y[:, i] = fmin_cg(f, Y[:, i], df, (i,), disp=False, maxiter=100, gtol=tol)
 			mapp(parfor, range(X.shape[1]))
@@ -832,33 +1084,29 @@ class ISA(Distribution):
 		if callback is not None:
 			callback(self, 0)
 
-		for i in range(max_iter):
-			if shuffle:
-				# randomize order of data
-				X = X[:, permutation(X.shape[1])]
-
-			for b in range(0, X.shape[1], batch_size):
-				batch = X[:, b:b + batch_size]
+		batches = Minibatches(X, batch_size, shuffle)
 
-				if not batch.shape[1] < batch_size:
-					Y = compute_map(batch)
+		for i in range(max_iter):
+			for b, batch in enumerate(batches):
+				Y = compute_map(batch)
 
-					# calculate gradient and update basis
-					P = momentum * P + dot(batch - dot(A, Y), Y.T) / batch_size
-					A += step_width * P
+				# calculate gradient and update basis
+				P = momentum * P + dot(batch - dot(A, Y), Y.T) / batch_size
+				A += step_width * P
 
-					# normalize basis
-					Y_var = (1. - var_eta) * Y_var + var_eta * mean(square(Y), 1)
-					gain *= power(Y_var / var_goal, alpha).reshape(1, -1)
-					A = A / sqrt(sum(square(A), 0)) * gain
+				# normalize basis
+				Y_var = (1. - var_eta) * Y_var + var_eta * mean(square(Y), 1)
+				gain *= power(Y_var / var_goal, alpha).reshape(1, -1)
+				A = A / sqrt(sum(square(A), 0)) * gain
 
-					if self.VERBOSITY > 0:
-						print 'epoch {0}, batch {1}'.format(i, b / batch_size)
-						print '{0:.4f} {1:.4f} {2:.4f}'.format(
-							float(min(Y_var)), float(mean(Y_var)), float(max(Y_var)))
+				if self.VERBOSITY > 0:
+					print 'epoch {0}, batch {1}'.format(i, b)
+					print '{0:.4f} {1:.4f} {2:.4f}'.format(
+						float(min(Y_var)), float(mean(Y_var)), float(max(Y_var)))
 
 			if self.noise:
 				self.A[:, self.num_visibles:] = A
+				self._version += 1
 			else:
 				self.A = A
 
@@ -893,10 +1141,11 @@ class ISA(Distribution):
 		@return: array with `num_hiddens` rows and `num_samples` columns
 		"""
 
-		return vstack(m.sample(num_samples) for m in self.subspaces)
+		return asarray(self._prior().sample(num_samples), dtype=self.DTYPE)
 
 
 
+	@profiler.timed()
 	def sample_scales(self, Y):
 		"""
 		Samples scales for given states of the hidden units.
@@ -908,18 +1157,14 @@ class ISA(Distribution):
 		@return: array with `num_scales` rows and as many columns as `Y`
 		"""
 
-		scales = []
-
-		for model in self.subspaces:
-			# repeat sampled scales for all subspace dimensions
-			scales.extend(
-				tile(model.sample_posterior(Y[:model.dim]), [model.dim, 1]))
-			Y = Y[model.dim:]
+		bank = self._prior()
 
-		return vstack(scales)
+		# repeat sampled scales for all subspace dimensions
+		return bank.sample_posterior(Y)[bank.indices]
 
 
 
+	@profiler.timed()
 	def sample_posterior(self, X, method=('gibbs', {})):
 		"""
 		Draw samples from the posterior distribution over hidden units.
@@ -941,7 +1186,7 @@ class ISA(Distribution):
 			method = (method[0], {})
 
 		if self.num_hiddens == self.num_visibles:
-			return dot(inv(self.A), X) # faster than `solve` for large `X`
+			return dot(self._pinv(), X) # faster than `solve` for large `X`
 
 		if method[0].lower() == 'gibbs':
 			return self.sample_posterior_gibbs(X, **method[1])
@@ -981,27 +1226,36 @@ class ISA(Distribution):
 
 
 
-	def sample_posterior_gibbs(self, X, num_steps=10, Y=None, Z=None):
+	def sample_posterior_gibbs(self, X, num_steps=10, Y=None, Z=None, max_bytes=None):
 		"""
 		B{References:}
 			- Doucet, A. (2010). I{A Note on Efficient Conditional Simulation of
 			Gaussian Distributions.}
+
+		@type  max_bytes: integer
+		@param max_bytes: if given, process data points in chunks to stay within this memory budget
 		"""
 
+		if max_bytes is not None:
+			return self._sample_chunked(self.sample_posterior_gibbs, X, max_bytes,
+				num_steps=num_steps, Y=Y, Z=Z)
+
+		X = asarray(X, dtype=self.DTYPE)
+
 		# filter matrix and filter responses
-		W = pinv(self.A)
+		W = self._pinv(X.dtype)
 		WX = dot(W, X)
 
 		# nullspace projection matrix
-		Q = eye(self.num_hiddens) - dot(W, self.A)
+		Q = self._nullspace_projection(X.dtype)
 
 		# initial hidden state
 		if Z is None:
-			Y = WX + dot(Q, Y) if Y is not None else \
+			Y = WX + dot(Q, asarray(Y, dtype=X.dtype)) if Y is not None else \
 				WX + dot(Q, self.sample_prior(X.shape[1]))
 		else:
-			V = pinv(self.nullspace_basis())
-			Y = WX + dot(V, Z)
+			# the nullspace basis is orthonormal, so its transpose is its pseudoinverse
+			Y = WX + dot(self.nullspace_basis(X.dtype).T, asarray(Z, dtype=X.dtype))
 
 		# Gibbs sample between S and Y given X
 		for step in range(num_steps):
@@ -1018,61 +1272,284 @@ class ISA(Distribution):
 
 
 
-	def sample_posterior_ais(self, X, num_steps=10, annealing_weights=[]):
+	@profiler.timed()
+	def sample_posterior_ais(self, X, num_steps=10, annealing_weights=[], max_bytes=None, ess=0.9,
+		proposal='gaussian'):
 		"""
 		Sample posterior distribution over hidden states using annealed importance
 		sampling with Gibbs sampling transition operator.
+
+		By default, sampling starts from a white Gaussian distribution over the nullspace.
+		If C{proposal} is set to C{'laplace'}, sampling starts from Gaussian approximations
+		of the posteriors centered at their modes (see L{_sample_posterior_ais_laplace}),
+		so that far fewer annealing steps are needed.
+
+		If C{annealing_weights} is set to C{'adaptive'}, each annealing weight is chosen
+		such that the conditional effective sample size of the incremental importance
+		weights does not drop below the fraction C{ess} of the number of chains. The
+		chosen weights are stored in C{annealing_weights}, so that they can be reused
+		(see L{tune_annealing_weights}). If data points are processed in chunks, the
+		weights are chosen once using the first chunk and then used for all chunks.
+
+		@type  num_steps: integer
+		@param num_steps: number of annealing steps if no annealing weights are given
+
+		@type  annealing_weights: array_like/string
+		@param annealing_weights: increasing weights ending in 1, or C{'adaptive'}
+
+		@type  max_bytes: integer
+		@param max_bytes: if given, process data points in chunks to stay within this memory budget
+
+		@type  ess: float
+		@param ess: targeted relative conditional effective sample size of adaptive annealing
+
+		@type  proposal: string
+		@param proposal: initial distribution, either C{'gaussian'} or C{'laplace'}
 		"""
 
-		if not annealing_weights:
+		adaptive = isinstance(annealing_weights, str) and annealing_weights == 'adaptive'
+
+		if adaptive and proposal == 'laplace':
+			raise ValueError('Adaptive annealing requires a Gaussian proposal.')
+
+		if max_bytes is not None:
+			if adaptive:
+				# all chunks have to use the same schedule
+				num_pilot = max([1, int(max_bytes / self._bytes_per_column())])
+				annealing_weights = self.tune_annealing_weights(X[:, :num_pilot], ess)
+
+			return self._sample_chunked(self.sample_posterior_ais, X, max_bytes,
+				num_steps=num_steps, annealing_weights=annealing_weights, ess=ess,
+				proposal=proposal)
+
+		if not adaptive and len(annealing_weights) == 0:
 			annealing_weights = linspace(0, 1, num_steps + 1)[1:]
 
-		# initialize proposal distribution to be Gaussian
-		model = deepcopy(self)
-		for gsm in model.subspaces:
-			gsm.scales[:] = 1.
+		if proposal == 'laplace':
+			return self._sample_posterior_ais_laplace(X, annealing_weights)
+
+		elif proposal != 'gaussian':
+			raise ValueError('Unknown proposal \'{0}\'.'.format(proposal))
+
+		X = asarray(X, dtype=self.DTYPE)
+
+		# GSMs interpolating between a Gaussian proposal distribution and the prior
+		bank = self._prior()
+		annealed = GSMBank(self.subspaces)
 
 		# filter matrix and filter responses
-		W = pinv(self.A)
+		W = self._pinv(X.dtype)
 		WX = dot(W, X)
 
 		# nullspace basis and projection matrix
-		B = self.nullspace_basis()
-		Q = dot(B.T, B)
+		B = self.nullspace_basis(X.dtype)
+		Q = self._nullspace_projection(X.dtype)
 
 		# initialize proposal samples (Z is initially Gaussian and independent of X)
-		Z = dot(B, randn(self.num_hiddens, X.shape[1]))
-		Y = WX + dot(pinv(B), Z)
+		Z = dot(B, randn(self.num_hiddens, X.shape[1], dtype=X.dtype))
+		Y = WX + dot(B.T, Z)
 
-		# initialize importance weights (log-determinant of dot(B.T, B) not needed here)
-		log_is_weights = sum(multiply(Z, dot(inv(dot(B, B.T)), Z)), 0) / 2. \
+		# initialize importance weights (B is orthonormal, so Z is white)
+		log_is_weights = sum(square(Z), 0, dtype=float64) / 2. \
 			+ (self.num_hiddens - self.num_visibles) / 2. * log(2. * pi)
 		log_is_weights.resize(1, X.shape[1])
 
+		if adaptive:
+			# annealing weights are chosen based on the current state of the chains
+			def adaptive_weights():
+				beta = 0.
+				while beta < 1.:
+					beta = self._next_annealing_weight(Y, bank, beta, ess)
+					yield beta
+			annealing_weights = adaptive_weights()
+
+		schedule = []
+
 		for step, beta in enumerate(annealing_weights):
-			# tune proposal distribution
-			for i in range(len(self.subspaces)):
-				# adjust standard deviations
-				model.subspaces[i].scales = (1. - beta) + beta * self.subspaces[i].scales
+			schedule.append(beta)
 
-			log_is_weights -= model.prior_energy(Y)
+			with profiler.phase('ISA.sample_posterior_ais.step'):
+				# tune proposal distribution by adjusting standard deviations
+				annealed.scales = (1. - beta) + beta * bank.scales
 
-			# apply Gibbs sampling transition operator
-			S = model.sample_scales(Y)
-			Y = model._sample_posterior_cond(Y, X, S, W, WX, Q)
+				# apply Gibbs sampling transition operator
+				S, energy = annealed.sample_posterior(Y, return_energy=True)
+				S = S[annealed.indices]
 
-			log_is_weights += model.prior_energy(Y)
+				log_is_weights -= energy
+				Y = self._sample_posterior_cond(Y, X, S, W, WX, Q)
+
+				log_is_weights += annealed.energy(Y)
 
 			if Distribution.VERBOSITY > 1:
-				print '{0:6}\t{1:10.2f}'.format(step + 1, mean(self.prior_energy(Y)))
+				print '{0:6}\t{1:10.2f}'.format(step + 1, mean(bank.energy(Y)))
+
+		log_is_weights += bank.loglikelihood(Y) + self._logdet_pinv()
+
+		if adaptive:
+			self.annealing_weights = asarray(schedule)
+
+		return Y, log_is_weights
 
-		log_is_weights += self.prior_loglikelihood(Y) + slogdet(dot(W.T, W))[1] / 2.
+
+
+	def _sample_posterior_ais_laplace(self, X, annealing_weights):
+		"""
+		Annealed importance sampling starting from Laplace approximations of the posteriors
+		over nullspace coordinates. The intermediate distributions are proportional to
+		C{q(z)^(1 - beta)} times a tempered prior, where C{q} is the Laplace approximation.
+		The tempered prior is a GSM whose scales are divided by C{sqrt(beta)}, which is
+		proportional to the prior raised to the power C{beta} if it has only one scale.
+		Conditioned on the scales, the intermediate distributions are Gaussian, so that
+		Gibbs sampling can still be used.
+
+		@type  annealing_weights: array_like
+		@param annealing_weights: increasing positive weights ending in 1
+
+		@rtype: tuple
+		@return: hidden states and log-importance weights
+		"""
+
+		if any(asarray(annealing_weights) <= 0.):
+			raise ValueError('Annealing weights of the Laplace proposal have to be positive.')
+
+		bank = self._prior()
+		annealed = GSMBank(self.subspaces)
+
+		# filter matrix and filter responses
+		W = self._pinv()
+		WX = dot(W, X)
+
+		# nullspace basis and outer products of its columns
+		B = self.nullspace_basis()
+		BB = self._nullspace_outer_products()
+
+		# modes and eigendecompositions of the precision matrices of the Laplace approximations
+		Z_map, eigvals, eigvecs = self._laplace(WX)
+
+		H = einsum('nij,jn,nkj->nik', eigvecs, eigvals, eigvecs)
+		HZ = einsum('nij,jn->in', H, Z_map)
+
+		def rotate(Z):
+			return einsum('nji,jn->in', eigvecs, Z)
+
+		def unrotate(U):
+			return einsum('nij,jn->in', eigvecs, U)
+
+		# log-density of the Laplace approximation
+		def log_q(Z):
+			return sum(log(eigvals) - eigvals * square(rotate(Z - Z_map)), 0) / 2. \
+				- B.shape[0] / 2. * log(2. * pi)
+
+		# initialize proposal samples
+		Z = Z_map + unrotate(randn(*Z_map.shape) / sqrt(eigvals))
+		Y = WX + dot(B.T, Z)
+
+		# initialize importance weights
+		log_is_weights = -log_q(Z)
+		log_is_weights.resize(1, X.shape[1])
+
+		for step, beta in enumerate(annealing_weights):
+			with profiler.phase('ISA.sample_posterior_ais.step'):
+				# temper prior by increasing standard deviations
+				annealed.scales = bank.scales / sqrt(beta)
+
+				S, energy = annealed.sample_posterior(Y, return_energy=True)
+				S = S[annealed.indices]
+
+				log_is_weights += (1. - beta) * log_q(Z) - energy
+
+				# precision matrices and linear terms of Gaussian conditionals
+				v = 1. / square(S)
+				P = (1. - beta) * H + dot(v.T, BB).reshape(H.shape)
+				b = (1. - beta) * HZ - dot(B, v * WX)
+
+				# noise whose covariance is the precision matrix
+				b += sqrt(1. - beta) * unrotate(sqrt(eigvals) * randn(*Z.shape)) \
+					+ dot(B, randn(*S.shape) / S)
+
+				Z = cholesky_solve(P, b.T).T
+				Y = WX + dot(B.T, Z)
+
+				log_is_weights -= (1. - beta) * log_q(Z) - annealed.energy(Y)
+
+			if Distribution.VERBOSITY > 1:
+				print '{0:6}\t{1:10.2f}'.format(step + 1, mean(bank.energy(Y)))
+
+		log_is_weights += bank.loglikelihood(Y) + self._logdet_pinv()
 
 		return Y, log_is_weights
 
 
 
-	def sample_posterior_tempered(self, X, num_steps=1, annealing_weights=[], Y=None):
+	def tune_annealing_weights(self, X, ess=0.9):
+		"""
+		Chooses an annealing schedule for AIS using a pilot run of adaptive annealing. The
+		schedule is stored with the model and can be reused for unbiased estimates, e.g.:
+
+			>>> model.tune_annealing_weights(X[:, :100])
+			>>> model.loglikelihood(X, sampling_method=('ais',
+			>>> 	{'annealing_weights': model.annealing_weights}))
+
+		@type  X: array_like
+		@param X: visible states used for the pilot run
+
+		@type  ess: float
+		@param ess: targeted relative conditional effective sample size
+
+		@rtype: ndarray
+		@return: the chosen annealing weights
+		"""
+
+		self.sample_posterior_ais(X, annealing_weights='adaptive', ess=ess)
+
+		return self.annealing_weights
+
+
+
+	def _next_annealing_weight(self, Y, bank, beta, ess, max_chains=500, num_iter=12):
+		"""
+		Finds the largest annealing weight following C{beta} whose incremental importance
+		weights keep a relative conditional effective sample size of at least C{ess}, where
+		the effective sample size is estimated from a subset of the chains.
+
+		@rtype: float
+		@return: the next annealing weight
+		"""
+
+		# a subset of chains suffices to estimate the effective sample size
+		Y = Y[:, ::int(ceil(Y.shape[1] / float(max_chains)))]
+
+		annealed = GSMBank(self.subspaces)
+		annealed.scales = (1. - beta) + beta * bank.scales
+		energy = annealed.energy(Y)
+
+		def ess_(beta_):
+			annealed.scales = (1. - beta_) + beta_ * bank.scales
+
+			# incremental log-importance weights
+			log_weights = energy - annealed.energy(Y)
+
+			return float(exp(2. * logmeanexp(log_weights, 1) - logmeanexp(2. * log_weights, 1)))
+
+		if ess_(1.) >= ess:
+			return 1.
+
+		# bisection
+		lower, upper = beta, 1.
+		for _ in range(num_iter):
+			middle = (lower + upper) / 2.
+			if ess_(middle) >= ess:
+				lower = middle
+			else:
+				upper = middle
+
+		# make sure that some progress is made
+		return lower if lower > beta else upper
+
+
+
+	def sample_posterior_tempered(self, X, num_steps=1, annealing_weights=[], Y=None, max_bytes=None):
 		"""
 		Sample posterior distribution over hidden states using tempered transitions with
 		Gibbs sampling transtition operator. This method might give better results if the
@@ -1081,69 +1558,76 @@ class ISA(Distribution):
 		B{References:}
 			- Neal, R. (1994). Sampling from Multimodal Distributions Using Tempered
 			Transitions.
+
+		@type  max_bytes: integer
+		@param max_bytes: if given, process data points in chunks to stay within this memory budget
 		"""
 
+		if max_bytes is not None:
+			return self._sample_chunked(self.sample_posterior_tempered, X, max_bytes,
+				num_steps=num_steps, annealing_weights=annealing_weights, Y=Y)
+
 		if annealing_weights in ([], None):
 			annealing_weights = linspace(0, 1, num_steps + 1)[1:]
 
-		# initialize distribution
-		model = deepcopy(self)
+		X = asarray(X, dtype=self.DTYPE)
+
+		# GSMs interpolating between a Gaussian and the prior
+		bank = self._prior()
+		annealed = GSMBank(self.subspaces)
 
 		# filter matrix and filter responses
-		W = pinv(self.A)
+		W = self._pinv(X.dtype)
 		WX = dot(W, X)
 
-		# nullspace basis and projection matrix
-		B = self.nullspace_basis()
-		Q = dot(B.T, B)
+		# nullspace projection matrix
+		Q = self._nullspace_projection(X.dtype)
 
 		# initial hidden state
-		Y = WX + dot(Q, Y) if Y is not None else \
+		Y = WX + dot(Q, asarray(Y, dtype=X.dtype)) if Y is not None else \
 			WX + dot(Q, self.sample_prior(X.shape[1]))
 
 		for _ in range(num_steps):
 			Y_old = copy(Y)
 
 			# initialize importance weights
-			log_is_weights = self.prior_energy(Y)
+			log_is_weights = bank.energy(Y)
 
 			# increase temperature
 			for step, beta in enumerate(annealing_weights[::-1]):
-				# tune proposal distribution
-				for i in range(len(self.subspaces)):
-					# adjust standard deviations
-					model.subspaces[i].scales = (1. - beta) + beta * self.subspaces[i].scales
-
-				log_is_weights -= model.prior_energy(Y)
+				# tune proposal distribution by adjusting standard deviations
+				annealed.scales = (1. - beta) + beta * bank.scales
 
 				# apply transition operator
-				S = model.sample_scales(Y)
-				Y = model._sample_posterior_cond(Y, X, S, W, WX, Q)
+				S, energy = annealed.sample_posterior(Y, return_energy=True)
+				S = S[annealed.indices]
 
-				log_is_weights += model.prior_energy(Y)
+				log_is_weights -= energy
+				Y = self._sample_posterior_cond(Y, X, S, W, WX, Q)
+
+				log_is_weights += annealed.energy(Y)
 
 				if Distribution.VERBOSITY > 1:
-					print '{0:6}\t{1:10.2f}'.format(step + 1, mean(self.prior_energy(Y)))
+					print '{0:6}\t{1:10.2f}'.format(step + 1, mean(bank.energy(Y)))
 
 			# decrease temperature
 			for step, beta in enumerate(annealing_weights):
-				# tune proposal distribution
-				for i in range(len(self.subspaces)):
-					# adjust standard deviations
-					model.subspaces[i].scales = (1. - beta) + beta * self.subspaces[i].scales
-
-				log_is_weights -= model.prior_energy(Y)
+				# tune proposal distribution by adjusting standard deviations
+				annealed.scales = (1. - beta) + beta * bank.scales
 
 				# apply transition operator
-				S = model.sample_scales(Y)
-				Y = model._sample_posterior_cond(Y, X, S, W, WX, Q)
+				S, energy = annealed.sample_posterior(Y, return_energy=True)
+				S = S[annealed.indices]
+
+				log_is_weights -= energy
+				Y = self._sample_posterior_cond(Y, X, S, W, WX, Q)
 
-				log_is_weights += model.prior_energy(Y)
+				log_is_weights += annealed.energy(Y)
 
 				if Distribution.VERBOSITY > 1:
-					print '{0:6}\t{1:10.2f}'.format(len(annealing_weights) - step, mean(self.prior_energy(Y)))
+					print '{0:6}\t{1:10.2f}'.format(len(annealing_weights) - step, mean(bank.energy(Y)))
 
-			log_is_weights -= self.prior_energy(Y)
+			log_is_weights -= bank.energy(Y)
 
 			# Metropolis accept/reject step
 			reject = (rand(1, X.shape[1]) > exp(log_is_weights)).ravel()
@@ -1156,6 +1640,7 @@ class ISA(Distribution):
 
 
 
+	@profiler.timed()
 	def _sample_posterior_cond(self, Y, X, S, W, WX, Q):
 		"""
 		Samples posterior conditioned on scales.
@@ -1165,25 +1650,131 @@ class ISA(Distribution):
 			Gaussian Distributions.}
 		"""
 
+		# computations are carried out in the precision of the data
+		A = self._features(X.dtype)
+		S = asarray(S, dtype=X.dtype)
+
 		# sample hidden states conditioned on scales
-		Y_ = multiply(randn(self.num_hiddens, X.shape[1]), S)
+		Y_ = multiply(randn(self.num_hiddens, X.shape[1], dtype=X.dtype), S)
+
+		X_ = X - dot(A, Y_)
+
+		# lower triangular entries of covariance matrices
+		I, J = tril_indices(self.num_visibles)
+		tril = I * self.num_visibles + J
+
+		# covariances of visible states, A diag(s^2) A^T, for all data points (the Cholesky
+		# factorization only looks at the lower triangular parts)
+		v = square(S)
+		C = zeros([X.shape[1], self.num_visibles**2], dtype=X.dtype)
 
-		X_ = X - dot(self.A, Y_)
+		# outer products of features are computed in blocks no larger than C
+		block_size = max([1, X.shape[1] * len(tril) / self.num_hiddens])
 
-		# variances and incomplete covariance matrices
-		v = square(S).reshape(-1, 1, X.shape[1])
-		C = multiply(v, self.A.T.reshape(self.num_hiddens, -1, 1)).transpose([2, 0, 1]) # TODO: FIX MEMORY ISSUES
+		if block_size < len(tril):
+			for k in range(0, len(tril), block_size):
+				AA = multiply(A[I[k:k + block_size]], A[J[k:k + block_size]]).T
+				C[:, tril[k:k + block_size]] = dot(v.T, AA)
+		else:
+			AA = self._cached('outer_products', lambda: multiply(self.A[I], self.A[J]).T, X.dtype)
+			C[:, tril] = dot(v.T, AA)
+
+		C = C.reshape(-1, self.num_visibles, self.num_visibles)
 
 		# update hidden states
-		Y = asshmarray(Y)
-		def parfor(i):
-			Y[:, i] = dot(C[i], solve(dot(self.A, C[i]), X_[:, i], sym_pos=True))
-		mapp(parfor, range(X.shape[1]))
+		Y = multiply(v, dot(A.T, cholesky_solve(C, X_.T).T))
 
 		return WX + dot(Q, Y + Y_)
 
 
 
+	def _sample_chunked(self, sampler, X, max_bytes, columns=None, return_weights_only=False,
+		**kwargs):
+		"""
+		Applies a sampler to chunks of data points. The size of the chunks is chosen such
+		that all chunks processed in parallel together use roughly C{max_bytes} of memory.
+		Initial hidden states passed via C{Y} or C{Z} are split along with the data. The
+		estimated peak memory is stored in C{peak_bytes}.
+
+		@type  sampler: function
+		@param sampler: a sampling method taking data points as its first argument
+
+		@type  max_bytes: integer
+		@param max_bytes: memory budget in bytes
+
+		@type  columns: array_like
+		@param columns: indices of the data points to process, possibly repeated (default: all)
+
+		@type  return_weights_only: bool
+		@param return_weights_only: only keep the importance weights returned by the sampler
+
+		@rtype: ndarray/tuple
+		@return: whatever the sampler returns, with results of all chunks concatenated
+		"""
+
+		# nested calls (e.g., inside L{loglikelihood}) process chunks sequentially
+		num_jobs = max([1, mapp.max_processes]) \
+			if current_process().name == 'MainProcess' else 1
+
+		num_columns = X.shape[1] if columns is None else len(columns)
+
+		# number of data points processed by each job at a time
+		chunk_size = max([1, int(max_bytes / num_jobs / self._bytes_per_column())])
+		chunks = [slice(i, i + chunk_size) for i in range(0, num_columns, chunk_size)]
+
+		self.peak_bytes = min([num_jobs, len(chunks)]) \
+			* min([chunk_size, num_columns]) * self._bytes_per_column()
+
+		if len(chunks) < 2:
+			return _sample_chunk(self, sampler.__name__, X,
+				slice(None) if columns is None else columns, kwargs, return_weights_only)
+
+		if num_jobs > 1 and mapp.backend == 'processes':
+			# worker processes access data and initial states without copying them
+			X = asshared(X)
+			for key in ['Y', 'Z']:
+				if kwargs.get(key, None) is not None:
+					kwargs[key] = asshared(kwargs[key])
+
+		# split initial states along with data points
+		chunk_kwargs = []
+		for chunk in chunks:
+			chunk_kwargs.append(dict(kwargs))
+			for key in ['Y', 'Z']:
+				if kwargs.get(key, None) is not None:
+					chunk_kwargs[-1][key] = kwargs[key][:, chunk]
+
+		if columns is not None:
+			# data points are selected by the workers, so that repeated columns aren't copied
+			chunks = [asarray(columns[chunk]) for chunk in chunks]
+
+		# the sampler is passed by name so that chunks can be sent to worker processes
+		args = ([self] * len(chunks), [sampler.__name__] * len(chunks), [X] * len(chunks),
+			chunks, chunk_kwargs, [return_weights_only] * len(chunks))
+
+		results = mapp(_sample_chunk, *args, max_processes=num_jobs)
+
+		if isinstance(results[0], tuple):
+			return tuple(hstack(result) for result in zip(*results))
+		return hstack(results)
+
+
+
+	def _bytes_per_column(self):
+		"""
+		Estimates the memory used by the Gibbs sampler for each data point. The largest
+		contribution comes from the covariance matrices and their Cholesky factors.
+
+		@rtype: integer
+		@return: number of bytes
+		"""
+
+		return result_type(self.DTYPE).itemsize \
+			* (3 * self.num_visibles**2 + 6 * self.num_visibles + 12 * self.num_hiddens)
+
+
+
+	@profiler.timed()
 	def sample_posterior_hmc(self, X, num_steps=100, Y=None, **kwargs):
 		"""
 		Samples posterior over hidden representations using Hamiltonian Monte
@@ -1198,110 +1789,195 @@ class ISA(Distribution):
 		@type  lf_randomness: float
 		@param lf_randomness: relative jitter added to step size (default: 0.)
 
+		@type  num_adapt: integer
+		@param num_adapt: number of burn-in steps used to tune the step size (default: 0)
+
+		@type  target_acceptance: float
+		@param target_acceptance: acceptance rate targeted by the tuning (default: 0.65)
+
+		@type  per_column: boolean
+		@param per_column: tune a separate step size for each data point (default: False)
+
+		If C{num_adapt} is positive, the step size is tuned with dual averaging during
+		C{num_adapt} additional steps, starting from C{lf_step_size}, and afterwards kept
+		fixed for the remaining C{num_steps} steps. The tuned step size is stored in
+		C{lf_step_size} and can be passed to later calls. Step sizes may be arrays
+		with one entry per data point.
+
 		B{References:}
 			- Duane, A. (1987). I{Hybrid Monte Carlo.}
 			- Neal, R. (2010). I{MCMC Using Hamiltonian Dynamics.}
+			- Hoffman, M. and Gelman, A. (2014). I{The No-U-Turn Sampler.}
 		"""
 
 		# hyperparameters
 		lf_num_steps = kwargs.get('lf_num_steps', 10)
 		lf_step_size = kwargs.get('lf_step_size', 0.01)
 		lf_randomness = kwargs.get('lf_randomness', 0.)
+		num_adapt = kwargs.get('num_adapt', 0)
+
+		# step size adaptation
+		tuning = _DualAveraging(lf_step_size, kwargs.get('target_acceptance', 0.65),
+			X.shape[1] if kwargs.get('per_column', False) else 1)
+
+		X = asarray(X, dtype=self.DTYPE)
+
+		# subspace GSMs
+		bank = self._prior()
 
 		# nullspace basis and projection matrix
-		B = self.nullspace_basis()
-		BB = dot(B.T, B)
+		B = self.nullspace_basis(X.dtype)
+		BB = self._nullspace_projection(X.dtype)
 
 		# filter responses
-		WX = dot(pinv(self.A), X)
+		WX = dot(self._pinv(X.dtype), X)
 
 		# initial hidden state
-		Y = WX + dot(BB, Y) if Y is not None else \
+		Y = WX + dot(BB, asarray(Y, dtype=X.dtype)) if Y is not None else \
 			WX + dot(BB, self.sample_prior(X.shape[1]))
 
-		for step in range(num_steps):
-			lf_step_size_rnd = (1. + lf_randomness * (2. * rand() - 1.)) * lf_step_size
+		# energy and gradient of the current state are reused by the next step
+		E, G = bank.energy_and_gradient(Y)
+
+		# average acceptance rate after burn-in
+		accepted = 0.
+
+		for step in range(num_adapt + num_steps):
+			if step < num_adapt:
+				lf_step_size = tuning.step_size
+			elif step == num_adapt and num_adapt > 0:
+				lf_step_size = self.lf_step_size = tuning.averaged_step_size()
+
+			lf_step_size_rnd = asarray((1. + lf_randomness * (2. * rand() - 1.)) * lf_step_size, X.dtype)
 
 			# sample momentum
-			P = randn(B.shape[0], X.shape[1])
+			P = randn(B.shape[0], X.shape[1], dtype=X.dtype)
 
 			# store Hamiltonian
-			Yold = copy(Y)
-			Hold = self.prior_energy(Y) + sum(square(P), 0) / 2.
+			Yold, Eold, Gold = copy(Y), E, G
+			Hold = E + sum(square(P), 0) / 2.
 
 			# first half-step
-			P -= lf_step_size_rnd / 2. * dot(B, self.prior_energy_gradient(Y))
+			P -= lf_step_size_rnd / 2. * dot(B, G)
 			Y += lf_step_size_rnd * dot(B.T, P)
 
 			# full leapfrog steps
 			for _ in range(lf_num_steps - 1):
-				P -= lf_step_size_rnd * dot(B, self.prior_energy_gradient(Y))
+				P -= lf_step_size_rnd * dot(B, bank.energy_gradient(Y))
 				Y += lf_step_size_rnd * dot(B.T, P)
 
-			# final half-step
-			P -= lf_step_size_rnd / 2. * dot(B, self.prior_energy_gradient(Y))
-
 			# make sure hidden and visible states stay consistent
 			Y = WX + dot(BB, Y)
 
+			# final half-step
+			E, G = bank.energy_and_gradient(Y)
+			P -= lf_step_size_rnd / 2. * dot(B, G)
+
 			# new Hamiltonian
-			Hnew = self.prior_energy(Y) + sum(square(P), 0) / 2.
+			Hnew = E + sum(square(P), 0) / 2.
 
 			# Metropolis accept/reject step
 			reject = (rand(1, X.shape[1]) > exp(Hold - Hnew)).ravel()
 			Y[:, reject] = Yold[:, reject]
+			E[:, reject] = Eold[:, reject]
+			G[:, reject] = Gold[:, reject]
+
+			if step < num_adapt:
+				tuning.update(Hold - Hnew)
+			else:
+				accepted += mean(~reject) / num_steps
 
 			if Distribution.VERBOSITY > 1:
 				print '{0:6}\t{1:10.2f}\t{2:10.2f}'.format(step + 1,
-					mean(self.prior_energy(Y)),
+					mean(E),
 					mean(-reject))
 
+		self.acceptance_rate = accepted
+
 		return Y
 
 
 
+	@profiler.timed()
 	def sample_posterior_mala(self, X, num_steps=100, Y=None, **kwargs):
 		"""
-		This is a special case of HMC sampling.
+		This is a special case of HMC sampling. Like HMC, it can tune its step width
+		during C{num_adapt} additional burn-in steps, in which case the tuned step width
+		is stored in C{mala_step_width} (see L{sample_posterior_hmc}). The default target
+		acceptance rate is 0.574.
 		"""
 
 		step_width = kwargs.get('step_width', 0.01)
+		num_adapt = kwargs.get('num_adapt', 0)
 
-		# nullspace basis and projection matrix
-		B = self.nullspace_basis()
-		BB = dot(B.T, B)
+		# step width adaptation
+		tuning = _DualAveraging(step_width, kwargs.get('target_acceptance', 0.574),
+			X.shape[1] if kwargs.get('per_column', False) else 1)
 
-		# filter responses
-		WX = dot(pinv(self.A), X)
+		X = asarray(X, dtype=self.DTYPE)
+
+		# subspace GSMs
+		bank = self._prior()
+
+		# nullspace basis and projection matrix
+		B = self.nullspace_basis(X.dtype)
+		BB = self._nullspace_projection(X.dtype)
+
+		# filter responses
+		WX = dot(self._pinv(X.dtype), X)
 
 		# initial hidden state
-		Y = WX + dot(BB, Y) if Y is not None else \
+		Y = WX + dot(BB, asarray(Y, dtype=X.dtype)) if Y is not None else \
 			WX + dot(BB, self.sample_prior(X.shape[1]))
 
-		for step in range(num_steps):
-			P = randn(B.shape[0], X.shape[1])
+		# energy and gradient of the current state are reused by the next step
+		E, G = bank.energy_and_gradient(Y)
+
+		# average acceptance rate after burn-in
+		accepted = 0.
+
+		for step in range(num_adapt + num_steps):
+			if step < num_adapt:
+				step_width = tuning.step_size
+			elif step == num_adapt and num_adapt > 0:
+				step_width = self.mala_step_width = tuning.averaged_step_size()
+
+			step_width = asarray(step_width, X.dtype)
+
+			P = randn(B.shape[0], X.shape[1], dtype=X.dtype)
 
 			# store Hamiltonian
-			Yold = Y
-			Hold = self.prior_energy(Y) + sum(square(P), 0) / 2.
+			Yold, Eold, Gold = Y, E, G
+			Hold = E + sum(square(P), 0) / 2.
 
 			# generate proposal sample
-			P = P - step_width / 2. * dot(B, self.prior_energy_gradient(Y))
+			P = P - step_width / 2. * dot(B, G)
 			Y = WX + dot(BB, Y) + step_width * dot(B.T, P)
-			P = P - step_width / 2. * dot(B, self.prior_energy_gradient(Y))
+
+			E, G = bank.energy_and_gradient(Y)
+			P = P - step_width / 2. * dot(B, G)
 
 			# new Hamiltonian
-			Hnew = self.prior_energy(Y) + sum(square(P), 0) / 2.
+			Hnew = E + sum(square(P), 0) / 2.
 
 			# Metropolis accept/reject step
 			reject = (rand(1, X.shape[1]) > exp(Hold - Hnew)).ravel()
 			Y[:, reject] = Yold[:, reject]
+			E[:, reject] = Eold[:, reject]
+			G[:, reject] = Gold[:, reject]
+
+			if step < num_adapt:
+				tuning.update(Hold - Hnew)
+			else:
+				accepted += mean(~reject) / num_steps
 
 			if Distribution.VERBOSITY > 1:
 				print '{0:6}\t{1:10.2f}\t{2:10.2f}'.format(step + 1,
-					mean(self.prior_energy(Y)),
+					mean(E),
 					mean(-reject))
 
+		self.acceptance_rate = accepted
+
 		return Y
 
 
@@ -1314,6 +1990,9 @@ class ISA(Distribution):
 		# hyperparameters
 		standard_deviation = kwargs.get('standard_deviation', 0.01)
 
+		# subspace GSMs
+		bank = self._prior()
+
 		# nullspace basis
 		B = self.nullspace_basis()
 
@@ -1321,16 +2000,16 @@ class ISA(Distribution):
 		Z = dot(B, Y) if Y is not None else \
 			dot(B, self.sample_prior(X.shape[1]))
 
-		WX = dot(pinv(self.A), X)
+		WX = dot(self._pinv(), X)
 
 		for step in range(num_steps):
 			Zold = copy(Z)
-			Eold = self.prior_energy(WX + dot(B.T, Z))
+			Eold = bank.energy(WX + dot(B.T, Z))
 
 			Z += standard_deviation * randn(*Z.shape)
 
 			# new Hamiltonian
-			Enew = self.prior_energy(WX + dot(B.T, Z))
+			Enew = bank.energy(WX + dot(B.T, Z))
 
 			# Metropolis accept/reject step
 			reject = (log(rand(1, Z.shape[1])) > Eold - Enew).ravel()
@@ -1338,7 +2017,7 @@ class ISA(Distribution):
 
 			if Distribution.VERBOSITY > 1:
 				print '{0:6}{1:10.2f}{2:10.2f}'.format(step + 1,
-					mean(self.prior_energy(WX + dot(B.T, Z))), 1. - mean(reject))
+					mean(bank.energy(WX + dot(B.T, Z))), 1. - mean(reject))
 
 		return WX + dot(B.T, Z)
 
@@ -1346,45 +2025,147 @@ class ISA(Distribution):
 
 	def compute_map(self, X, tol=1E-3, maxiter=1000):
 		"""
-		Try to find the MAP of the posterior using conjugate gradient descent.
-		If the posterior is multimodal, a local optimum will be found.
+		Try to find the MAP of the posterior using L-BFGS. Since the posteriors of different
+		data points are independent, they are optimized jointly, so that energies and
+		gradients are computed for all data points at once. If the posterior is multimodal,
+		a local optimum will be found.
+
+		@type  X: array_like
+		@param X: visible states stored in columns
+
+		@type  tol: float
+		@param tol: stop once no component of the gradient is larger than this
+
+		@type  maxiter: integer
+		@param maxiter: maximum number of iterations
+
+		@rtype: ndarray
+		@return: hidden states
 		"""
 
-		W = pinv(self.A)
-		V = svd(W)[0][:, self.num_visibles:]
+		W = self._pinv()
+		B = self.nullspace_basis()
 
 		WX = dot(W, X)
 
-		def f(z, i):
-			return self.prior_energy(WX[:, [i]] + dot(V, z.reshape(-1, 1))).ravel()
+		return WX + dot(B.T, self._compute_map_nullspace(WX, tol, maxiter))
 
-		def df(z, i):
-			return dot(V.T, self.prior_energy_gradient(WX[:, [i]] + dot(V, z.reshape(-1, 1)))).ravel()
 
-		# initial nullspace state
-		Z = asshmarray(zeros([self.num_hiddens - self.num_visibles, X.shape[1]]))
 
-		def parfor(i):
-			Z[:, i] = fmin_cg(f, Z[:, i], df, (i,), disp=False, maxiter=maxiter, gtol=tol)
-		map(parfor, range(X.shape[1]))
+	def _compute_map_nullspace(self, WX, tol=1E-3, maxiter=1000):
+		"""
+		Finds the nullspace coordinates of the posterior modes.
+
+		@type  WX: array_like
+		@param WX: filter responses to visible states
+
+		@rtype: ndarray
+		@return: nullspace coordinates, one column per data point
+		"""
+
+		bank = self._prior()
+		B = self.nullspace_basis()
+
+		def f(z):
+			Y = WX + dot(B.T, z.reshape(-1, WX.shape[1]))
+			energy, gradient = bank.energy_and_gradient(Y)
+			return sum(energy), dot(B, gradient).ravel()
+
+		# the sum of energies grows with the number of data points, so only the
+		# gradient is used to check for convergence
+		z = fmin_l_bfgs_b(f, zeros(B.shape[0] * WX.shape[1]),
+			maxiter=maxiter, pgtol=tol, factr=10.)[0]
+
+		return z.reshape(-1, WX.shape[1])
+
+
+
+	def _nullspace_hessian(self, Y):
+		"""
+		Computes the Hessians of the prior energy with respect to the nullspace
+		coordinates of the given hidden states.
+
+		@type  Y: array_like
+		@param Y: hidden states stored in columns
+
+		@rtype: ndarray
+		@return: a stack of Hessians, one for each data point
+		"""
+
+		bank = self._prior()
+		B = self.nullspace_basis()
+
+		# the Hessian of the energy of a subspace is a I - b y y^T
+		a, b = bank.posterior_precisions(Y)
+
+		H = dot(a[bank.indices].T, self._nullspace_outer_products()).reshape(-1, B.shape[0], B.shape[0])
+
+		for k in range(len(bank)):
+			# projections of the subspace's hidden states onto the nullspace
+			U = dot(B[:, bank.offsets[k]:bank.offsets[k] + bank.dims[k]],
+				Y[bank.offsets[k]:bank.offsets[k] + bank.dims[k]])
+			H -= einsum('in,jn->nij', U * b[k], U)
+
+		return H
+
+
+
+	def _laplace(self, WX, tol=1E-5, maxiter=1000):
+		"""
+		Approximates the posterior over nullspace coordinates of each data point by a
+		Gaussian centered at the posterior's mode, whose precision matrix is given by
+		the Hessian of the prior energy. Eigenvalues which are not positive (which can
+		only happen if the optimization did not converge) are clipped. Repeated data points
+		(e.g., when running many chains per data point) are only processed once.
+
+		@type  WX: array_like
+		@param WX: filter responses to visible states
+
+		@rtype: tuple
+		@return: modes, eigenvalues and eigenvectors of the precision matrices
+		"""
+
+		# identify repeated columns by viewing each column as a single value
+		columns = ascontiguousarray(WX.T)
+		columns = columns.view(dtype((void, columns.dtype.itemsize * columns.shape[1]))).ravel()
+
+		_, index, inverse = unique(columns, return_index=True, return_inverse=True)
+
+		WX = WX[:, index]
+
+		Z = self._compute_map_nullspace(WX, tol, maxiter)
+
+		H = self._nullspace_hessian(WX + dot(self.nullspace_basis().T, Z))
+		H = (H + H.transpose([0, 2, 1])) / 2.
+
+		eigvals, eigvecs = eigh(H)
+
+		return Z[:, inverse], eigvals.T.clip(1E-6)[:, inverse], eigvecs[inverse]
+
 
-		return WX + dot(V, Z)
-			
-			
 
 	def prior_energy_gradient(self, Y):
 		"""
 		Gradient of log-likelihood with respect to hidden state.
 		"""
 
-		gradient = []
+		return self._prior().energy_gradient(Y)
+
 
-		for model in self.subspaces:
-			gradient.append(
-				model.energy_gradient(Y[:model.dim]))
-			Y = Y[model.dim:]
 
-		return vstack(gradient)
+	def prior_energy_and_gradient(self, Y):
+		"""
+		Computes energy and gradient of hidden states at once, which is cheaper than
+		calling L{prior_energy} and L{prior_energy_gradient}.
+
+		@type  Y: array_like
+		@param Y: a number of hidden states stored in columns
+
+		@rtype: tuple
+		@return: the energy of each data point and the gradient
+		"""
+
+		return self._prior().energy_and_gradient(Y)
 
 
 
@@ -1399,13 +2180,7 @@ class ISA(Distribution):
 		@return: the negative log-porbability of each data point
 		"""
 
-		energy = zeros([1, Y.shape[1]])
-
-		for model in self.subspaces:
-			energy += model.energy(Y[:model.dim])
-			Y = Y[model.dim:]
-
-		return energy
+		return self._prior().energy(Y)
 
 
 
@@ -1420,16 +2195,11 @@ class ISA(Distribution):
 		@return: the log-probability of each data point
 		"""
 
-		loglik = zeros([1, Y.shape[1]])
-
-		for model in self.subspaces:
-			loglik += model.loglikelihood(Y[:model.dim])
-			Y = Y[model.dim:]
-
-		return loglik
+		return self._prior().loglikelihood(Y)
 
 
 
+	@profiler.timed()
 	def loglikelihood(self, X, num_samples=10, method='biased', sampling_method=('ais', {'num_steps': 10}), **kwargs):
 		"""
 		Computes the log-likelihood (in nats) for a set of data samples. If the model is overcomplete,
@@ -1438,14 +2208,28 @@ class ISA(Distribution):
 		The unbiased method oftentimes suffers from extremely high variance and should be used with
 		caution.
 
+		The Laplace method approximates each posterior over hidden states by a Gaussian centered
+		at its mode. It is deterministic and much faster than sampling, but only approximate.
+		Laplace approximations can also be used as proposal distributions for annealed
+		importance sampling via C{sampling_method=('ais', {'proposal': 'laplace'})}. The
+		Laplace method ignores C{num_samples}, C{sampling_method} and C{return_all}.
+
+		The adaptive method is a variant of the biased method which starts with C{num_samples}
+		importance weights per data point and generates more weights only for data points whose
+		estimates contribute most to the Monte Carlo error of the average log-likelihood. It
+		stops once this error, measured in bits per component, falls below C{max_sem}. At least
+		two initial importance weights per data point are needed to estimate the error. Since
+		data points end up with different numbers of weights, C{return_all} returns a masked
+		array in which missing weights are masked.
+
 		@type  X: array_like
 		@param X: a number of visible states stored in columns
 
 		@type  method: string
-		@param method: whether to use the 'biased' or 'unbiased' method
+		@param method: whether to use the 'biased', 'unbiased', 'laplace' or 'adaptive' method
 
 		@type  num_samples: integer
-		@param num_samples: number of generated importance weights
+		@param num_samples: number of generated importance weights (per data point)
 
 		@type  sampling_method: tuple
 		@param sampling_method: method and parameters to generate importance weights
@@ -1453,6 +2237,12 @@ class ISA(Distribution):
 		@type  return_all: boolean
 		@param return_all: if true, return all important weights and don't average (default: False)
 
+		@type  max_sem: float
+		@param max_sem: targeted Monte Carlo error of the average log-likelihood in bits per component (default: 0.001)
+
+		@type  max_samples: integer
+		@param max_samples: maximum number of importance weights per data point (default: 1000)
+
 		@rtype: ndarray
 		@return: the log-probability of each data point
 		"""
@@ -1460,18 +2250,15 @@ class ISA(Distribution):
 		return_all = kwargs.get('return_all', False)
 
 		if self.num_hiddens == self.num_visibles:
-			return self.prior_loglikelihood(dot(inv(self.A), X)) - slogdet(self.A)[1]
+			return self.prior_loglikelihood(dot(self._pinv(), X)) + self._logdet_pinv()
 
 		else:
 			if method == 'biased':
 				# sample importance weights
-				log_is_weights = asshmarray(empty([num_samples, X.shape[1]]))
-				def parfor(i):
-					log_is_weights[i] = self.sample_posterior_ais(X, **sampling_method[1])[1]
-				mapp(parfor, range(num_samples))
+				log_is_weights = self._sample_ais_weights(X, num_samples, **sampling_method[1])
 
 				if return_all:
-					return asarray(log_is_weights)
+					return log_is_weights
 				else:
 					# average importance weights to get log-likelihoods
 					return logmeanexp(log_is_weights, 0)
@@ -1480,10 +2267,7 @@ class ISA(Distribution):
 				loglik = empty(X.shape[1])
 
 				# sample importance weights
-				log_is_weights = asshmarray(empty([num_samples, X.shape[1]]))
-				def parfor(i):
-					log_is_weights[i] = self.sample_posterior_ais(X, **sampling_method[1])[1]
-				mapp(parfor, range(num_samples))
+				log_is_weights = self._sample_ais_weights(X, num_samples, **sampling_method[1])
 
 				# obtain an initial first guess using the biased method
 				is_weights = exp(log_is_weights)
@@ -1505,11 +2289,7 @@ class ISA(Distribution):
 
 					# sample importance weights
 					if len(indices) > 0:
-						log_is_weights = asshmarray(empty([k, len(indices)]))
-
-						def parfor(i):
-							log_is_weights[i] = self.sample_posterior_ais(X[:, indices], num_steps=num_steps)[1]
-						mapp(parfor, range(k))
+						log_is_weights = self._sample_ais_weights(X[:, indices], k, **sampling_method[1])
 
 						# hyperparameter used for selected datapoints
 						c_ = c[indices]
@@ -1523,17 +2303,359 @@ class ISA(Distribution):
 				else:
 					return mean(loglik, 0).reshape(1, -1)
 
+			elif method == 'laplace':
+				W = self._pinv()
+				WX = dot(W, X)
+
+				# Gaussian approximations of the posteriors over nullspace coordinates
+				Z, eigvals, _ = self._laplace(WX)
+				Y = WX + dot(self.nullspace_basis().T, Z)
+
+				return self.prior_loglikelihood(Y) + self._logdet_pinv() \
+					+ (self.num_hiddens - self.num_visibles) / 2. * log(2. * pi) \
+					- sum(log(eigvals), 0).reshape(1, -1) / 2.
+
+			elif method == 'adaptive':
+				max_samples = kwargs.get('max_samples', 1000)
+
+				# targeted error of the average log-likelihood in nats
+				max_sem = kwargs.get('max_sem', 0.001) * X.shape[0] * log(2.)
+
+				if num_samples < 2:
+					raise ValueError('Adaptive method requires at least two samples per data point.')
+
+				# importance weights of each data point
+				log_is_weights = list(self._sample_ais_weights(X, num_samples, **sampling_method[1]).T)
+
+				while True:
+					counts = array([len(w) for w in log_is_weights])
+
+					# relative variance of importance weights
+					rel_var = array([var(exp(w - max(w)), ddof=1) / square(mean(exp(w - max(w))))
+						for w in log_is_weights])
+
+					if not all(isfinite(rel_var)):
+						raise RuntimeError('Variance of importance weights could not be estimated.')
+
+					# Monte Carlo error of the average log-likelihood
+					if sqrt(sum(rel_var / counts)) / X.shape[1] < max_sem:
+						break
+
+					# the error is smallest if the number of weights is proportional to the
+					# standard deviation, so choose the smallest such allocation reaching max_sem
+					target = sqrt(rel_var) * sum(sqrt(rel_var)) / square(X.shape[1] * max_sem)
+					target = minimum(ceil(target), max_samples)
+
+					# at most double the number of weights so that variance estimates can catch up
+					num_new = minimum(target - counts, counts).clip(0).astype(int)
+
+					if not any(num_new > 0):
+						break
+
+					columns = repeat(arange(X.shape[1]), num_new)
+
+					for i, w in zip(columns, self._sample_ais_columns(X, columns, **sampling_method[1])):
+						log_is_weights[i] = append(log_is_weights[i], w)
+
+					if Distribution.VERBOSITY > 0:
+						print '{0:8} weights, {1:6} data points refined'.format(
+							sum(counts) + len(columns), sum(num_new > 0))
+
+				if return_all:
+					# pad importance weights of data points with fewer weights
+					padded = ma.masked_all([max([len(w) for w in log_is_weights]), X.shape[1]])
+					for i, w in enumerate(log_is_weights):
+						padded[:len(w), i] = w
+					return padded
+				else:
+					return asarray([logmeanexp(w) for w in log_is_weights]).reshape(1, -1)
+
 			else:
 				raise NotImplementedError('Unknown method \'{0}\'.'.format(method))
 
 
 
-	def nullspace_basis(self):
+	def energy_gradient(self, X):
+		return self.energy_and_gradient(X)[1]
+
+
+
+	def energy_and_gradient(self, X):
+		"""
+		Computes the negative log-likelihood of complete models and its gradient with
+		respect to the data.
+
+		@type  X: array_like
+		@param X: visible states stored in columns
+
+		@rtype: tuple
+		@return: energy of each data point and gradient
+		"""
+
+		if self.num_hiddens != self.num_visibles:
+			raise NotImplementedError('The energy of overcomplete models is intractable.')
+
+		W = self._pinv()
+
+		energy, gradient = self.prior_energy_and_gradient(dot(W, X))
+
+		return energy + self.num_hiddens / 2. * log(2. * pi) - self._logdet_pinv(), \
+			dot(W.T, gradient)
+
+
+
+	def _sample_ais_weights(self, X, num_samples, **kwargs):
+		"""
+		Generates importance weights for each data point with many independent runs of
+		annealed importance sampling. The chains of all data points are advanced together
+		as columns of a single state array, sharing the matrices derived from the features
+		and the annealed scales. Unless another memory budget is given via C{max_bytes},
+		each process uses as much memory as a single run over all data points, but at
+		least 64 MB.
+
+		@type  X: array_like
+		@param X: visible states stored in columns
+
+		@type  num_samples: integer
+		@param num_samples: number of importance weights per data point
+
+		@rtype: ndarray
+		@return: log-importance weights, one row per run
+		"""
+
+		X = asarray(X, dtype=self.DTYPE)
+
+		log_is_weights = self._sample_ais_columns(X,
+			tile(arange(X.shape[1]), num_samples), **kwargs)
+
+		return log_is_weights.reshape(num_samples, X.shape[1])
+
+
+
+	def _sample_ais_columns(self, X, columns, **kwargs):
+		"""
+		Generates one importance weight for each selected column of C{X}, processing
+		columns in memory-budgeted batches (see L{_sample_ais_weights}). Only the weights
+		are kept, and data points are not copied for each time they are selected.
+
+		@type  X: array_like
+		@param X: visible states stored in columns
+
+		@type  columns: array_like
+		@param columns: indices of data points, one for each generated weight
+
+		@rtype: ndarray
+		@return: log-importance weights
+		"""
+
+		X = asarray(X, dtype=self.DTYPE)
+		columns = asarray(columns, dtype=int)
+
+		max_bytes = kwargs.pop('max_bytes', None)
+
+		if max_bytes is None:
+			# nested calls process chunks sequentially
+			num_jobs = max([1, mapp.max_processes]) \
+				if current_process().name == 'MainProcess' else 1
+
+			max_bytes = num_jobs * max([X.shape[1] * self._bytes_per_column(), 2**26])
+
+		annealing_weights = kwargs.get('annealing_weights', [])
+
+		if isinstance(annealing_weights, str) and annealing_weights == 'adaptive':
+			# all chunks have to use the same schedule (see L{sample_posterior_ais})
+			num_pilot = max([1, int(max_bytes / self._bytes_per_column())])
+			kwargs['annealing_weights'] = self.tune_annealing_weights(
+				X[:, columns[:num_pilot]], kwargs.get('ess', 0.9))
+
+		return self._sample_chunked(self.sample_posterior_ais, X, max_bytes,
+			columns=columns, return_weights_only=True, **kwargs).ravel()
+
+
+
+	def nullspace_basis(self, dtype=None):
+		"""
+		Compute the orthogonal complement of the feature matrix. The rows of the
+		returned matrix form an orthonormal basis of the nullspace.
+
+		@type  dtype: dtype
+		@param dtype: precision of the returned matrix (default: double precision)
+
+		@rtype: ndarray
+		@return: a read-only matrix with C{num_hiddens - num_visibles} rows
+		"""
+
+		return self._factorize(dtype)[1]
+
+
+
+	@property
+	def A(self):
+		"""
+		Linear features stored in columns. Assigning to this property invalidates
+		matrices derived from the features.
+		"""
+
+		return self._A
+
+
+
+	@A.setter
+	def A(self, A):
+		self._A = A
+		self._version = getattr(self, '_version', 0) + 1
+
+
+
+	def _prior(self):
+		"""
+		Returns the subspace GSMs as a single L{GSMBank}, which is only recreated if the
+		subspaces or their scales have changed. Like the matrices returned by L{_cached},
+		the bank must not be modified.
+
+		@rtype: GSMBank
+		@return: the prior over hidden states (read-only)
+		"""
+
+		scales = hstack([gsm.scales for gsm in self.subspaces])
+
+		if self._bank is None or self._bank[0] != self.subspaces \
+			or not array_equal(self._bank[1], scales):
+			bank = GSMBank(self.subspaces)
+
+			# protect cached bank against accidental modification
+			bank.scales.flags.writeable = False
+			bank.logweights.flags.writeable = False
+
+			self._bank = (list(self.subspaces), scales, bank)
+
+		return self._bank[2]
+
+
+
+	def _cached(self, key, function, dtype=None):
+		"""
+		Returns a matrix derived from the linear features, which is only recomputed
+		if the features have changed. Changes are detected through a version counter
+		incremented by all methods modifying the features and, to catch modifications
+		made in-place from outside, by comparing the features with a copy.
+
+		@type  key: string
+		@param key: identifies the derived matrix
+
+		@type  function: function
+		@param function: computes the derived matrix if it is not cached
+
+		@type  dtype: dtype
+		@param dtype: if given, a copy of the matrix with this precision is cached and returned
+
+		@rtype: ndarray
+		@return: the derived matrix (read-only)
+		"""
+
+		if dtype is not None and result_type(dtype) != float64:
+			# matrices are derived in double precision and cast copies are cached separately
+			return self._cached((key, result_type(dtype).name),
+				lambda: _astype(self._cached(key, function), dtype))
+
+		if self._cache.get('version', None) != self._version \
+			or not array_equal(self._cache['A'], self._A):
+			# cached matrices belong to different features
+			self._cache = {'version': self._version, 'A': self._A.copy()}
+
+		if key not in self._cache:
+			value = function()
+
+			for matrix in value if isinstance(value, tuple) else [value]:
+				if isinstance(matrix, ndarray):
+					# protect cached matrices against accidental modification
+					matrix.flags.writeable = False
+
+			self._cache[key] = value
+
+		return self._cache[key]
+
+
+
+	def _factorize(self, dtype=None):
+		"""
+		Computes the pseudoinverse of the feature matrix and an orthonormal basis of its
+		nullspace from a single QR decomposition of the transposed feature matrix. If the
+		feature matrix does not have full rank, an SVD is used instead. The decomposition
+		is always computed in double precision.
+
+		@rtype: tuple
+		@return: pseudoinverse and nullspace basis
+		"""
+
+		def factorize():
+			Q, R = qr(self.A.T, mode='complete')
+			r = abs(diag(R))
+
+			if r.size and min(r) > max(r) * max(self.A.shape) * finfo(R.dtype).eps:
+				# A = R^T Q^T, therefore pinv(A) = Q R^-T
+				W = dot(Q[:, :self.num_visibles], inv(R[:self.num_visibles]).T)
+				B = Q[:, self.num_visibles:].T
+			else:
+				W = pinv(self.A)
+				B = svd(self.A)[2][self.num_visibles:, :]
+
+			return W, B
+
+		return self._cached('factorization', factorize, dtype)
+
+
+
+	def _pinv(self, dtype=None):
+		"""
+		Returns the pseudoinverse of the feature matrix.
+		"""
+
+		return self._factorize(dtype)[0]
+
+
+
+	def _nullspace_projection(self, dtype=None):
+		"""
+		Returns the matrix projecting hidden states onto the nullspace of the feature matrix.
+		"""
+
+		return self._cached('nullspace_projection',
+			lambda: dot(self.nullspace_basis().T, self.nullspace_basis()), dtype)
+
+
+
+	def _features(self, dtype=None):
+		"""
+		Returns the feature matrix in the given precision.
+		"""
+
+		if dtype is None or result_type(dtype) == float64:
+			return self.A
+		return self._cached('features', lambda: self.A, dtype)
+
+
+
+	def _nullspace_outer_products(self):
+		"""
+		Returns the flattened outer products of the columns of the nullspace basis.
+		"""
+
+		B = self.nullspace_basis()
+
+		return self._cached('nullspace_outer_products',
+			lambda: multiply(B.T[:, :, None], B.T[:, None, :]).reshape(B.shape[1], -1))
+
+
+
+	def _logdet_pinv(self):
 		"""
-		Compute the orthogonal complement of the feature matrix.
+		Returns half the log-determinant of C{dot(W.T, W)}, where C{W} is the pseudoinverse
+		of the feature matrix. For complete models, this is the log-determinant of C{W}.
 		"""
 
-		return svd(self.A)[2][self.num_visibles:, :]
+		return self._cached('logdet_pinv',
+			lambda: slogdet(dot(self._pinv().T, self._pinv()))[1] / 2.)
 
 
 
@@ -1558,6 +2680,7 @@ class ISA(Distribution):
 		if self.noise:
 			A = self.A[:, self.num_visibles:]
 			self.A[:, self.num_visibles:] = dot(sqrtmi(dot(A, A.T)), A)
+			self._version += 1
 		else:
 			self.A = dot(sqrtmi(dot(self.A, self.A.T)), self.A)
 
@@ -1593,6 +2716,7 @@ class ISA(Distribution):
 				self.num_hiddens += self.num_visibles
 
 			self.A[:, :self.num_visibles] = sqrtm(noise)
+			self._version += 1
 
 		else:
 			if self._noise != noise:
@@ -1609,3 +2733,213 @@ class ISA(Distribution):
 					self.subspaces.remove(0)
 					self.A = self.A[:, self.num_visibles:]
 					self.num_hiddens -= self.num_visibles
+
+
+
+	def __getstate__(self):
+		"""
+		Called upon pickling. Derived matrices are not stored.
+		"""
+
+		state = dict(self.__dict__)
+		state['_cache'] = {}
+		state['_bank'] = None
+
+		return state
+
+
+
+	def __setstate__(self, state):
+		"""
+		Called upon unpickling. Converts models pickled by older versions.
+		"""
+
+		if 'A' in state:
+			state['_A'] = state.pop('A')
+		state.setdefault('_version', 0)
+		state.setdefault('_cache', {})
+		state.setdefault('_bank', None)
+		state.setdefault('peak_bytes', 0)
+		state.setdefault('annealing_weights', None)
+		state.setdefault('lf_step_size', None)
+		state.setdefault('mala_step_width', state.pop('step_width', None))
+		state.setdefault('acceptance_rate', None)
+
+		self.__dict__ = state
+
+
+
+def _astype(value, dtype):
+	"""
+	Converts an array or a tuple of arrays to the given precision.
+	"""
+
+	if isinstance(value, tuple):
+		return tuple(_astype(v, dtype) for v in value)
+	return asarray(value, dtype=dtype)
+
+
+
+def _permutation(A, A_):
+	"""
+	Finds the indices of the columns of C{A} which have been rearranged to form C{A_}.
+	"""
+
+	columns = dict((A[:, j].tostring(), j) for j in range(A.shape[1]))
+
+	return asarray([columns[A_[:, j].tostring()] for j in range(A_.shape[1])])
+
+
+
+@mapp.releases_gil
+def _sample_chunk(model, sampler, X, columns, kwargs, return_weights_only=False):
+	"""
+	Runs a sampling method of the given model on a chunk of data points.
+	"""
+
+	result = getattr(model, sampler)(X[:, columns], **kwargs)
+
+	if return_weights_only:
+		# avoid sending hidden states back to the caller
+		return result[1]
+	return result
+
+
+
+class _Chains(object):
+	"""
+	Persistent hidden states of all data points used by stochastic EM. Rescaling and
+	rearranging the hidden units of all chains only changes a scale and an index per
+	hidden unit, so that the states of data points are only touched when their
+	minibatch is visited.
+	"""
+
+	def __init__(self, states):
+		"""
+		@type  states: ndarray
+		@param states: hidden states stored in columns
+		"""
+
+		self.states = states
+		self.scales = ones(states.shape[0])
+		self.rows = arange(states.shape[0])
+
+
+
+	def __getitem__(self, batch):
+		return self.states[:, batch][self.rows] * self.scales.reshape(-1, 1)
+
+
+
+	def __setitem__(self, batch, Y):
+		states = empty_like(Y)
+		states[self.rows] = Y / self.scales.reshape(-1, 1)
+		self.states[:, batch] = states
+
+
+
+	def rescale(self, scales):
+		"""
+		@type  scales: ndarray
+		@param scales: factor for each hidden unit
+		"""
+
+		self.scales *= scales
+
+
+
+	def permute(self, permutation):
+		"""
+		@type  permutation: ndarray
+		@param permutation: new order of hidden units
+		"""
+
+		self.rows = self.rows[permutation]
+		self.scales = self.scales[permutation]
+
+
+
+class _DualAveraging(object):
+	"""
+	Tunes step sizes of Metropolis-adjusted samplers towards a target acceptance rate.
+
+	B{References:}
+		- Nesterov, Y. (2009). I{Primal-Dual Subgradient Methods for Convex Problems.}
+		- Hoffman, M. and Gelman, A. (2014). I{The No-U-Turn Sampler.}
+	"""
+
+	def __init__(self, step_size, target, num_chains=1, gamma=0.05, t0=10., kappa=0.75):
+		"""
+		@type  step_size: float/array_like
+		@param step_size: initial step size(s)
+
+		@type  target: float
+		@param target: targeted acceptance rate
+
+		@type  num_chains: integer
+		@param num_chains: number of separately tuned step sizes (1 or number of data points)
+		"""
+
+		self.target = target
+		self.gamma = gamma
+		self.t0 = t0
+		self.kappa = kappa
+
+		self.log_step_size = log(asarray(step_size, dtype=float).ravel() + zeros(num_chains))
+		self.log_step_size_avg = self.log_step_size.copy()
+
+		# step sizes are pulled towards a multiple of the initial step sizes
+		self.mu = log(10.) + self.log_step_size
+		self.statistic = zeros_like(self.log_step_size)
+		self.iteration = 0
+
+
+
+	@property
+	def step_size(self):
+		"""
+		Step sizes to be used in the next step, shaped to broadcast across data points.
+		"""
+
+		return self._reshape(exp(self.log_step_size))
+
+
+
+	def averaged_step_size(self):
+		"""
+		Step sizes to be used once tuning has finished.
+		"""
+
+		return self._reshape(exp(self.log_step_size_avg))
+
+
+
+	def _reshape(self, step_size):
+		return float(step_size) if step_size.size == 1 else step_size.reshape(1, -1)
+
+
+
+	def update(self, log_acceptance):
+		"""
+		@type  log_acceptance: ndarray
+		@param log_acceptance: log-acceptance ratios of all chains in the last step
+		"""
+
+		log_acceptance = asarray(log_acceptance, dtype=float).ravel()
+
+		# acceptance probabilities (failed proposals count as rejected)
+		acceptance = exp(minimum(0., where(isnan(log_acceptance), -inf, log_acceptance)))
+
+		if self.statistic.size == 1:
+			acceptance = mean(acceptance)
+
+		self.iteration += 1
+
+		m = self.iteration
+		w = 1. / (m + self.t0)
+
+		self.statistic = (1. - w) * self.statistic + w * (self.target - acceptance)
+		self.log_step_size = self.mu - sqrt(m) / self.gamma * self.statistic
+
+		w = m**-self.kappa
+		self.log_step_size_avg = w * self.log_step_size + (1. - w) * self.log_step_size_avg
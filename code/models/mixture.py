@@ -8,12 +8,13 @@ __docformat__ = 'epytext'
 
 from numpy import multiply, dot, sum, mean, cov, sqrt, log, exp, pi, argsort
 from numpy import ones, zeros, zeros_like, eye, round, squeeze, concatenate
-from numpy import asarray
-from numpy.random import multinomial, rand, permutation
+from numpy import asarray, vstack
+from tools.rng import multinomial, rand, permutation
 from numpy.linalg import det, inv, eig
 from gsm import GSM
 from distribution import Distribution
 from tools import logsumexp, mapp, shmarray
+from time import time
 
 class Mixture(Distribution):
 	"""
@@ -133,6 +134,8 @@ class Mixture(Distribution):
 			print 'Epoch 0\t', value
 
 		for epoch in range(num_epochs):
+			start = time()
+
 			# compute posterior over components (E)
 			post = exp(self.logposterior(data))
 			post /= sum(post, 0)
@@ -161,6 +164,8 @@ class Mixture(Distribution):
 			if Distribution.VERBOSITY >= 2:
 				print 'Epoch ', epoch, '\t', new_value
 
+			self._record(epoch=epoch + 1, value=new_value, time_epoch=time() - start)
+
 			if value - new_value < threshold:
 				if Distribution.VERBOSITY >= 1:
 					print 'Training converged...'
@@ -173,13 +178,8 @@ class Mixture(Distribution):
 
 
 	def loglikelihood(self, data):
-		# allocate memory
-		logjoint = shmarray.zeros([len(self), data.shape[1]])
-
 		# compute joint density over components and data points
-		def loglikelihood_(i):
-			logjoint[i, :] = self[i].loglikelihood(data) + log(self.priors[i])
-		mapp(loglikelihood_, range(len(self)))
+		logjoint = self._logjoint(data)
 
 		# marginalize
 		return asarray(logsumexp(logjoint, 0)).flatten()
@@ -194,13 +194,8 @@ class Mixture(Distribution):
 		@param data: data points stored in columns
 		"""
 
-		# allocate memory
-		logpost = shmarray.zeros([len(self), data.shape[1]])
-
 		# compute log-joint
-		def logposterior_(i):
-			logpost[i, :] = self[i].loglikelihood(data) + log(self.priors[i])
-		mapp(logposterior_, range(len(self)))
+		logpost = self._logjoint(data)
 
 		# normalize to get log-posterior
 		logpost -= logsumexp(logpost, 0)
@@ -209,6 +204,21 @@ class Mixture(Distribution):
 
 
 
+	def _logjoint(self, data):
+		"""
+		Computes the joint log-density of components and data points.
+
+		@type  data: array_like
+		@param data: data points stored in columns
+
+		@rtype: ndarray
+		@return: one row for each component
+		"""
+
+		return vstack(mapp(_logjoint, self.components, [data] * len(self), log(self.priors)))
+
+
+
 	def split(self, data):
 		"""
 		Randomly assigns data points to mixture components.
@@ -269,3 +279,14 @@ class Mixture(Distribution):
 		"""
 
 		self.__dict__ = state
+
+
+
+@mapp.releases_gil
+def _logjoint(component, data, logprior):
+	"""
+	Most of the time is spent in BLAS, so that threads avoid copying the data to other
+	processes without being slowed down by the GIL.
+	"""
+
+	return asarray(component.loglikelihood(data)).reshape(1, -1) + logprior
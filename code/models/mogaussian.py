@@ -8,8 +8,8 @@ __docformat__ = 'epytext'
 
 from distribution import Distribution
 from numpy import ones, square, sum, multiply, log, exp, mean, std, where, sqrt, pi, round
-from numpy import cumsum, zeros, asarray
-from numpy.random import randn, rand, multinomial, permutation
+from numpy import cumsum, zeros, asarray, result_type, float32
+from tools.rng import randn, rand, multinomial, permutation
 from scipy.stats import gamma, rayleigh, norm
 from tools import logsumexp
 
@@ -123,7 +123,7 @@ class MoGaussian(Distribution):
 
 
 	def sample(self, num_samples=1):
-		samples = randn(1, num_samples)
+		samples = randn(1, num_samples, dtype=self.DTYPE)
 		samples_ = samples
 
 		num_samples = multinomial(num_samples, self.priors)
@@ -165,6 +165,11 @@ class MoGaussian(Distribution):
 
 
 	def energy_gradient(self, data):
+		return self.energy_and_gradient(data)[1]
+
+
+
+	def energy_and_gradient(self, data):
 		# make sure data has right shape
 		data = asarray(data).reshape(1, -1)
 
@@ -176,10 +181,13 @@ class MoGaussian(Distribution):
 		data_centered = data - means
 
 		# calculate posterior
-		post = log(priors) - 0.5 * square(data_centered) / square(scales) - log(scales)
-		post = exp(post - logsumexp(post, 0))
+		joint = log(priors) - 0.5 * square(data_centered) / square(scales) - log(scales)
+		lse = logsumexp(joint, 0)
+		post = exp(joint - lse)
 
-		return sum(multiply(data_centered / square(scales), post), 0).reshape(1, -1)
+		# precision of the gradient is that of the data
+		return -lse.reshape(1, -1), sum(multiply(data_centered / square(scales), post), 0) \
+			.reshape(1, -1).astype(result_type(data, float32))
 
 
 
@@ -1,5 +1,6 @@
 from distribution import Distribution
 from numpy import zeros
+from tools import Dataset
 
 class StackedModel(Distribution):
 	def __init__(self, *args):
@@ -16,16 +17,13 @@ class StackedModel(Distribution):
 
 	def initialize(self, data=None, *args, **kwargs):
 		if data is not None:
-			for transform in self.transforms:
-				data = transform(data)
+			data = self._transform(data)
 		self.model.initialize(data, *args, **kwargs)
 
 
 
 	def train(self, data, *args, **kwargs):
-		for transform in self.transforms:
-			data = transform(data)
-		self.model.train(data, *args, **kwargs)
+		self.model.train(self._transform(data), *args, **kwargs)
 
 	
 
@@ -49,3 +47,17 @@ class StackedModel(Distribution):
 		loglik = loglik + self.model.loglikelihood(data, **kwargs)
 
 		return loglik
+
+
+
+	def _transform(self, data):
+		"""
+		Applies all transforms. Data sets stored on disk are transformed lazily.
+		"""
+
+		for transform in self.transforms:
+			if isinstance(data, Dataset):
+				data = data.map(transform)
+			else:
+				data = transform(data)
+		return data
@@ -39,6 +39,11 @@ class Tests(unittest.TestCase):
 		# test consistency of energy and gradient
 		self.assertTrue(all(abs(G - N) < 1E-5))
 
+		# energy and gradient computed at once
+		E, G_ = model.energy_and_gradient(X)
+		self.assertTrue(all(abs(E - model.energy(X)) < 1E-10))
+		self.assertTrue(all(abs(G - G_) < 1E-10))
+
 
 
 	def test_loglikelihood(self):
@@ -0,0 +1,94 @@
+import sys
+import unittest
+
+sys.path.append('./code')
+
+from models import GSM, GSMBank, Distribution
+from numpy import all, abs, array, vstack, sum
+from copy import deepcopy
+
+Distribution.VERBOSITY = 0
+
+class Tests(unittest.TestCase):
+	def setUp(self):
+		# subspaces of different dimensionality and different numbers of scales
+		self.gsms = [GSM(1, 6) for _ in range(4)] + [GSM(3, 4), GSM(2, 1)]
+		for gsm in self.gsms:
+			gsm.initialize('student')
+
+
+
+	def test_energy(self):
+		"""
+		Compares energy and gradient to the energies and gradients of the individual GSMs.
+		"""
+
+		bank = GSMBank(self.gsms)
+		Y = bank.sample(100)
+
+		E = sum([gsm.energy(Y[i:i + gsm.dim]) for gsm, i in zip(self.gsms, bank.offsets)], 0)
+		G = vstack([gsm.energy_gradient(Y[i:i + gsm.dim]) for gsm, i in zip(self.gsms, bank.offsets)])
+
+		self.assertTrue(all(abs(E - bank.energy(Y)) < 1E-10))
+		self.assertTrue(all(abs(G - bank.energy_gradient(Y)) < 1E-10))
+
+
+
+	def test_posterior(self):
+		"""
+		Tests whether posterior samples are restricted to valid scales.
+		"""
+
+		bank = GSMBank(self.gsms)
+		Y = bank.sample(100)
+
+		P = bank.posterior(Y)
+		S = bank.sample_posterior(Y)
+
+		self.assertTrue(all(abs(P[4, :4] - self.gsms[4].posterior(Y[4:7])) < 1E-10))
+		self.assertTrue(all(abs(sum(P, 1) - 1.) < 1E-10))
+		self.assertTrue(all(S[5] == self.gsms[5].scales[0]))
+		self.assertTrue(all(abs(bank.std() - array([gsm.std() for gsm in self.gsms])) < 1E-10))
+
+
+
+	def test_train(self):
+		"""
+		Compares EM updates to the updates of the individual GSMs.
+		"""
+
+		bank = GSMBank(self.gsms)
+		Y = bank.sample(1000)
+
+		gsms = deepcopy(self.gsms)
+		for gsm, i in zip(gsms, bank.offsets):
+			gsm.train(Y[i:i + gsm.dim], max_iter=5, tol=1E-5)
+
+		bank.train(Y, max_iter=5, tol=1E-5)
+		bank.unpack(self.gsms)
+
+		for gsm, gsm_ in zip(self.gsms, gsms):
+			self.assertEqual(len(gsm.scales), len(gsm_.scales))
+			self.assertTrue(all(abs(gsm.scales - gsm_.scales) < 1E-8))
+
+
+
+	def test_statistics(self):
+		"""
+		Tests whether updating scales via sufficient statistics is equivalent to EM.
+		"""
+
+		bank = GSMBank(self.gsms)
+		Y = bank.sample(1000)
+
+		bank_ = deepcopy(bank)
+		bank_.maximize(*bank_.statistics(Y))
+
+		bank.train(Y, max_iter=1, tol=-1.)
+
+		self.assertTrue(all(abs(bank.scales - bank_.scales) < 1E-10))
+
+
+
+if __name__ == '__main__':
+	unittest.main()
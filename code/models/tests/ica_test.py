@@ -30,6 +30,30 @@ class Tests(unittest.TestCase):
 		self.assertTrue(all(abs(G - N) < 1E-5))
 
 
+
+	def test_energy_and_gradient(self):
+		step_size = 1E-5
+
+		model = ICA(3)
+
+		for mog in model.marginals:
+			mog.initialize('student')
+
+		X = model.sample(100)
+		E, G = model.energy_and_gradient(X)
+
+		# numerical gradient
+		N = zeros(G.shape)
+		for i in range(N.shape[0]):
+			d = zeros(X.shape)
+			d[i] = step_size
+			N[i] = (model.loglikelihood(X - d) - model.loglikelihood(X + d)) / (2. * step_size)
+
+		self.assertTrue(all(abs(E + model.loglikelihood(X)) < 1E-8))
+		self.assertTrue(all(abs(G - N) < 1E-5))
+
+
+
 	def test_training(self):
 		ica = ICA(2)
 
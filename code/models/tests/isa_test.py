@@ -3,9 +3,16 @@ import unittest
 
 sys.path.append('./code')
 
-from models import ISA, Distribution
-from numpy import zeros, all, abs, eye, sqrt
-from tools import mapp
+from models import ISA, ConcatModel, Distribution
+from models.isa import _Chains
+from numpy import zeros, all, abs, eye, sqrt, dot, square, diff, savez, hstack, vstack, memmap, \
+	load
+from numpy.linalg import pinv, solve
+from tools import mapp, rng, logmeanexp, Dataset, Checkpoint, Metrics, profiler
+from copy import deepcopy
+from tempfile import mkdtemp
+from shutil import rmtree
+from os import path
 
 mapp.max_processes = 1
 Distribution.VERBOSITY = 0
@@ -33,6 +40,11 @@ class Tests(unittest.TestCase):
 		# test consistency of energy and gradient
 		self.assertTrue(all(abs(G - N) < 1E-5))
 
+		# the cached prior has to reflect changes of the scales
+		energy = model.prior_energy(X)
+		model.subspaces[0].scales *= 2.
+		self.assertFalse(all(model.prior_energy(X) == energy))
+
 
 
 	def test_train(self):
@@ -53,6 +65,171 @@ class Tests(unittest.TestCase):
 	
 
 
+	def test_train_stochastic(self):
+		isa = ISA(2, 4)
+		X = isa.sample(100)
+
+		scales = isa.subspaces[0].scales.copy()
+
+		isa.train(X, max_iter=3, batch_size=20, sampling_method=('gibbs', {'num_steps': 1}))
+
+		self.assertFalse(all(scales == isa.subspaces[0].scales))
+		self.assertEqual(isa.sample_posterior(X).shape, (4, 100))
+
+		# minibatches are initialized with samples from the prior
+		isa.train(X, max_iter=1, batch_size=20, persistent=False,
+			sampling_method=('gibbs', {'num_steps': 1}))
+
+
+
+	def test_dataset(self):
+		isa = ISA(3, 3)
+		X = isa.sample(250)
+
+		directory = mkdtemp()
+
+		try:
+			savez(path.join(directory, 'data.npz'), data=X)
+			dataset = Dataset.from_npz(path.join(directory, 'data.npz'),
+				path.join(directory, 'data'), block_size=60)
+
+			self.assertEqual(dataset.shape, X.shape)
+			self.assertTrue(all(dataset[:, [3, 249, 61, 0]] == X[:, [3, 249, 61, 0]]))
+			self.assertTrue(all(hstack(list(dataset.chunks(100))) == X))
+			self.assertLess(abs(isa.evaluate(dataset) - isa.evaluate(X)), 1E-10)
+
+			self.assertEqual(dataset.map(lambda X: X.astype('float32')).dtype, 'float32')
+
+			# training should never load the complete data set or keep all chains in memory
+			loads = []
+			chains = []
+			array = Dataset.__array__
+			init = _Chains.__init__
+			Dataset.__array__ = lambda self, *args: loads.append(1) or array(self, *args)
+			_Chains.__init__ = lambda self, states: chains.append(states) or init(self, states)
+
+			try:
+				isa.train(dataset, max_iter=2, batch_size=50, init_sampling_steps=1,
+					sampling_method=('gibbs', {'num_steps': 1}))
+			finally:
+				Dataset.__array__ = array
+				_Chains.__init__ = init
+
+			self.assertEqual(len(loads), 0)
+			self.assertTrue(isinstance(chains[0], memmap))
+
+		finally:
+			rmtree(directory)
+
+
+
+	def test_checkpoint(self):
+		isa = ISA(2, 4)
+		X = isa.sample(100)
+
+		def train(model, directory, max_iter):
+			model.train(X, max_iter=max_iter, batch_size=30,
+				method=('sgd', {}),
+				sampling_method=('gibbs', {'num_steps': 1}),
+				checkpoint=Checkpoint(directory, every=2))
+
+		directory = mkdtemp()
+
+		try:
+			# uninterrupted training
+			isa0 = deepcopy(isa)
+			rng.seed(1)
+			train(isa0, path.join(directory, '0'), 4)
+
+			# interrupted training, which continued after the last checkpoint
+			isa1 = deepcopy(isa)
+			rng.seed(1)
+			train(isa1, path.join(directory, '1'), 3)
+			train(deepcopy(isa), path.join(directory, '1'), 4)
+
+			iteration, state = Checkpoint(path.join(directory, '1')).load()
+
+			self.assertEqual(iteration, 4)
+			self.assertTrue(all(state['model']['_A'] == isa0.A))
+			self.assertTrue(all(
+				load(path.join(directory, '0', 'chains.npy')) ==
+				load(path.join(directory, '1', 'chains.npy'))))
+
+			# models trained together should not share a checkpoint
+			model = ConcatModel(deepcopy(isa), deepcopy(isa))
+			model.train(vstack([X, 2. * X]), max_iter=1, batch_size=30,
+				sampling_method=('gibbs', {'num_steps': 1}),
+				checkpoint=Checkpoint(path.join(directory, '2')))
+
+			for i in range(2):
+				state = Checkpoint(path.join(directory, '2', str(i))).load()[1]
+				self.assertTrue(all(state['model']['_A'] == model[i].A))
+
+		finally:
+			rmtree(directory)
+
+
+
+	def test_metrics(self):
+		isa = ISA(2, 4)
+		X = isa.sample(100)
+
+		directory = mkdtemp()
+
+		try:
+			Distribution.METRICS = Metrics(path.join(directory, 'metrics.log'))
+
+			isa.train(X, max_iter=3, method=('sgd', {}),
+				sampling_method=('hmc', {'num_steps': 2}))
+
+			Distribution.METRICS.close()
+
+			records = Metrics.load(path.join(directory, 'metrics.log'))
+			records = [record for record in records if record['model'] == 'ISA']
+
+			self.assertEqual(len(Distribution.METRICS.records(model='ISA')), 3)
+			self.assertEqual([record['iteration'] for record in records], [1, 2, 3])
+			self.assertTrue(all(0. <= record['acceptance_rate'] <= 1. for record in records))
+			self.assertTrue(all(record['time_sampling'] >= 0. for record in records))
+			self.assertTrue('step_width' in records[0] and 'improved' in records[0])
+
+		finally:
+			Distribution.METRICS = None
+			rmtree(directory)
+
+
+
+	def test_profiler(self):
+		isa = ISA(2, 4)
+		X = isa.sample(100)
+
+		try:
+			profiler.enable()
+
+			isa.train(X, max_iter=2, method=('sgd', {}),
+				sampling_method=('gibbs', {'num_steps': 3}))
+
+			stats = profiler.stats()
+
+			self.assertEqual(stats['ISA.train.E-step']['calls'], 2)
+			self.assertEqual(stats['ISA.sample_scales']['calls'], 6)
+			self.assertEqual(stats['ISA.sample_posterior']['bytes'], 2 * isa.num_hiddens * 100 * 8)
+			self.assertTrue(stats['ISA.train.E-step']['time'] >= stats['ISA.sample_posterior']['time'])
+			self.assertTrue('ISA.train_sgd' in profiler.report())
+
+			# disabled profiler does not record anything
+			profiler.disable()
+			profiler.reset()
+			isa.train(X, max_iter=1, method=('sgd', {}))
+
+			self.assertEqual(profiler.stats(), {})
+
+		finally:
+			profiler.disable()
+			profiler.reset()
+
+
+
 	def test_train_subspaces(self):
 		isa = ISA(4, 4, 2)
 		isa.initialize(method='laplace')
@@ -81,6 +258,108 @@ class Tests(unittest.TestCase):
 
 
 
+	def test_sample_posterior_cond(self):
+		isa = ISA(3, 7)
+
+		X = isa.sample(50)
+		Y = isa.sample_prior(50)
+		S = isa.sample_scales(Y)
+
+		W = pinv(isa.A)
+		WX = dot(W, X)
+		Q = eye(7) - dot(W, isa.A)
+
+		rng.seed(1)
+		Y_batched = isa._sample_posterior_cond(Y, X, S, W, WX, Q)
+
+		# reference implementation solving one system at a time
+		rng.seed(1)
+		Y_ = rng.randn(7, 50) * S
+		X_ = X - dot(isa.A, Y_)
+		for i in range(50):
+			C = square(S[:, [i]]) * isa.A.T
+			Y[:, i] = dot(C, solve(dot(isa.A, C), X_[:, i]))
+		Y = WX + dot(Q, Y + Y_)
+
+		self.assertTrue(all(abs(Y_batched - Y) < 1E-10))
+
+
+
+	def test_sample_posterior_adaptive(self):
+		isa = ISA(2, 4)
+		X = isa.sample(10)
+
+		Y = isa.sample_posterior(X, method=('hmc', {
+			'num_steps': 2, 'num_adapt': 20, 'lf_num_steps': 2, 'per_column': True}))
+
+		# one tuned step size per data point
+		self.assertEqual(Y.shape, (4, 10))
+		self.assertEqual(isa.lf_step_size.shape, (1, 10))
+		self.assertTrue(all(isa.lf_step_size > 0.))
+
+		isa.sample_posterior(X, method=('mala', {'num_steps': 2, 'num_adapt': 20}))
+
+		self.assertTrue(isinstance(isa.mala_step_width, float))
+		self.assertTrue(isa.mala_step_width > 0.)
+
+
+
+	def test_sample_posterior_chunked(self):
+		isa = ISA(3, 7)
+
+		X = isa.sample(100)
+
+		max_bytes = 20 * isa._bytes_per_column()
+
+		# hidden states should be consistent with visible states
+		Y = isa.sample_posterior_gibbs(X, num_steps=2, max_bytes=max_bytes)
+		self.assertTrue(all(abs(dot(isa.A, Y) - X) < 1E-10))
+		self.assertTrue(0 < isa.peak_bytes <= max_bytes)
+
+		Y, log_is_weights = isa.sample_posterior_ais(X, num_steps=2, max_bytes=max_bytes)
+		self.assertTrue(all(abs(dot(isa.A, Y) - X) < 1E-10))
+		self.assertEqual(log_is_weights.shape, (1, 100))
+
+		Y = isa.sample_posterior_tempered(X, Y=Y, max_bytes=max_bytes)
+		self.assertTrue(all(abs(dot(isa.A, Y) - X) < 1E-10))
+
+		# adaptive annealing should choose a single schedule for all chunks
+		calls = []
+		next_annealing_weight = isa._next_annealing_weight
+		isa._next_annealing_weight = lambda Y, *args: \
+			calls.append(Y.shape[1]) or next_annealing_weight(Y, *args)
+
+		isa.sample_posterior_ais(X, annealing_weights='adaptive', max_bytes=max_bytes)
+
+		self.assertEqual(len(calls), len(isa.annealing_weights))
+		self.assertEqual(isa.annealing_weights[-1], 1.)
+
+
+
+	def test_nullspace_basis(self):
+		isa = ISA(3, 7)
+
+		B = isa.nullspace_basis()
+
+		# basis should be orthonormal and orthogonal to features
+		self.assertTrue(all(abs(dot(B, B.T) - eye(4)) < 1E-10))
+		self.assertTrue(all(abs(dot(isa.A, B.T)) < 1E-10))
+
+		# derived matrices should be reused as long as features don't change
+		self.assertTrue(isa.nullspace_basis() is B)
+		self.assertTrue(all(abs(dot(isa.A, isa._pinv()) - eye(3)) < 1E-10))
+
+		# modifying features should invalidate derived matrices
+		isa.A = isa.A * 2.
+		self.assertFalse(isa.nullspace_basis() is B)
+		self.assertTrue(all(abs(dot(isa.A, isa._pinv()) - eye(3)) < 1E-10))
+
+		isa.A[0, 0] += 1.
+		self.assertTrue(all(abs(dot(isa.A, isa._pinv()) - eye(3)) < 1E-10))
+		self.assertTrue(all(abs(dot(isa.A, isa.nullspace_basis().T)) < 1E-10))
+
+
+
 	def test_evaluate(self):
 		isa1 = ISA(2)
 		isa1.A = eye(2)
@@ -106,5 +385,127 @@ class Tests(unittest.TestCase):
 
 
 
+	def test_loglikelihood(self):
+		isa = ISA(2, 4)
+		data = isa.sample(10)
+
+		rng.seed(2)
+		log_is_weights = isa.loglikelihood(data, num_samples=5,
+			sampling_method=('ais', {'num_steps': 2}), return_all=True)
+
+		rng.seed(2)
+		loglik = isa.loglikelihood(data, num_samples=5,
+			sampling_method=('ais', {'num_steps': 2}))
+
+		# one row of importance weights for each chain
+		self.assertEqual(log_is_weights.shape, (5, 10))
+		self.assertTrue(all(abs(logmeanexp(log_is_weights, 0) - loglik) < 1E-10))
+
+
+
+	def test_loglikelihood_adaptive(self):
+		isa = ISA(2, 4)
+		data = isa.sample(10)
+
+		log_is_weights = isa.loglikelihood(data, num_samples=4, method='adaptive',
+			max_sem=0.01, max_samples=64, sampling_method=('ais', {'num_steps': 2}), return_all=True)
+
+		# missing importance weights are masked
+		self.assertEqual(log_is_weights.shape[1], 10)
+		self.assertTrue(all(log_is_weights.count(0) >= 4))
+		self.assertTrue(all(log_is_weights.count(0) <= 64))
+
+		# variance of a single importance weight cannot be estimated
+		self.assertRaises(ValueError, isa.loglikelihood, data, num_samples=1, method='adaptive')
+
+
+
+	def test_tune_annealing_weights(self):
+		isa = ISA(2, 4)
+		data = isa.sample(10)
+
+		annealing_weights = isa.tune_annealing_weights(data)
+
+		# schedule should be increasing and end in 1
+		self.assertTrue(all(diff(annealing_weights) > 0.))
+		self.assertEqual(annealing_weights[-1], 1.)
+
+		log_is_weights = isa.loglikelihood(data, num_samples=2, return_all=True,
+			sampling_method=('ais', {'annealing_weights': isa.annealing_weights}))
+		self.assertEqual(log_is_weights.shape, (2, 10))
+
+
+
+	def test_laplace(self):
+		isa = ISA(3, 6, num_scales=1)
+		data = isa.sample(10)
+
+		W = isa._pinv()
+		B = isa.nullspace_basis()
+
+		# compare Hessian with finite differences of the gradient
+		Y = isa.compute_map(data[:, :1], tol=1E-8)
+		H = isa._nullspace_hessian(Y)[0]
+
+		for i in range(3):
+			dY = 1E-6 * B[[i]].T
+			dG = isa.prior_energy_gradient(Y + dY) - isa.prior_energy_gradient(Y - dY)
+			self.assertTrue(all(abs(dot(B, dG).ravel() / 2E-6 - H[:, i]) < 1E-5))
+
+		# for Gaussian priors, the Laplace approximation is exact
+		loglik = isa.loglikelihood(data, method='laplace')
+		log_is_weights = isa.loglikelihood(data, num_samples=3, return_all=True,
+			sampling_method=('ais', {'num_steps': 2, 'proposal': 'laplace'}))
+
+		self.assertTrue(all(abs(log_is_weights - loglik) < 1E-6))
+
+		# the prior cannot be tempered with a weight of zero
+		self.assertRaises(ValueError, isa.sample_posterior_ais, data,
+			annealing_weights=[0., 1.], proposal='laplace')
+
+
+
+	def test_single_precision(self):
+		isa = ISA(4, 8, ssize=2)
+		X = isa.sample(20)
+
+		rng.seed(4)
+		log_is_weights = isa.loglikelihood(X, num_samples=2, return_all=True)
+
+		isa.DTYPE = 'float32'
+
+		rng.seed(4)
+		log_is_weights32 = isa.loglikelihood(X, num_samples=2, return_all=True)
+
+		# samples are computed in single precision, importance weights in double precision
+		self.assertEqual(isa.sample_posterior(X).dtype, 'float32')
+		self.assertEqual(log_is_weights32.dtype, 'float64')
+		self.assertTrue(all(abs(log_is_weights - log_is_weights32) < 1E-2))
+
+
+
+	def test_reproducibility(self):
+		"""
+		Tests whether parallel estimates equal sequential estimates.
+		"""
+
+		isa = ISA(2, 4)
+		data = isa.sample(20)
+
+		loglik = []
+
+		for max_processes in [1, 3]:
+			mapp.max_processes = max_processes
+
+			rng.seed(3)
+			loglik.append(isa.loglikelihood(data,
+				num_samples=4, sampling_method=('ais', {'num_steps': 2})))
+
+		mapp.max_processes = 1
+
+		self.assertTrue(all(loglik[0] == loglik[1]))
+
+
+
 if __name__ == '__main__':
 	unittest.main()
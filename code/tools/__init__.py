@@ -2,9 +2,17 @@ from preprocess import preprocess
 from experiment import Experiment
 from contours import contours
 from sqrtm import sqrtm, sqrtmi
+from cholesky import cholesky_solve
 from gabor import gaborf, gaborfit
 from mapp import mapp
 from gamma import gammaincinv
 from logsumexp import logsumexp, logmeanexp
 from shmarray import asshmarray
+from sharedarray import asshared
 from patches import stitch, imsave, imformat
+from evaluation import Evaluation
+from dataset import Dataset
+from minibatches import Minibatches
+from checkpoint import Checkpoint
+from metrics import Metrics
+from profiler import profiler
@@ -0,0 +1,230 @@
+"""
+Checkpoints which allow long training runs to be resumed after a crash.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+import os
+
+from os import path
+from glob import glob
+from shutil import rmtree
+from threading import Thread
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+from numpy import ndarray, save, load, array
+
+class Checkpoint(object):
+	"""
+	Stores the state of an optimization in a directory. Arrays are written to uncompressed
+	C{.npy} files, which can be memory-mapped when loaded, while all other values are
+	pickled. Example:
+
+		>>> checkpoint = Checkpoint('results/checkpoints/')
+		>>> model.train(data, max_iter=100, checkpoint=checkpoint)
+
+	If the training is interrupted, calling C{train} again with the same checkpoint
+	continues the optimization where it stopped.
+
+	Each checkpoint is written to a temporary directory which is renamed once all files
+	have been written and flushed to disk, so that a crash while writing never corrupts
+	the last complete checkpoint. Arrays are copied when L{save} is called, and the files
+	are written by a background thread, so that training continues while the
+	checkpoint is written.
+
+	@type directory: string
+	@ivar directory: where checkpoints are stored
+
+	@type every: integer
+	@ivar every: only every C{every}-th iteration is stored
+
+	@type keep: integer
+	@ivar keep: number of complete checkpoints which are kept
+	"""
+
+	def __init__(self, directory, every=1, keep=2, background=True):
+		"""
+		@type  directory: string
+		@param directory: where checkpoints are stored
+
+		@type  every: integer
+		@param every: only every C{every}-th iteration is stored (default: 1)
+
+		@type  keep: integer
+		@param keep: number of complete checkpoints which are kept (default: 2)
+
+		@type  background: bool
+		@param background: write checkpoints in a separate thread (default: True)
+		"""
+
+		self.directory = directory
+		self.every = every
+		self.keep = keep
+		self.background = background
+
+		self._thread = None
+		self._error = None
+
+		# make sure directory exists
+		try:
+			os.makedirs(directory)
+		except OSError:
+			pass
+
+
+
+	def save(self, iteration, state):
+		"""
+		Stores the state of an optimization after the given iteration. Nothing is stored if
+		the iteration is not a multiple of C{every}.
+
+		@type  iteration: integer
+		@param iteration: number of completed iterations
+
+		@type  state: dict
+		@param state: arrays and other picklable objects
+
+		@rtype: bool
+		@return: true if a checkpoint is written
+		"""
+
+		if iteration % self.every:
+			return False
+
+		# take a snapshot so that the training can continue to modify its state
+		arrays = dict((key, array(value)) for key, value in state.items()
+			if isinstance(value, ndarray))
+		other = dumps(dict((key, value) for key, value in state.items()
+			if not isinstance(value, ndarray)), HIGHEST_PROTOCOL)
+
+		# at most one checkpoint is written at a time
+		self.wait()
+
+		if self.background:
+			self._thread = Thread(target=self._write, args=(iteration, arrays, other))
+			self._thread.start()
+		else:
+			self._write(iteration, arrays, other)
+
+		return True
+
+
+
+	def load(self, mmap_mode=None):
+		"""
+		Loads the latest complete checkpoint.
+
+		@type  mmap_mode: string
+		@param mmap_mode: if not C{None}, arrays are memory-mapped (e.g., C{'r'})
+
+		@rtype: tuple/None
+		@return: number of completed iterations and state, or C{None} if there is no checkpoint
+		"""
+
+		self.wait()
+
+		iterations = self.iterations()
+
+		if not iterations:
+			return None
+
+		directory = self._dirname(iterations[-1])
+
+		with open(path.join(directory, 'state.pck'), 'rb') as handle:
+			state = loads(handle.read())
+
+		for filename in glob(path.join(directory, '*.npy')):
+			state[path.basename(filename)[:-4]] = load(filename, mmap_mode=mmap_mode)
+
+		return iterations[-1], state
+
+
+
+	def child(self, name):
+		"""
+		Creates a checkpoint stored in a subdirectory, e.g., for one of several models which
+		are trained together and must not share a checkpoint.
+
+		@type  name: string
+		@param name: name of the subdirectory
+
+		@rtype: Checkpoint
+		@return: a checkpoint with the same settings
+		"""
+
+		return Checkpoint(path.join(self.directory, name), self.every, self.keep, self.background)
+
+
+
+	def iterations(self):
+		"""
+		Returns the iterations of all complete checkpoints.
+
+		@rtype: list
+		@return: sorted list of iterations
+		"""
+
+		return sorted(int(path.basename(dirname).split('.')[1])
+			for dirname in glob(path.join(self.directory, 'checkpoint.*')))
+
+
+
+	def wait(self):
+		"""
+		Waits until the checkpoint currently being written is complete.
+		"""
+
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+
+		if self._error is not None:
+			error, self._error = self._error, None
+			raise error
+
+
+
+	def _write(self, iteration, arrays, other):
+		try:
+			tmpdir = path.join(self.directory, 'tmp.{0}'.format(iteration))
+
+			if path.exists(tmpdir):
+				rmtree(tmpdir)
+			os.makedirs(tmpdir)
+
+			for key, value in arrays.items():
+				with open(path.join(tmpdir, key + '.npy'), 'wb') as handle:
+					save(handle, value)
+					_sync(handle)
+
+			with open(path.join(tmpdir, 'state.pck'), 'wb') as handle:
+				handle.write(other)
+				_sync(handle)
+
+			if path.exists(self._dirname(iteration)):
+				rmtree(self._dirname(iteration))
+			os.rename(tmpdir, self._dirname(iteration))
+
+			# remove old checkpoints
+			for it in self.iterations()[:-self.keep]:
+				rmtree(self._dirname(it))
+
+		except Exception as error:
+			# raised by the training thread
+			self._error = error
+
+
+
+	def _dirname(self, iteration):
+		return path.join(self.directory, 'checkpoint.{0:08d}'.format(iteration))
+
+
+
+def _sync(handle):
+	"""
+	Makes sure the contents of a file have been written to disk.
+	"""
+
+	handle.flush()
+	os.fsync(handle.fileno())
@@ -0,0 +1,43 @@
+"""
+Solves many small symmetric positive definite systems of equations at once.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+from numpy import empty, einsum, asarray
+from numpy.linalg import cholesky
+
+def cholesky_solve(C, b):
+	"""
+	Solves a stack of symmetric positive definite systems of equations, C[i] x[i] = b[i].
+	All matrices are factored with a single call to LAPACK, followed by forward and backward
+	substitution which is vectorized across the stack. Only loops over the dimensionality
+	of the systems are done in Python.
+
+	@type  C: array_like
+	@param C: an NxMxM stack of positive definite matrices (only lower triangles are used)
+
+	@type  b: array_like
+	@param b: an NxM array of right-hand sides
+
+	@rtype: ndarray
+	@return: an NxM array of solutions (with the precision of C{C})
+	"""
+
+	L = cholesky(C)
+	b = asarray(b)
+
+	y = empty(b.shape, L.dtype)
+	x = empty(b.shape, L.dtype)
+
+	# forward substitution, L y = b
+	for i in range(b.shape[1]):
+		y[:, i] = (b[:, i] - einsum('ij,ij->i', L[:, i, :i], y[:, :i])) / L[:, i, i]
+
+	# backward substitution, L^T x = y
+	for i in range(b.shape[1] - 1, -1, -1):
+		x[:, i] = (y[:, i] - einsum('ij,ij->i', L[:, i + 1:, i], x[:, i + 1:])) / L[:, i, i]
+
+	return x
@@ -0,0 +1,367 @@
+"""
+Data sets which are stored on disk and only loaded into memory as needed.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+import os
+
+from os import path
+from glob import glob
+from zipfile import ZipFile
+from numpy import load, save, empty, asarray, asfortranarray, arange, searchsorted, \
+	fromstring, unique, cumsum, dtype as np_dtype, integer
+from numpy.lib.format import read_magic, read_array_header_1_0, read_array_header_2_0, \
+	open_memmap
+
+class Dataset(object):
+	"""
+	Data points stored in columns which are split into blocks of columns. Each block is
+	kept in an uncompressed C{.npy} file in column-major order and memory-mapped, so that
+	data sets larger than the available memory can be used for training and evaluation.
+	Example:
+
+		>>> dataset = Dataset.from_npz('data/vanhateren.8.0.npz', 'data/vanhateren.8.0/')
+		>>> for chunk in dataset.chunks(10000):
+		>>> 	print chunk.mean()
+
+	Indexing a data set (e.g., C{dataset[:, 100:200]} or C{dataset[:, indices]}) only
+	reads the requested columns. Contiguous columns within a block are returned as
+	read-only views, other columns are copied into an ordinary array. C{asarray(dataset)}
+	loads the complete data set.
+
+	@type directory: string
+	@ivar directory: where blocks are stored
+
+	@type block_size: integer
+	@ivar block_size: maximal number of data points per block
+	"""
+
+	def __init__(self, directory, block_size=10000):
+		"""
+		Opens the data set stored in a directory or creates an empty data set.
+
+		@type  directory: string
+		@param directory: where blocks are stored
+
+		@type  block_size: integer
+		@param block_size: maximal number of data points in blocks created by L{append}
+		"""
+
+		self.directory = directory
+		self.block_size = block_size
+
+		# make sure directory exists
+		try:
+			os.makedirs(directory)
+		except OSError:
+			pass
+
+		self._open()
+
+
+
+	@staticmethod
+	def from_npz(filename, directory, key='data', block_size=10000):
+		"""
+		Converts an array stored in an C{.npz} file into a data set. The array is read row
+		by row (or column by column), so that it never needs to fit into memory.
+
+		@type  filename: string
+		@param filename: path to an C{.npz} file
+
+		@type  directory: string
+		@param directory: where the data set will be stored
+
+		@type  key: string
+		@param key: name of the array stored in the C{.npz} file
+
+		@type  block_size: integer
+		@param block_size: maximal number of data points per block
+
+		@rtype: Dataset
+		@return: the new data set
+		"""
+
+		dataset = Dataset(directory, block_size)
+
+		if dataset.shape[1] > 0:
+			raise ValueError('Directory already contains a data set.')
+
+		with ZipFile(filename) as archive:
+			handle = archive.open(key + '.npy')
+
+			if read_magic(handle) == (1, 0):
+				shape, fortran_order, dtype = read_array_header_1_0(handle)
+			else:
+				shape, fortran_order, dtype = read_array_header_2_0(handle)
+
+			if len(shape) != 2:
+				raise ValueError('Data has to be stored in a two-dimensional array.')
+
+			if fortran_order:
+				# columns are stored contiguously
+				for i in range(0, shape[1], block_size):
+					num_data = min(block_size, shape[1] - i)
+					block = _read(handle, dtype, shape[0] * num_data)
+					dataset._write(i, block.reshape(num_data, shape[0]).T)
+
+			else:
+				# rows are stored contiguously and distributed over preallocated blocks
+				blocks = [(i, open_memmap(dataset._filename(i) + '.tmp', mode='w+',
+					dtype=dtype, shape=(shape[0], min(block_size, shape[1] - i)),
+					fortran_order=True)) for i in range(0, shape[1], block_size)]
+
+				for j in range(shape[0]):
+					row = _read(handle, dtype, shape[1])
+					for i, block in blocks:
+						block[j] = row[i:i + block.shape[1]]
+
+				for i, block in blocks:
+					block.flush()
+					os.rename(dataset._filename(i) + '.tmp', dataset._filename(i))
+
+		dataset._open()
+
+		return dataset
+
+
+
+	@property
+	def shape(self):
+		"""
+		Number of dimensions and number of data points.
+		"""
+
+		return self._shape
+
+
+
+	@property
+	def dtype(self):
+		return self._dtype
+
+
+
+	def append(self, data):
+		"""
+		Stores additional data points.
+
+		@type  data: array_like
+		@param data: data points stored in columns
+		"""
+
+		data = asarray(data)
+
+		if self.shape[1] > 0:
+			if data.shape[0] != self.shape[0]:
+				raise ValueError('Data points have to be {0}-dimensional.'.format(self.shape[0]))
+			data = asarray(data, dtype=self.dtype)
+
+		for i in range(0, data.shape[1], self.block_size):
+			self._write(self.shape[1] + i, data[:, i:i + self.block_size])
+
+		self._open()
+
+
+
+	def chunks(self, chunk_size=None):
+		"""
+		Iterates over consecutive data points. By default, the memory-mapped blocks are
+		returned without copying any data.
+
+		@type  chunk_size: integer
+		@param chunk_size: number of data points per chunk (default: size of blocks)
+
+		@rtype: generator
+		@return: arrays containing up to C{chunk_size} data points
+		"""
+
+		if chunk_size is None:
+			for block in self._blocks:
+				yield asarray(block)
+		else:
+			for i in range(0, self.shape[1], chunk_size):
+				yield self[:, i:i + chunk_size]
+
+
+
+	def map(self, function):
+		"""
+		Creates a view of the data set which lazily applies a function to every chunk of
+		data points read from the data set. The function has to process data points
+		independently (e.g., a L{Transform}).
+
+		@type  function: function
+		@param function: maps data points stored in columns to other data points
+
+		@rtype: Dataset
+		@return: the transformed data set
+		"""
+
+		return _MappedDataset(self, function)
+
+
+
+	def __getitem__(self, key):
+		if not isinstance(key, tuple):
+			key = (key, slice(None))
+
+		if len(key) != 2:
+			raise IndexError('Too many indices.')
+
+		rows, columns = key
+
+		if isinstance(columns, (int, long, integer)):
+			return self._columns(asarray([columns]))[rows, 0]
+		return self._columns(columns)[rows]
+
+
+
+	def __array__(self, dtype=None):
+		if dtype is None:
+			return self[:, :]
+		return asarray(self[:, :], dtype=dtype)
+
+
+
+	def __getstate__(self):
+		# only the location of the data set is stored
+		return {'directory': self.directory, 'block_size': self.block_size}
+
+
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._open()
+
+
+
+	def _columns(self, columns):
+		"""
+		Reads data points into memory.
+		"""
+
+		if isinstance(columns, slice):
+			start, stop, step = columns.indices(self.shape[1])
+
+			if step == 1:
+				# avoid copying columns if slice is contained in a single block
+				b = searchsorted(self._offsets, start, 'right') - 1
+				if b >= 0 and stop <= self._offsets[b] + self._blocks[b].shape[1]:
+					return asarray(self._blocks[b][:, start - self._offsets[b]:stop - self._offsets[b]])
+
+			columns = arange(start, stop, step)
+
+		columns = asarray(columns)
+
+		if columns.dtype == bool:
+			columns = columns.nonzero()[0]
+
+		columns = columns.astype(int).ravel()
+		columns[columns < 0] += self.shape[1]
+
+		data = empty([self.shape[0], columns.size], dtype=self.dtype)
+
+		# block of each column
+		blocks = searchsorted(self._offsets, columns, 'right') - 1
+
+		for b in unique(blocks):
+			indices = (blocks == b).nonzero()[0]
+			data[:, indices] = self._blocks[b][:, columns[indices] - self._offsets[b]]
+
+		return data
+
+
+
+	def _open(self):
+		"""
+		Memory-maps all blocks found in the directory.
+		"""
+
+		self._blocks = [load(filename, mmap_mode='r')
+			for filename in sorted(glob(path.join(self.directory, 'block.*.npy')))]
+
+		if self._blocks:
+			self._offsets = cumsum([0] + [block.shape[1] for block in self._blocks[:-1]])
+			self._shape = (self._blocks[0].shape[0], sum(block.shape[1] for block in self._blocks))
+			self._dtype = self._blocks[0].dtype
+		else:
+			self._offsets = asarray([], dtype=int)
+			self._shape = (0, 0)
+			self._dtype = np_dtype('float64')
+
+
+
+	def _write(self, fr, data):
+		"""
+		Stores a block of data points such that the file either exists and is complete or
+		doesn't exist.
+		"""
+
+		filename = self._filename(fr)
+
+		with open(filename + '.tmp', 'wb') as handle:
+			save(handle, asfortranarray(data))
+		os.rename(filename + '.tmp', filename)
+
+
+
+	def _filename(self, fr):
+		return path.join(self.directory, 'block.{0:012d}.npy'.format(fr))
+
+
+
+class _MappedDataset(Dataset):
+	"""
+	A data set whose data points are transformed as they are read.
+	"""
+
+	def __init__(self, dataset, function):
+		self.dataset = dataset
+		self.function = function
+
+		# dimensionality and type of transformed data points
+		sample = function(dataset[:, :1])
+
+		self._shape = (sample.shape[0], dataset.shape[1])
+		self._dtype = sample.dtype
+
+
+
+	def append(self, data):
+		raise NotImplementedError('Transformed data sets cannot be modified.')
+
+
+
+	def chunks(self, chunk_size=None):
+		for chunk in self.dataset.chunks(chunk_size):
+			yield self.function(chunk)
+
+
+
+	def __getstate__(self):
+		return self.__dict__
+
+
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+
+
+
+	def _columns(self, columns):
+		if isinstance(columns, slice):
+			return self.function(self.dataset[:, columns])
+		return self.function(self.dataset._columns(columns))
+
+
+
+def _read(handle, dtype, count):
+	"""
+	Reads a number of array elements from a file-like object.
+	"""
+
+	return fromstring(handle.read(count * dtype.itemsize), dtype=dtype)
@@ -0,0 +1,282 @@
+"""
+Resumable evaluation of log-likelihoods on large test sets.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+import os
+
+from os import path
+from glob import glob
+from hashlib import sha1
+from cPickle import dumps
+from copy import deepcopy
+from numpy import load, savez, hstack, unique, mean, std, sqrt, asarray, ma
+from logsumexp import logmeanexp
+from sharedarray import asshared
+from mapp import mapp
+from rng import stream, spawn
+from dataset import Dataset
+
+class Evaluation(object):
+	"""
+	Estimates log-likelihoods of a model by splitting the test set into shards of data
+	points which are evaluated in parallel. Each shard is stored in a directory as soon
+	as it is finished, so that an interrupted evaluation can be resumed by creating an
+	evaluation with the same directory and running it again. Example:
+
+		>>> evaluation = Evaluation('results/evaluation/', model, data,
+		>>> 	num_samples=300, sampling_method=('ais', {'num_steps': 300}))
+		>>> evaluation.run()
+		>>> loglik, sem = evaluation.estimate()
+
+	The random numbers used for a shard only depend on the seed of the evaluation and
+	the position of the shard, so that resumed and uninterrupted evaluations give the
+	same results. An evaluation is only resumed if the model, the shard size and the
+	parameters passed to C{loglikelihood} are the same as those of the stored shards.
+	Models are compared by a fingerprint of their pickled state.
+
+	@type directory: string
+	@ivar directory: where shards and the merged importance weights are stored
+
+	@type shard_size: integer
+	@ivar shard_size: number of data points per shard
+
+	@type seed: integer
+	@ivar seed: seed from which the random streams of all shards are derived
+	"""
+
+	def __init__(self, directory, model, data, shard_size=None, **kwargs):
+		"""
+		@type  directory: string
+		@param directory: where shards will be stored
+
+		@type  model: Distribution
+		@param model: a model whose C{loglikelihood} method supports C{return_all}
+
+		@type  data: array_like/Dataset
+		@param data: test data stored in columns
+
+		@type  shard_size: integer
+		@param shard_size: number of data points per shard (default: 100 or stored value)
+
+		@param kwargs: parameters passed to C{loglikelihood} (e.g., C{num_samples})
+		"""
+
+		self.directory = directory
+		self.model = model
+		self.data = data
+		self.kwargs = kwargs
+
+		# make sure directory exists
+		try:
+			os.makedirs(directory)
+		except OSError:
+			pass
+
+		settings = path.join(directory, 'evaluation.npz')
+
+		if path.exists(settings):
+			# resume evaluation
+			settings = load(settings)
+
+			if settings['num_data_points'] != data.shape[1]:
+				raise ValueError('Directory contains an evaluation of a different data set.')
+
+			if shard_size is not None and shard_size != int(settings['shard_size']):
+				raise ValueError('Directory contains an evaluation with shard size {0}.'.format(
+					int(settings['shard_size'])))
+
+			if 'parameters' in settings and str(settings['parameters']) != _digest(kwargs):
+				raise ValueError('Directory contains an evaluation with different parameters: '
+					+ str(settings['description']))
+
+			if 'model' in settings and str(settings['model']) != _fingerprint(model):
+				raise ValueError('Directory contains an evaluation of a different model.')
+
+			self.shard_size = int(settings['shard_size'])
+			self.seed = int(settings['seed'])
+
+		else:
+			self.shard_size = shard_size or 100
+			self.seed = spawn()
+
+			_save(settings,
+				num_data_points=data.shape[1],
+				shard_size=self.shard_size,
+				seed=self.seed,
+				parameters=_digest(kwargs),
+				description=repr(kwargs),
+				model=_fingerprint(model))
+
+
+
+	def shards(self):
+		"""
+		Returns the first data point of every shard.
+
+		@rtype: list
+		@return: indices of data points
+		"""
+
+		return range(0, self.data.shape[1], self.shard_size)
+
+
+
+	def finished(self):
+		"""
+		Returns the first data point of every shard which has already been evaluated.
+
+		@rtype: list
+		@return: indices of data points
+		"""
+
+		return [fr for fr in self.shards() if path.exists(self._filename(fr))]
+
+
+
+	def run(self, max_processes=None):
+		"""
+		Evaluates all shards which haven't been evaluated yet.
+
+		@type  max_processes: integer
+		@param max_processes: overrides C{mapp.max_processes}
+
+		@rtype: integer
+		@return: number of evaluated shards
+		"""
+
+		finished = self.finished()
+		shards = [fr for fr in self.shards() if fr not in finished]
+
+		if not shards:
+			return 0
+
+		# workers only receive references to the data and read their shards themselves
+		data = self.data if isinstance(self.data, Dataset) else asshared(self.data)
+
+		# samplers store diagnostics in the model, which would change its fingerprint
+		model = deepcopy(self.model)
+
+		mapp(_evaluate, [model] * len(shards), [data] * len(shards),
+			[self._filename(fr) for fr in shards],
+			[self.seed] * len(shards), shards, [self.shard_size] * len(shards),
+			[self.kwargs] * len(shards),
+			max_processes=max_processes or mapp.max_processes)
+
+		return len(shards)
+
+
+
+	def merge(self):
+		"""
+		Combines the importance weights of all finished shards and stores them in a single
+		file in the evaluation's directory. If data points have different numbers of
+		importance weights (e.g., with the adaptive method of L{ISA.loglikelihood}), missing
+		weights are masked.
+
+		@rtype: tuple
+		@return: indices of evaluated data points and log-importance weights
+		"""
+
+		indices, ais_weights = [], []
+
+		for filename in glob(path.join(self.directory, 'shard.*.npz')):
+			shard = load(filename)
+			indices.append(shard['indices'])
+			ais_weights.append(ma.masked_array(shard['ais_weights'],
+				shard['mask'] if 'mask' in shard else False))
+
+		if not indices:
+			return asarray([], dtype=int), asarray([])
+
+		# shards with fewer importance weights are padded
+		num_weights = max(w.shape[0] for w in ais_weights)
+		ais_weights = [ma.vstack([w, ma.masked_all([num_weights - w.shape[0], w.shape[1]])])
+			for w in ais_weights]
+
+		# sort data points and make sure each data point is used only once
+		indices, idx = unique(hstack(indices), return_index=True)
+		ais_weights = ma.hstack(ais_weights)[:, idx]
+
+		_save(path.join(self.directory, 'ais_weights.npz'),
+			indices=indices,
+			ais_weights=ma.getdata(ais_weights),
+			mask=ma.getmaskarray(ais_weights))
+
+		if not ma.is_masked(ais_weights):
+			ais_weights = ma.getdata(ais_weights)
+
+		return indices, ais_weights
+
+
+
+	def estimate(self):
+		"""
+		Estimates the average log-likelihood of the evaluated data points.
+
+		@rtype: tuple
+		@return: average log-likelihood and its standard error (in nats)
+		"""
+
+		ais_weights = self.merge()[1]
+
+		if ma.is_masked(ais_weights):
+			loglik = asarray([logmeanexp(w.compressed()) for w in ais_weights.T])
+		else:
+			loglik = logmeanexp(ais_weights, 0)
+
+		return mean(loglik), std(loglik, ddof=1) / sqrt(loglik.size)
+
+
+
+	def _filename(self, fr):
+		return path.join(self.directory, 'shard.{0:08d}.npz'.format(fr))
+
+
+
+def _evaluate(model, data, filename, seed, fr, shard_size, kwargs):
+	"""
+	Evaluates a single shard and stores the results.
+	"""
+
+	data = data[:, fr:fr + shard_size]
+
+	with stream(seed, fr):
+		ais_weights = model.loglikelihood(data, return_all=True, **kwargs)
+
+	_save(filename,
+		indices=range(fr, fr + data.shape[1]),
+		ais_weights=ma.getdata(ais_weights),
+		mask=ma.getmaskarray(ais_weights))
+
+
+
+def _digest(kwargs):
+	"""
+	Computes a fingerprint of the parameters passed to C{loglikelihood}.
+	"""
+
+	return sha1(dumps(sorted(kwargs.items()), 2)).hexdigest()
+
+
+
+def _fingerprint(model):
+	"""
+	Computes a fingerprint of the state of a model.
+	"""
+
+	return sha1(dumps(model, 2)).hexdigest()
+
+
+
+def _save(filename, **kwargs):
+	"""
+	Stores arrays such that the file either exists and is complete or doesn't exist.
+	"""
+
+	with open(filename + '.tmp', 'wb') as handle:
+		savez(handle, **kwargs)
+	os.rename(filename + '.tmp', filename)
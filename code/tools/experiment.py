@@ -7,7 +7,7 @@ Manage and display experimental results.
 __license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
 __author__ = 'Lucas Theis <lucas@tuebingen.mpg.de>'
 __docformat__ = 'epytext'
-__version__ = '0.4.1'
+__version__ = '0.5.0'
 
 import sys
 import os
@@ -18,20 +18,44 @@ import socket
 sys.path.append('./code')
 
 from argparse import ArgumentParser
-from pickle import Unpickler, dump
+from pickle import Unpickler
+from cPickle import dumps, HIGHEST_PROTOCOL
+from struct import pack, unpack
 from subprocess import Popen, PIPE
 from os import path
 from warnings import warn
-from time import time, strftime, localtime
-from numpy import random, ceil, argsort
+from time import time, strftime, localtime, sleep
+from numpy import random, ceil, argsort, ndarray, memmap
 from numpy.random import rand, randint
+import rng
 from distutils.version import StrictVersion
 from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from threading import Thread, Lock, Condition
+from atexit import register
+from ast import literal_eval
+from cgi import escape
+import json
 from httplib import HTTPConnection
 from getopt import getopt
 
+# identifies files written by this version
+MAGIC = '\x93XPCK\x00\x05\x00'
+
+# results larger than this are stored in separate blocks
+MAX_HEADER_BYTES = 4096
+
+# blocks start at multiples of this number of bytes
+BLOCK_ALIGNMENT = 64
+
 class Experiment:
 	"""
+	Experiments are stored in a small header containing the metadata and small results,
+	followed by blocks containing large results. Arrays are stored as raw blocks which are
+	memory-mapped, other large results are pickled. When an experiment is loaded, only the
+	header is read; blocks are loaded on first access via C{experiment[key]}. Files
+	written by older versions are still supported.
+
 	@type time: float
 	@ivar time: time at initialization of experiment
 
@@ -153,6 +177,7 @@ class Experiment:
 		# set random seed
 		random.seed(self.seed)
 		numpy.random.seed(self.seed)
+		rng.seed(self.seed)
 
 		if self.filename:
 			# load given experiment
@@ -236,28 +261,26 @@ class Experiment:
 
 
 	def status(self, status, **kwargs):
+		"""
+		Reports the status of the experiment to the server. The message is sent by a
+		background thread (see L{StatusReporter}), so this method never blocks.
+
+		@type  status: string
+		@param status: C{'running'}, C{'PROGRESS'}, C{'METRICS'}, C{'SAVE'} or C{None} (finished)
+		"""
+
 		if self.server:
-			try:
-				conn = HTTPConnection(self.server, self.port)
-				conn.request('GET', '/version/')
-				resp = conn.getresponse()
-
-				if not resp.read().startswith('Experiment'):
-					raise RuntimeError()
-
-				HTTPConnection(self.server, self.port).request('POST', '', str(dict({
-						'id': self.id,
-						'version': __version__,
-						'status': status,
-						'hostname': self.hostname,
-						'cwd': self.cwd,
-						'script_path': self.script_path,
-						'script': self.script,
-						'comment': self.comment,
-						'time': self.time,
-					}, **kwargs)))
-			except:
-				warn('Unable to connect to \'{0}:{1}\'.'.format(self.server, self.port))
+			StatusReporter.get(self.server, self.port).report(dict({
+					'id': self.id,
+					'version': __version__,
+					'status': status,
+					'hostname': self.hostname,
+					'cwd': self.cwd,
+					'script_path': self.script_path,
+					'script': self.script,
+					'comment': self.comment,
+					'time': self.time,
+				}, **kwargs))
 
 
 
@@ -306,26 +329,26 @@ class Experiment:
 				warn(''.join(pieces) + ' already exists. Saving to ' + filename + '.')
 
 		# store experiment
-		with open(filename, 'wb') as handle:
-			dump({
+		_write(filename, {
 				'version': __version__,
 				'id': self.id,
 				'time': self.time,
 				'seed': self.seed,
 				'duration': self.duration,
-				'environ': self.environ,
 				'hostname': self.hostname,
 				'cwd': self.cwd,
 				'argv': self.argv,
-				'script': self.script,
 				'script_path': self.script_path,
-				'processors': self.processors,
 				'platform': self.platform,
 				'comment': self.comment,
 				'commit': self.commit,
 				'modified': self.modified,
 				'versions': self.versions,
-				'results': self.results}, handle, 1)
+			}, {
+				'environ': self.environ,
+				'script': self.script,
+				'processors': self.processors,
+			}, self.results)
 
 		self.status('SAVE', filename=filename, duration=self.duration)
 
@@ -343,6 +366,27 @@ class Experiment:
 			self.filename = filename
 
 		with open(self.filename, 'rb') as handle:
+			if handle.read(len(MAGIC)) == MAGIC:
+				# only read header, blocks are loaded on first access
+				header = _read_header(self.filename, handle)
+
+				self.__dict__.update(header['metadata'])
+				self.results = header['results']
+
+				# large attributes are loaded on first access
+				self._attributes = {}
+
+				for name, value in header['attributes'].items():
+					if isinstance(value, _Block):
+						self._attributes[name] = value
+						self.__dict__.pop(name, None)
+					else:
+						setattr(self, name, value)
+
+				return
+
+			# experiment stored by an older version
+			handle.seek(0)
 			res = load(handle)
 
 			self.time = res['time']
@@ -371,8 +415,26 @@ class Experiment:
 
 
 
+	def __getattr__(self, name):
+		attributes = self.__dict__.get('_attributes', {})
+
+		if name in attributes:
+			# load large attribute on first access
+			setattr(self, name, attributes.pop(name).load())
+			return getattr(self, name)
+
+		raise AttributeError(name)
+
+
+
 	def __getitem__(self, key):
-		return self.results[key]
+		value = self.results[key]
+
+		if isinstance(value, _Block):
+			# load result on first access
+			value = self.results[key] = value.load()
+
+		return value
 
 
 
@@ -381,14 +443,228 @@ class Experiment:
 
 
 
+class StatusReporter(object):
+	"""
+	Sends status messages to a server in a background thread. Messages are queued and
+	sent in batches over a persistent connection. A progress update replaces older
+	progress updates of the same experiment which have not been sent yet. If the server
+	cannot be reached, queued messages are dropped and no new connection is attempted for
+	C{retry} seconds. The queue is bounded, so that the oldest messages are dropped if
+	the server cannot keep up.
+
+	@type server: string
+	@ivar server: hostname of the server
+
+	@type port: integer
+	@ivar port: port of the server
+	"""
+
+	# reporters shared by all experiments
+	reporters = {}
+	lock = Lock()
+
+	def __init__(self, server, port, max_queue=100, timeout=2., retry=30.):
+		"""
+		@type  max_queue: integer
+		@param max_queue: maximal number of queued messages
+
+		@type  timeout: float
+		@param timeout: seconds to wait for the server
+
+		@type  retry: float
+		@param retry: seconds to wait before trying to reach an unreachable server again
+		"""
+
+		self.server = server
+		self.port = port
+		self.max_queue = max_queue
+		self.timeout = timeout
+		self.retry = retry
+
+		self._queue = []
+		self._sending = False
+		self._closed = False
+		self._condition = Condition()
+		self._connection = None
+		self._unreachable = 0.
+
+		self._thread = Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+
+
+	@staticmethod
+	def get(server, port):
+		"""
+		Returns the reporter for the given server, creating it if necessary.
+
+		@rtype: StatusReporter
+		@return: a running reporter
+		"""
+
+		with StatusReporter.lock:
+			if (server, port) not in StatusReporter.reporters:
+				StatusReporter.reporters[server, port] = StatusReporter(server, port)
+			return StatusReporter.reporters[server, port]
+
+
+
+	def report(self, message):
+		"""
+		Queues a message without waiting for it to be sent.
+
+		@type  message: dict
+		@param message: status of an experiment
+		"""
+
+		with self._condition:
+			if self._closed:
+				return
+
+			if message['status'] == 'PROGRESS':
+				# only the latest progress of an experiment is of interest
+				self._queue = [m for m in self._queue
+					if m['status'] != 'PROGRESS' or m['id'] != message['id']]
+
+			self._queue.append(message)
+			del self._queue[:-self.max_queue]
+
+			self._condition.notify()
+
+
+
+	def flush(self, timeout=1.):
+		"""
+		Waits until all queued messages have been sent or dropped.
+
+		@type  timeout: float
+		@param timeout: maximal number of seconds to wait
+		"""
+
+		deadline = time() + timeout
+
+		with self._condition:
+			while (self._queue or self._sending) and time() < deadline:
+				self._condition.wait(deadline - time())
+
+
+
+	def close(self, timeout=1.):
+		"""
+		Sends remaining messages and stops the background thread.
+
+		@type  timeout: float
+		@param timeout: maximal number of seconds to wait
+		"""
+
+		self.flush(timeout)
+
+		with self._condition:
+			self._closed = True
+			self._condition.notify_all()
+
+		self._thread.join(timeout)
+
+
+
+	def _run(self):
+		while True:
+			with self._condition:
+				while not self._queue and not self._closed:
+					self._condition.wait()
+
+				if self._closed:
+					return
+
+				messages, self._queue = self._queue, []
+				self._sending = True
+
+			if time() - self._unreachable > self.retry:
+				try:
+					self._send(messages)
+				except Exception:
+					# drop messages and don't try again for a while
+					self._unreachable = time()
+					self._connection = None
+
+			with self._condition:
+				self._sending = False
+				self._condition.notify_all()
+
+
+
+	def _send(self, messages):
+		"""
+		Posts a batch of messages, reusing the connection to the server if possible.
+		"""
+
+		for attempt in range(2):
+			if self._connection is None:
+				self._connection = HTTPConnection(self.server, self.port, timeout=self.timeout)
+
+				# make sure the server is an experiment server
+				self._connection.request('GET', '/version/')
+				if not self._connection.getresponse().read().startswith('Experiment'):
+					raise RuntimeError('Unknown server.')
+
+			try:
+				self._connection.request('POST', '/', json.dumps(messages),
+					{'Content-Type': 'application/json'})
+				self._connection.getresponse().read()
+				return
+
+			except Exception:
+				# server might have closed the connection
+				self._connection = None
+
+				if attempt:
+					raise
+
+
+
+@register
+def _close_reporters():
+	"""
+	Gives reporters a chance to send the last messages before the interpreter exits.
+	"""
+
+	for reporter in StatusReporter.reporters.values():
+		reporter.close()
+
+
+
+class ExperimentServer(ThreadingMixIn, HTTPServer):
+	"""
+	Handles each request in a separate thread, so that slow clients and many experiments
+	reporting their status do not delay each other.
+	"""
+
+	daemon_threads = True
+
+
+
 class ExperimentRequestHandler(BaseHTTPRequestHandler):
 	"""
 	Renders HTML showing running and finished experiments.
+
+	Experiments report their status by posting JSON objects. Saved experiments are listed
+	using an L{ExperimentIndex} of the directories in C{xpck_path} and C{XPCK_PATH}.
 	"""
 
 	xpck_path = ''
 	running = {}
 	finished = {}
+	index = None
+
+	# number of training records shown per model
+	max_records = 20
+
+	# keep connections of reporters alive
+	protocol_version = 'HTTP/1.1'
+
+	# protects running and finished experiments
+	lock = Lock()
 
 	def do_GET(self):
 		"""
@@ -398,18 +674,38 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 		# number of bars representing progress
 		max_bars = 20
 
+		# pages are rendered from a snapshot, so that status updates are never blocked
+		with ExperimentRequestHandler.lock:
+			running = dict(ExperimentRequestHandler.running)
+			finished = dict(ExperimentRequestHandler.finished)
+
+		index = ExperimentRequestHandler.index
+
+		if index is not None:
+			# experiments which have been saved but did not report to this server
+			saved = index.experiments()
+			saved.update(finished)
+			finished = saved
+
+		if self.path != '/version/':
+			# the length of pages is not known in advance
+			self.close_connection = 1
+
 		if self.path == '/version/':
+			version = 'Experiment {0}'.format(__version__)
+
 			self.send_response(200)
 			self.send_header('Content-type', 'text/plain')
+			self.send_header('Content-Length', str(len(version)))
 			self.end_headers()
 
-			self.wfile.write('Experiment {0}'.format(__version__))
+			self.wfile.write(version)
 
 		elif self.path.startswith('/running/'):
 			id = int([s for s in self.path.split('/') if s != ''][-1])
 
 			# display running experiment
-			if id in ExperimentRequestHandler.running:
+			if id in running:
 				self.send_response(200)
 				self.send_header('Content-type', 'text/html')
 				self.end_headers()
@@ -417,7 +713,7 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 				self.wfile.write(HTML_HEADER)
 				self.wfile.write('<h2>Experiment</h2>')
 
-				instance = ExperimentRequestHandler.running[id]
+				instance = running[id]
 
 				num_bars = int(instance['progress']) * max_bars / 100
 
@@ -434,11 +730,14 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 					instance['comment']  if instance['comment'] else '-'))
 				self.wfile.write('</table>')
 
+				for model, records in sorted(instance['metrics'].items()):
+					self._write_records(model, records)
+
 				self.wfile.write('<h2>Script</h2>')
 				self.wfile.write('<pre>{0}</pre>'.format(instance['script']))
 				self.wfile.write(HTML_FOOTER)
 
-			elif id in ExperimentRequestHandler.finished:
+			elif id in finished:
 				self.send_response(302)
 				self.send_header('Location', '/finished/{0}/'.format(id))
 				self.end_headers()
@@ -463,11 +762,11 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 			id = int([s for s in self.path.split('/') if s != ''][-1])
 
 			# display finished experiment
-			if id in ExperimentRequestHandler.finished:
-				instance = ExperimentRequestHandler.finished[id]
+			if id in finished:
+				instance = finished[id]
 
-				if id in ExperimentRequestHandler.running:
-					progress = ExperimentRequestHandler.running[id]['progress']
+				if id in running:
+					progress = running[id]['progress']
 				else:
 					progress = 100
 
@@ -485,7 +784,7 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 				self.wfile.write('<tr><th>Start:</th><td>{0}</td></tr>'.format(
 					strftime('%a, %d %b %Y %H:%M:%S', localtime(instance['time']))))
 				self.wfile.write('<tr><th>End:</th><td>{0}</td></tr>'.format(
-					strftime('%a, %d %b %Y %H:%M:%S', localtime(instance['duration']))))
+					strftime('%a, %d %b %Y %H:%M:%S', localtime(instance['time'] + instance['duration']))))
 				self.wfile.write('<tr><th>Comment:</th><td>{0}</td></tr>'.format(
 					instance['comment']  if instance['comment'] else '-'))
 				self.wfile.write('</table>')
@@ -493,17 +792,23 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 				self.wfile.write('<h2>Results</h2>')
 
 				try:
-					experiment = Experiment(os.path.join(instance['cwd'], instance['filename']))
+					filename = os.path.join(instance['cwd'], instance['filename'])
+
+					if index is not None:
+						results = index.summarize(filename)['results']
+					else:
+						results = _summarize(filename)['results']
 				except:
 					self.wfile.write('Could not open file.')
 				else:
 					self.wfile.write('<table>')
-					for key, value in experiment.results.items():
-						self.wfile.write('<tr><th>{0}</th><td>{1}</td></tr>'.format(key, value))
+					for key, value in sorted(results.items()):
+						self.wfile.write('<tr><th>{0}</th><td>{1}</td></tr>'.format(key, escape(value)))
 					self.wfile.write('</table>')
 
-				self.wfile.write('<h2>Script</h2>')
-				self.wfile.write('<pre>{0}</pre>'.format(instance['script']))
+				if instance.get('script', None):
+					self.wfile.write('<h2>Script</h2>')
+					self.wfile.write('<pre>{0}</pre>'.format(instance['script']))
 
 
 			else:
@@ -513,17 +818,6 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 			self.wfile.write(HTML_FOOTER)
 
 		else:
-			files = []
-
-			if 'xpck_path' in ExperimentRequestHandler.__dict__:
-				if ExperimentRequestHandler.xpck_path != '':
-					for path in ExperimentRequestHandler.xpck_path.split(':'):
-						files += [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.xpck')]
-				
-			if 'XPCK_PATH' in os.environ:
-				for path in os.environ['XPCK_PATH'].split(':'):
-					files += [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.xpck')]
-
 			self.send_response(200)
 			self.send_header('Content-type', 'text/html')
 			self.end_headers()
@@ -532,7 +826,7 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 			self.wfile.write('<h2>Running</h2>')
 
 			# display running experiments
-			if ExperimentRequestHandler.running:
+			if running:
 				self.wfile.write('<table>')
 				self.wfile.write('<tr>')
 				self.wfile.write('<th>Experiment</th>')
@@ -544,12 +838,12 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 				self.wfile.write('</tr>')
 
 				# sort ids by start time of experiment 
-				times = [instance['time'] for instance in ExperimentRequestHandler.running.values()]
-				ids = ExperimentRequestHandler.running.keys()
+				times = [instance['time'] for instance in running.values()]
+				ids = running.keys()
 				ids = [ids[i] for i in argsort(times)][::-1]
 
 				for id in ids:
-					instance = ExperimentRequestHandler.running[id]
+					instance = running[id]
 					num_bars = int(instance['progress']) * max_bars / 100
 
 					self.wfile.write('<tr>')
@@ -573,7 +867,7 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 			self.wfile.write('<h2>Saved</h2>')
 
 			# display saved experiments
-			if ExperimentRequestHandler.finished:
+			if finished:
 				self.wfile.write('<table>')
 				self.wfile.write('<tr>')
 				self.wfile.write('<th>Results</th>')
@@ -586,15 +880,15 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 
 				# sort ids by start time of experiment 
 				times = [instance['time'] + instance['duration']
-					for instance in ExperimentRequestHandler.finished.values()]
-				ids = ExperimentRequestHandler.finished.keys()
+					for instance in finished.values()]
+				ids = finished.keys()
 				ids = [ids[i] for i in argsort(times)][::-1]
 
 				for id in ids:
-					instance = ExperimentRequestHandler.finished[id]
+					instance = finished[id]
 
-					if id in ExperimentRequestHandler.running:
-						progress = ExperimentRequestHandler.running[id]['progress']
+					if id in running:
+						progress = running[id]['progress']
 					else:
 						progress = 100
 
@@ -624,35 +918,278 @@ class ExperimentRequestHandler(BaseHTTPRequestHandler):
 
 
 	def do_POST(self):
+		"""
+		Processes status updates of experiments.
+		"""
+
+		message = self.rfile.read(int(self.headers['Content-Length']))
+
+		try:
+			instances = json.loads(message)
+		except ValueError:
+			# status reported by an older version
+			try:
+				instances = literal_eval(message)
+			except (ValueError, SyntaxError):
+				self.send_response(400)
+				self.send_header('Content-Length', '0')
+				self.end_headers()
+				return
+
+		self.send_response(204)
+		self.send_header('Content-Length', '0')
+		self.end_headers()
+
+		if isinstance(instances, dict):
+			instances = [instances]
+
+		with ExperimentRequestHandler.lock:
+			for instance in instances:
+				self._update(instance)
+
+
+
+	def end_headers(self):
+		if self.close_connection:
+			self.send_header('Connection', 'close')
+		BaseHTTPRequestHandler.end_headers(self)
+
+
+
+	def _write_records(self, model, records):
+		"""
+		Renders a table of the most recent training records of a model.
+		"""
+
+		keys = sorted(set(key for record in records for key in record) - set(['model', 'time']))
+
+		self.wfile.write('<h2>Training ({0})</h2>'.format(model))
+		self.wfile.write('<table class="metrics">')
+		self.wfile.write('<tr><th>Time</th>{0}</tr>'.format(
+			''.join('<th>{0}</th>'.format(key) for key in keys)))
+
+		for record in reversed(records):
+			self.wfile.write('<tr><td>{0}</td>{1}</tr>'.format(
+				strftime('%H:%M:%S', localtime(record['time'])),
+				''.join('<td>{0}</td>'.format(_format(record.get(key, '-'))) for key in keys)))
+
+		self.wfile.write('</table>')
+
+
+
+	def _update(self, instance):
+		"""
+		Updates the state of an experiment.
+		"""
+
 		instances = ExperimentRequestHandler.running
-		instance = eval(self.rfile.read(int(self.headers['Content-Length'])))
-		
-		if instance['status'] is 'PROGRESS':
+
+		if instance['status'] in ['PROGRESS', 'METRICS']:
 			if instance['id'] not in instances:
-				instances[instance['id']] = instance
-				instances[instance['id']]['status'] = 'running'
-			instances[instance['id']]['progress'] = instance['progress']
+				instances[instance['id']] = dict(instance, status='running', progress=0, metrics={})
 
-		elif instance['status'] is 'SAVE':
+			if instance['status'] == 'PROGRESS':
+				instances[instance['id']]['progress'] = instance['progress']
+
+			else:
+				# most recent records of each model
+				record = instance['record']
+				records = instances[instance['id']]['metrics'].setdefault(record.get('model', '-'), [])
+				records.append(record)
+				del records[:-ExperimentRequestHandler.max_records]
+
+		elif instance['status'] == 'SAVE':
 			ExperimentRequestHandler.finished[instance['id']] = instance
 			ExperimentRequestHandler.finished[instance['id']]['status'] = 'saved'
 
 		else:
 			if instance['id'] in instances:
 				progress = instances[instance['id']]['progress']
+				metrics = instances[instance['id']]['metrics']
 			else:
 				progress = 0
+				metrics = {}
 			instances[instance['id']] = instance
 			instances[instance['id']]['progress'] = progress
+			instances[instance['id']]['metrics'] = metrics
 
 		if instance['status'] is None:
+			instances.pop(instance['id'], None)
+
+
+
+class ExperimentIndex(object):
+	"""
+	Keeps track of the metadata of experiments stored in a list of directories. Directories
+	are only listed again if they have changed, and only the headers of new or modified
+	files are read. The index of each directory is stored in the directory, so that it
+	survives restarts of the server.
+
+	@type paths: list
+	@ivar paths: directories containing C{.xpck} files
+	"""
+
+	# name of files storing the index of a directory
+	INDEX_FILE = '.xpck_index.json'
+
+	def __init__(self, paths):
+		"""
+		@type  paths: list
+		@param paths: directories containing C{.xpck} files
+		"""
+
+		self.paths = paths
+
+		# maps directories to modification times and entries of files
+		self._directories = {}
+		self._lock = Lock()
+
+		for directory in paths:
 			try:
-				del instances[instance['id']]
-			except:
+				with open(path.join(directory, ExperimentIndex.INDEX_FILE)) as handle:
+					self._directories[directory] = json.load(handle)
+			except (IOError, ValueError):
 				pass
 
 
 
+	def update(self):
+		"""
+		Updates the index of all directories which have changed.
+		"""
+
+		for directory in self.paths:
+			try:
+				mtime = os.stat(directory).st_mtime
+			except OSError:
+				continue
+
+			index = self._directories.get(directory, {'mtime': None, 'files': {}})
+
+			if index['mtime'] == mtime:
+				continue
+
+			files = {}
+
+			for filename in os.listdir(directory):
+				if not filename.endswith('.xpck'):
+					continue
+
+				entry = index['files'].get(filename, None)
+
+				try:
+					stat = os.stat(path.join(directory, filename))
+
+					if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+						entry = _summarize(path.join(directory, filename))
+						entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+
+				except Exception:
+					# ignore incomplete or corrupted files
+					continue
+
+				files[filename] = entry
+
+			index = {'mtime': mtime, 'files': files}
+
+			try:
+				with open(path.join(directory, ExperimentIndex.INDEX_FILE) + '.tmp', 'w') as handle:
+					json.dump(index, handle)
+				os.rename(
+					path.join(directory, ExperimentIndex.INDEX_FILE) + '.tmp',
+					path.join(directory, ExperimentIndex.INDEX_FILE))
+
+				# writing the index changes the directory, which should not trigger another
+				# update unless experiments were added, removed or overwritten in the meantime;
+				# the directory is examined before its files, so that later changes are noticed
+				mtime = os.stat(directory).st_mtime
+
+				stats = {}
+				for filename in os.listdir(directory):
+					if filename.endswith('.xpck'):
+						stat = os.stat(path.join(directory, filename))
+						stats[filename] = (stat.st_mtime, stat.st_size)
+
+				if stats == dict((filename, (entry['mtime'], entry['size']))
+						for filename, entry in files.items()):
+					index['mtime'] = mtime
+
+			except (IOError, OSError):
+				pass
+
+			with self._lock:
+				self._directories[directory] = index
+
+
+
+	def watch(self, interval=5.):
+		"""
+		Updates the index in a background thread.
+
+		@type  interval: float
+		@param interval: seconds between updates
+		"""
+
+		def run():
+			while True:
+				try:
+					self.update()
+				except Exception as error:
+					warn(str(error))
+				sleep(interval)
+
+		thread = Thread(target=run)
+		thread.daemon = True
+		thread.start()
+
+
+
+	def experiments(self):
+		"""
+		Returns metadata of all indexed experiments.
+
+		@rtype: dict
+		@return: maps experiment ids to metadata
+		"""
+
+		experiments = {}
+
+		with self._lock:
+			for directory, index in self._directories.items():
+				for filename, entry in index['files'].items():
+					if entry['id'] is not None:
+						experiments[entry['id']] = dict(entry,
+							filename=path.join(directory, filename), status='saved')
+
+		return experiments
+
+
+
+	def summarize(self, filename):
+		"""
+		Returns the metadata of an experiment, reading the file only if it is not indexed
+		or has changed.
+
+		@type  filename: string
+		@param filename: path to an experiment
+
+		@rtype: dict
+		@return: metadata and descriptions of results
+		"""
+
+		directory, name = path.split(filename)
+		stat = os.stat(filename)
+
+		with self._lock:
+			entry = self._directories.get(directory, {'files': {}})['files'].get(name, None)
+
+		if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+			entry = _summarize(filename)
+
+		return entry
+
+
+
 class XUnpickler(Unpickler):
 	"""
 	An extension of the Unpickler class which resolves some backwards
@@ -680,6 +1217,169 @@ class XUnpickler(Unpickler):
 
 def load(file):
 	return XUnpickler(file).load()
+
+
+
+class _Block(object):
+	"""
+	Refers to a result stored in a block of an experiment file.
+	"""
+
+	def __init__(self, filename, offset, size, description, array=None):
+		self.filename = filename
+		self.offset = offset
+		self.size = size
+		self.description = description
+		self.array = array
+
+
+
+	def load(self):
+		if self.array is not None:
+			dtype, shape, fortran_order = self.array
+
+			if not shape or 0 in shape:
+				return numpy.empty(shape, dtype=dtype)
+
+			# copy-on-write, so that results can be modified
+			data = memmap(self.filename, dtype=dtype, mode='c', offset=self.offset,
+				shape=shape[::-1] if fortran_order else shape)
+			return data.T if fortran_order else data
+
+		with open(self.filename, 'rb') as handle:
+			handle.seek(self.offset)
+			return load(handle)
+
+
+
+	def __str__(self):
+		return '<{0}>'.format(self.description)
+
+	__repr__ = __str__
+
+
+
+def _summarize(filename):
+	"""
+	Extracts metadata and short descriptions of results from an experiment file.
+	"""
+
+	with open(filename, 'rb') as handle:
+		if handle.read(len(MAGIC)) == MAGIC:
+			header = _read_header(filename, handle)
+			metadata, results = header['metadata'], header['results']
+
+		else:
+			# experiment stored by an older version
+			handle.seek(0)
+			metadata = load(handle)
+			results = metadata['results']
+
+	return {
+		'id': metadata.get('id', None),
+		'time': metadata['time'],
+		'duration': metadata['duration'],
+		'comment': metadata['comment'],
+		'hostname': metadata.get('hostname', None),
+		'cwd': '',
+		'script_path': metadata.get('script_path', None),
+		'results': dict((str(key), str(value)[:500]) for key, value in results.items())}
+
+
+
+def _format(value):
+	"""
+	Formats a value of a training record for display.
+	"""
+
+	if isinstance(value, float):
+		return '{0:.4g}'.format(value)
+	return str(value)
+
+
+
+def _write(filename, metadata, attributes, results):
+	"""
+	Stores metadata and small results in a header followed by blocks of large results.
+	"""
+
+	header = {'metadata': metadata, 'attributes': {}, 'results': {},
+		'blocks': {'attributes': {}, 'results': {}}}
+	blocks = []
+	offset = 0
+
+	for group, values in [('attributes', attributes), ('results', results)]:
+		for key, value in values.items():
+			if isinstance(value, _Block):
+				# result has not been loaded
+				value = value.load()
+
+			if isinstance(value, ndarray) and not value.dtype.hasobject:
+				if value.nbytes <= MAX_HEADER_BYTES:
+					header[group][key] = numpy.array(value)
+					continue
+
+				fortran_order = value.flags.f_contiguous and not value.flags.c_contiguous
+				data = numpy.ascontiguousarray(value.T if fortran_order else value)
+				description = 'ndarray {0} {1}'.format(value.dtype, value.shape)
+				array = (value.dtype, value.shape, fortran_order)
+
+			else:
+				data = dumps(value, HIGHEST_PROTOCOL)
+
+				if len(data) <= MAX_HEADER_BYTES:
+					header[group][key] = value
+					continue
+
+				description = '{0}, {1} bytes'.format(type(value).__name__, len(data))
+				array = None
+
+			size = data.nbytes if array else len(data)
+			header['blocks'][group][key] = (offset, size, description, array)
+			blocks.append((offset, data))
+
+			# align blocks so that arrays can be mapped efficiently
+			offset += size + (-size) % BLOCK_ALIGNMENT
+
+	header = dumps(header, HIGHEST_PROTOCOL)
+
+	# blocks start after header
+	start = len(MAGIC) + 8 + len(header)
+	start += (-start) % BLOCK_ALIGNMENT
+
+	# results may be memory-mapped from the file which is replaced
+	with open(filename + '.tmp', 'wb') as handle:
+		handle.write(MAGIC)
+		handle.write(pack('<Q', len(header)))
+		handle.write(header)
+
+		for offset, data in blocks:
+			handle.seek(start + offset)
+			if isinstance(data, ndarray):
+				data.tofile(handle)
+			else:
+				handle.write(data)
+
+	os.rename(filename + '.tmp', filename)
+
+
+
+def _read_header(filename, handle):
+	"""
+	Reads the header of an experiment file and creates references to its blocks.
+	"""
+
+	size = unpack('<Q', handle.read(8))[0]
+	header = XUnpickler(handle).load()
+
+	start = len(MAGIC) + 8 + size
+	start += (-start) % BLOCK_ALIGNMENT
+
+	for group, blocks in header.pop('blocks').items():
+		for key, (offset, size, description, array) in blocks.items():
+			header[group][key] = _Block(filename, start + offset, size, description, array)
+
+	return header
 		
 
 
@@ -698,10 +1398,17 @@ def main(argv):
 	if '--server' in optlist:
 		try:
 			ExperimentRequestHandler.xpck_path = optlist.get('--path', '')
-			port = optlist.get('--port', 8000)
+			port = int(optlist.get('--port', 8000))
+
+			# directories containing saved experiments
+			paths = ExperimentRequestHandler.xpck_path.split(':') \
+				+ os.environ.get('XPCK_PATH', '').split(':')
+
+			ExperimentRequestHandler.index = ExperimentIndex([p for p in paths if p])
+			ExperimentRequestHandler.index.watch()
 
 			# start server
-			server = HTTPServer(('', port), ExperimentRequestHandler)
+			server = ExperimentServer(('', port), ExperimentRequestHandler)
 			server.serve_forever()
 
 		except KeyboardInterrupt:
@@ -1,6 +1,6 @@
 from numpy import meshgrid, linspace, pi, exp, square, sin, cos, abs, sqrt
 from numpy import min, max, arctan2, argmax
-from numpy.random import rand
+from rng import rand
 from numpy.fft import fft2, fftshift
 
 def gaborf(size, complex=True, f=None, a=None, s=None, t=None, x=None, y=None, p=None):
@@ -1,74 +1,261 @@
 __license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
 __author__ = 'Lucas Theis <lucas@theis.io>'
 __docformat__ = 'epytext'
-__version__ = '0.4.0'
+__version__ = '0.5.0'
 
-from multiprocessing import Process, Queue, cpu_count
+from multiprocessing import Process, Queue, Pool, cpu_count, current_process
+from multiprocessing.pool import ThreadPool
+from threading import current_thread
 from random import randint, seed as py_seed
+from cPickle import dumps, loads, PicklingError
+from atexit import register
+from itertools import count
+from rng import stream, spawn
+from sharedarray import by_reference
 
 try:
 	from numpy.random import seed as np_seed
 except ImportError:
 	np_seed = lambda rseed: None
 
-def mapp(function, *args):
+def mapp(function, *args, **kwargs):
 	"""
 	A parallel implementation of map. Example:
 
 		>>> mapp(lambda x, y: x + y, range(10), range(10))
 
+	The backend is selected via C{mapp.backend} or the C{backend} keyword argument:
+
+		- C{'serial'}: equivalent to C{map}
+		- C{'threads'}: functions run in a pool of threads; this avoids copying data
+		and allows writing to ordinary arrays, but only pays off if most of the time
+		is spent in code which releases the GIL (e.g., BLAS and LAPACK)
+		- C{'processes'}: functions which can be pickled (i.e., functions defined at
+		the top level of a module) are dispatched in chunks to a pool of worker
+		processes; other functions, like closures, are executed by freshly forked
+		processes, which also allows them to write to shared memory (see L{asshmarray})
+		- C{'auto'}: uses threads for functions marked with L{releases_gil} and
+		processes otherwise
+
+	Pools are kept alive between calls. Each function call draws random numbers (via
+	L{rng}) from its own stream, which is derived from the caller's stream and the position
+	of the arguments. Results therefore neither depend on the backend nor on the number of
+	processes. Worker processes additionally seed NumPy's and Python's global random state.
+
 	@type  function: function
 	@param function: the function that will be applied to the given arguments
 
+	@type  max_processes: integer
+	@param max_processes: overrides C{mapp.max_processes} for this call
+
+	@type  backend: string
+	@param backend: overrides C{mapp.backend} for this call
+
 	@rtype: list
 	@return: an ordered list of the function's return values
 	"""
 
-	if mapp.max_processes < 2:
-		return map(function, *args)
+	max_processes = kwargs.get('max_processes', mapp.max_processes)
+	backend = kwargs.get('backend', mapp.backend)
+
+	if backend not in ['serial', 'threads', 'processes', 'auto']:
+		raise ValueError('Unknown backend \'{0}\'.'.format(backend))
 
 	if len(args) < 1:
 		raise TypeError('mapp() takes at least 2 arguments')
 
-	def run(function, queue, indices, rseed, *args):
-		# randomize
-		np_seed(rseed)
-		py_seed(rseed)
+	# random streams of all function calls are derived from this seed
+	base = spawn()
 
-		# compute and store results
-		queue.put(dict(zip(indices, map(function, *args))))
+	# daemonic processes (e.g., pool workers) are not allowed to have children,
+	# nested calls from threads are processed sequentially
+	if backend == 'serial' or max_processes < 2 or current_process().daemon \
+		or current_thread().name != 'MainThread':
+		return _run((function, None, base, count()) + args)
 
 	# number of arguments and number of processes
 	num_args = len(args[0])
-	num_jobs = min(num_args, mapp.max_processes)
+	num_jobs = min(num_args, max_processes)
+
+	if num_jobs < 2:
+		return _run((function, None, base, count()) + args)
 
-	# used later to identify results
+	# used later to identify random streams
 	indices = range(num_args)
 
+	if backend == 'auto':
+		backend = 'threads' if getattr(function, 'releases_gil', False) else 'processes'
+
+	if backend == 'threads':
+		# threads share the caller's random number generator
+		num_chunks = min(num_args, num_jobs * mapp.chunks_per_process)
+		chunks = [(function, None, base, indices[j::num_chunks])
+			+ tuple(arg[j::num_chunks] for arg in args) for j in range(num_chunks)]
+
+		results = _pool(max_processes, ThreadPool).map(_run, chunks, chunksize=1)
+
+	else:
+		# only workers of the pool process more than one chunk
+		pooled = _picklable(function)
+		num_chunks = min(num_args, num_jobs * mapp.chunks_per_process) if pooled else num_jobs
+
+		# split arguments into chunks and draw a random seed for each chunk
+		chunks = [(function, randint(0, 2**32 - 1), base, indices[j::num_chunks])
+			+ tuple(arg[j::num_chunks] for arg in args) for j in range(num_chunks)]
+
+		if pooled:
+			# shared arrays are passed to workers without copying their data; chunks are
+			# pickled here since the pool pickles tasks in a thread of its own
+			with by_reference():
+				chunks = [dumps(chunk, 2) for chunk in chunks]
+
+			results = _pool(max_processes).map(_run_pickled, chunks, chunksize=1)
+		else:
+			results = _fork(chunks)
+
+	# undo interleaving of chunks
+	return [results[idx % num_chunks][idx // num_chunks] for idx in range(num_args)]
+
+mapp.max_processes = cpu_count()
+mapp.backend = 'auto'
+mapp.chunks_per_process = 4
+
+
+
+def releases_gil(function):
+	"""
+	Marks a function which spends most of its time in code releasing the GIL (e.g., BLAS
+	and LAPACK), so that the C{'auto'} backend of L{mapp} runs it in threads. Example:
+
+		>>> @mapp.releases_gil
+		>>> def parfor(i):
+		>>> 	return solve(A[i], b[i])
+
+	@type  function: function
+	@param function: function which will be passed to L{mapp}
+
+	@rtype: function
+	@return: the same function
+	"""
+
+	function.releases_gil = True
+	return function
+
+mapp.releases_gil = releases_gil
+
+
+
+def _run(chunk):
+	"""
+	Applies a function to a chunk of arguments, giving each call its own random stream.
+	"""
+
+	function, rseed, base, indices = chunk[:4]
+
+	if rseed is not None:
+		# randomize
+		np_seed(rseed)
+		py_seed(rseed)
+
+	results = []
+	for index, args in zip(indices, zip(*chunk[4:])):
+		with stream(base, index):
+			results.append(function(*args))
+	return results
+
+
+
+def _run_pickled(chunk):
+	"""
+	Applies a function to a pickled chunk of arguments (see L{_run}).
+	"""
+
+	return _run(loads(chunk))
+
+
+
+def _fork(chunks):
+	"""
+	Processes each chunk in a separate, newly started process.
+	"""
+
+	def run(queue, index, chunk):
+		try:
+			queue.put((index, _run(chunk)))
+		except Exception as error:
+			# make sure the parent process doesn't wait forever
+			queue.put((index, error))
+			raise
+
 	# queue for storing return values
-	queue = Queue(num_args)
+	queue = Queue(len(chunks))
 
 	# start processes
 	processes = []
-	for j in range(num_jobs):
-		# prepare job
-		job_args = [function, queue, indices[j::num_jobs], randint(0, 1E10)] + \
-			[arg[j::num_jobs] for arg in args]
-
-		# start process
-		processes.append(Process(target=run, args=job_args))
+	for j, chunk in enumerate(chunks):
+		processes.append(Process(target=run, args=(queue, j, chunk)))
 		processes[-1].start()
 
 	# collect and store results
-	results = {}
-	for _ in range(num_jobs):
-		results.update(queue.get())
+	results = dict(queue.get() for _ in chunks)
 
 	# wait for processes to finish
 	for process in processes:
 		process.join()
 
-	# return sorted results
-	return [results[idx] for idx in range(num_args)]
+	for result in results.values():
+		if isinstance(result, Exception):
+			raise result
 
-mapp.max_processes = cpu_count()
+	return [results[j] for j in range(len(chunks))]
+
+
+
+def _pool(num_processes, pool_type=Pool):
+	"""
+	Returns a pool of worker processes or threads, starting new workers only if the
+	requested number of workers has changed.
+	"""
+
+	pool = _pool.pools.get(pool_type, None)
+
+	if pool is None or pool._processes != num_processes:
+		_shutdown(pool_type)
+
+		_pool.pools[pool_type] = pool_type(num_processes)
+
+	return _pool.pools[pool_type]
+
+_pool.pools = {}
+
+
+
+@register
+def _shutdown(*pool_types):
+	"""
+	Stops the workers of the given pools (by default, all pools).
+	"""
+
+	for pool_type in pool_types or _pool.pools.keys():
+		pool = _pool.pools.pop(pool_type, None)
+
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+
+
+def _picklable(function):
+	"""
+	Checks whether a function can be sent to already running processes.
+	"""
+
+	if getattr(function, '__module__', None) == '__main__':
+		# workers might not know about functions defined after they were started
+		return False
+
+	try:
+		dumps(function, 2)
+	except (PicklingError, TypeError, AttributeError):
+		return False
+	return True
@@ -0,0 +1,137 @@
+"""
+Records of the progress of training runs.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+import os
+import json
+
+from collections import deque
+from time import time
+from multiprocessing import current_process
+from threading import Lock
+from numpy import generic
+
+class Metrics(object):
+	"""
+	Collects records describing the progress of training runs. Models pass records to
+	C{Distribution.METRICS} if it is set, e.g.:
+
+		>>> Distribution.METRICS = Metrics('results/metrics.log', experiment=experiment)
+
+	Records are dictionaries of numbers and strings. The most recent records are kept in
+	memory, appended to a log file with one JSON object per line, and sent to the server
+	of an experiment (see L{Experiment.status}). Records created in worker processes are
+	ignored.
+
+	@type filename: string
+	@ivar filename: log file to which records are appended
+
+	@type experiment: Experiment
+	@ivar experiment: experiment whose server receives the records
+	"""
+
+	def __init__(self, filename=None, experiment=None, capacity=1000):
+		"""
+		@type  filename: string
+		@param filename: log file to which records are appended (optional)
+
+		@type  experiment: Experiment
+		@param experiment: experiment whose server receives the records (optional)
+
+		@type  capacity: integer
+		@param capacity: number of records kept in memory
+		"""
+
+		self.filename = filename
+		self.experiment = experiment
+
+		self._records = deque(maxlen=capacity)
+		self._lock = Lock()
+		self._handle = None
+
+		if filename:
+			# make sure directory exists
+			try:
+				os.makedirs(os.path.dirname(filename))
+			except OSError:
+				pass
+
+			self._handle = open(filename, 'a')
+
+
+
+	def record(self, **values):
+		"""
+		Stores a record. The current time is added to the record.
+
+		@param values: numbers and strings, C{None} values are omitted
+		"""
+
+		if current_process().name != 'MainProcess':
+			return
+
+		record = {'time': time()}
+		record.update((key, _plain(value)) for key, value in values.items() if value is not None)
+
+		with self._lock:
+			self._records.append(record)
+
+			if self._handle is not None:
+				self._handle.write(json.dumps(record, sort_keys=True) + '\n')
+				self._handle.flush()
+
+		if self.experiment is not None:
+			self.experiment.status('METRICS', record=record)
+
+
+
+	def records(self, **conditions):
+		"""
+		Returns the records kept in memory, optionally only those with matching values.
+
+		@rtype: list
+		@return: records in chronological order
+		"""
+
+		with self._lock:
+			records = list(self._records)
+
+		return [record for record in records
+			if all(record.get(key, None) == value for key, value in conditions.items())]
+
+
+
+	@staticmethod
+	def load(filename):
+		"""
+		Reads all records from a log file.
+
+		@type  filename: string
+		@param filename: a log file written by L{Metrics}
+
+		@rtype: list
+		@return: records in chronological order
+		"""
+
+		with open(filename) as handle:
+			return [json.loads(line) for line in handle if line.strip()]
+
+
+
+	def close(self):
+		if self._handle is not None:
+			self._handle.close()
+			self._handle = None
+
+
+
+def _plain(value):
+	"""
+	Converts NumPy scalars into Python numbers.
+	"""
+
+	return value.item() if isinstance(value, generic) else value
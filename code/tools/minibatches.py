@@ -0,0 +1,96 @@
+"""
+Iteration over randomly ordered minibatches without copying data sets.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+from numpy import asfortranarray, empty, take
+from rng import permutation
+
+class Minibatches(object):
+	"""
+	Iterates over minibatches of data points stored in the columns of one or several
+	arrays. Example:
+
+		>>> for epoch in range(10):
+		>>> 	for X_, Y_ in Minibatches((X, Y), 100):
+		>>> 		P = dot(X_, Y_.T)
+
+	Every iteration over the minibatches visits the data points in a new random order.
+	Instead of permuting the data, only indices are shuffled and the data points of each
+	minibatch are gathered into buffers which are allocated once. Data is stored in
+	Fortran order, so that data points are contiguous in memory and can be copied
+	efficiently. Arrays which are not already stored in Fortran order are copied once.
+
+	The buffers are reused by the next minibatch, so minibatches have to be copied if
+	they are needed for longer.
+
+	@type batch_size: integer
+	@ivar batch_size: number of data points per minibatch
+
+	@type shuffle: bool
+	@ivar shuffle: if false, minibatches are views of consecutive data points
+
+	@type incomplete: bool
+	@ivar incomplete: whether or not to return a smaller last minibatch
+	"""
+
+	def __init__(self, data, batch_size, shuffle=True, incomplete=False):
+		"""
+		@type  data: array_like/tuple
+		@param data: an array or a tuple of arrays with the same number of columns
+
+		@type  batch_size: integer
+		@param batch_size: number of data points per minibatch
+
+		@type  shuffle: bool
+		@param shuffle: randomize order of data points (default: True)
+
+		@type  incomplete: bool
+		@param incomplete: return a smaller last minibatch (default: False)
+		"""
+
+		self.batch_size = batch_size
+		self.shuffle = shuffle
+		self.incomplete = incomplete
+
+		self._tuple = isinstance(data, (tuple, list))
+		self._data = [asfortranarray(array) for array in (data if self._tuple else [data])]
+
+		if shuffle:
+			# transposed buffers, whose rows are contiguous in memory
+			self._buffers = [empty([min(batch_size, array.shape[1]), array.shape[0]],
+				dtype=array.dtype) for array in self._data]
+
+
+
+	def __len__(self):
+		"""
+		Number of minibatches per iteration.
+		"""
+
+		if self.incomplete:
+			return -(-self._data[0].shape[1] // self.batch_size)
+		return self._data[0].shape[1] // self.batch_size
+
+
+
+	def __iter__(self):
+		num_data = self._data[0].shape[1]
+
+		if self.shuffle:
+			indices = permutation(num_data)
+
+		for i in range(len(self)):
+			fr, to = i * self.batch_size, min((i + 1) * self.batch_size, num_data)
+
+			if self.shuffle:
+				# gather data points into buffers
+				batch = [take(array.T, indices[fr:to], axis=0, out=buffer[:to - fr], mode='clip').T
+					for array, buffer in zip(self._data, self._buffers)]
+			else:
+				batch = [array[:, fr:to] for array in self._data]
+
+			yield tuple(batch) if self._tuple else batch[0]
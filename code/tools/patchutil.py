@@ -8,7 +8,7 @@ __docformat__ = 'epytext'
 __version__ = '1.0.0'
 
 from numpy import array, asarray, floor, ceil, sqrt, zeros
-from numpy.random import uniform
+from rng import uniform
 import matplotlib.pyplot as mplt
 
 def sample(img, patch_size, num_samples):
@@ -3,10 +3,10 @@ __author__ = 'Lucas Theis <lucas@tuebingen.mpg.de>'
 __docformat__ = 'epytext'
 
 from numpy import log, array, asarray, mean, std
-from numpy.random import randn, permutation
+from rng import randn, permutation
 from numpy.linalg import eig
 
-def preprocess(data, shuffle=True, noise_level=None):
+def preprocess(data, shuffle=True, noise_level=None, dtype='float64'):
 	"""
 	Log-transforms and centers the data. Optionally, adds some noise.
 	The standard deviation of the added Gaussian noise is 1 / C{noise_level}.
@@ -20,6 +20,9 @@ def preprocess(data, shuffle=True, noise_level=None):
 	@type  noise_level: integer
 	@param noise_level: add a little bit of noise after log-transform
 
+	@type  dtype: dtype
+	@param dtype: precision of the returned data (the data is centered in double precision)
+
 	@rtype: ndarray
 	@return: preprocessed data
 	"""
@@ -41,4 +44,4 @@ def preprocess(data, shuffle=True, noise_level=None):
 		# add Gaussian white noise
 		data += randn(*data.shape) * (std(data) / float(noise_level))
 
-	return asarray(data, order='F')
+	return asarray(data, dtype=dtype, order='F')
@@ -0,0 +1,235 @@
+"""
+Lightweight timers for the expensive phases of training and evaluation.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+from time import time
+from threading import Lock
+from functools import wraps
+from numpy import ndarray
+
+class Profiler(object):
+	"""
+	Measures the cumulative time spent in named phases, how often each phase was entered
+	and how many bytes the arrays returned by each phase occupy. Phases are marked either
+	with a decorator or with a context manager:
+
+		>>> @profiler.timed()
+		>>> def train_prior(self, Y):
+		>>> 	...
+
+		>>> with profiler.phase('ISA.sample_posterior_ais.step'):
+		>>> 	...
+
+	Profiling is disabled by default, in which case decorated methods only perform one
+	additional function call and L{phase} returns a context manager which does nothing.
+	To profile a run:
+
+		>>> profiler.enable()
+		>>> model.train(data)
+		>>> print profiler.report()
+
+	Times are inclusive, i.e., the time of a phase includes the time of all phases entered
+	from within it. Phases entered in processes created by L{mapp} are not recorded.
+
+	@type enabled: bool
+	@ivar enabled: whether phases are currently being recorded
+	"""
+
+	def __init__(self):
+		self.enabled = False
+
+		# maps names of phases to time, number of calls and bytes
+		self._stats = {}
+		self._lock = Lock()
+
+
+
+	def enable(self):
+		self.enabled = True
+
+
+
+	def disable(self):
+		self.enabled = False
+
+
+
+	def reset(self):
+		"""
+		Forgets all recorded phases.
+		"""
+
+		with self._lock:
+			self._stats = {}
+
+
+
+	def add(self, name, seconds, nbytes=0):
+		"""
+		Adds a single call to a phase.
+
+		@type  name: string
+		@param name: name of the phase
+
+		@type  seconds: float
+		@param seconds: duration of the call
+
+		@type  nbytes: integer
+		@param nbytes: bytes allocated by the call
+		"""
+
+		if not self.enabled:
+			return
+
+		with self._lock:
+			stats = self._stats.setdefault(name, [0., 0, 0])
+			stats[0] += seconds
+			stats[1] += 1
+			stats[2] += nbytes
+
+
+
+	def phase(self, name):
+		"""
+		Returns a context manager which measures the time spent in a phase.
+
+		@type  name: string
+		@param name: name of the phase
+
+		@rtype: object
+		@return: a context manager
+		"""
+
+		if not self.enabled:
+			return _DISABLED
+		return _Phase(self, name)
+
+
+
+	def timed(self, name=None):
+		"""
+		Returns a decorator which records calls of a method as a phase. The size of arrays
+		returned by the method is counted as allocated memory.
+
+		@type  name: string
+		@param name: name of the phase (default: class name and name of the method)
+
+		@rtype: function
+		@return: a decorator
+		"""
+
+		def decorator(method):
+			@wraps(method)
+			def wrapper(*args, **kwargs):
+				if not self.enabled:
+					return method(*args, **kwargs)
+
+				start = time()
+				result = method(*args, **kwargs)
+
+				self.add(name or '{0}.{1}'.format(args[0].__class__.__name__, method.__name__),
+					time() - start, _nbytes(result))
+
+				return result
+			return wrapper
+		return decorator
+
+
+
+	def stats(self):
+		"""
+		Returns the statistics of all recorded phases.
+
+		@rtype: dict
+		@return: maps names of phases to dictionaries with keys C{time}, C{calls} and C{bytes}
+		"""
+
+		with self._lock:
+			return dict((name, {'time': stats[0], 'calls': stats[1], 'bytes': stats[2]})
+				for name, stats in self._stats.items())
+
+
+
+	def report(self, sort='time'):
+		"""
+		Summarizes the recorded phases in a table.
+
+		@type  sort: string
+		@param sort: C{'time'}, C{'calls'}, C{'bytes'} or C{'name'}
+
+		@rtype: string
+		@return: one line per phase
+		"""
+
+		stats = self.stats()
+
+		if sort == 'name':
+			names = sorted(stats)
+		else:
+			names = sorted(stats, key=lambda name: stats[name][sort], reverse=True)
+
+		lines = ['{0:<40} {1:>12} {2:>10} {3:>12} {4:>12}'.format(
+			'Phase', 'Time [s]', 'Calls', 'Time/call', 'Bytes')]
+
+		for name in names:
+			lines.append('{0:<40} {1:>12.3f} {2:>10} {3:>12.3g} {4:>12}'.format(name,
+				stats[name]['time'],
+				stats[name]['calls'],
+				stats[name]['time'] / stats[name]['calls'],
+				stats[name]['bytes']))
+
+		return '\n'.join(lines)
+
+
+
+class _Phase(object):
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+
+
+
+	def __enter__(self):
+		self.start = time()
+		return self
+
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.profiler.add(self.name, time() - self.start)
+
+
+
+class _Disabled(object):
+	def __enter__(self):
+		return self
+
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		pass
+
+
+
+_DISABLED = _Disabled()
+
+
+
+def _nbytes(result):
+	"""
+	Counts the bytes occupied by the arrays in a result.
+	"""
+
+	if isinstance(result, ndarray):
+		return result.nbytes
+	if isinstance(result, tuple):
+		return sum(_nbytes(value) for value in result)
+	return 0
+
+
+
+profiler = Profiler()
@@ -0,0 +1,172 @@
+"""
+Random number generation with deterministically derived, independent streams.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+from threading import local
+from contextlib import contextmanager
+from numpy import asarray
+from numpy.random import RandomState, mtrand
+
+# random state of the current thread
+_state = local()
+
+def seed(value):
+	"""
+	Seeds the root generator, which is used outside of L{stream}s. Until this function
+	is called, numbers are drawn from NumPy's global random state (so that
+	C{numpy.random.seed} keeps working).
+
+	@type  value: integer
+	@param value: a non-negative integer
+	"""
+
+	generator.root = _create([value])
+
+
+
+@contextmanager
+def stream(*key):
+	"""
+	Makes the current thread draw random numbers from an independent stream which
+	is uniquely identified by the given key. Example:
+
+		>>> with stream(spawn(), 3):
+		>>> 	samples = randn(10)
+
+	@type  key: integers
+	@param key: non-negative integers identifying the stream
+	"""
+
+	previous = getattr(_state, 'key', None), getattr(_state, 'generator', None)
+
+	# the generator is only created when it is needed
+	_state.key, _state.generator = key, None
+
+	try:
+		yield
+	finally:
+		_state.key, _state.generator = previous
+
+
+
+def spawn():
+	"""
+	Draws a seed from the current stream which can be used to derive new streams.
+
+	@rtype: integer
+	@return: a random 32-bit integer
+	"""
+
+	return int(randint(0, 2**32))
+
+
+
+def generator():
+	"""
+	Returns the generator of the current stream, which can be used to draw samples from
+	distributions not covered by this module.
+
+	@rtype: RandomState
+	@return: the generator used by the current thread
+	"""
+
+	if getattr(_state, 'key', None) is None:
+		return generator.root
+
+	if _state.generator is None:
+		_state.generator = _create(_state.key)
+
+	return _state.generator
+
+generator.root = mtrand._rand
+
+
+
+def getstate():
+	"""
+	Returns the state of the current generator, e.g., to store it in a checkpoint.
+
+	@rtype: tuple
+	@return: state of the generator used by the current thread
+	"""
+
+	return generator().get_state()
+
+
+
+def setstate(state):
+	"""
+	Restores the state of the current generator.
+
+	@type  state: tuple
+	@param state: a state returned by L{getstate}
+	"""
+
+	generator().set_state(state)
+
+
+
+def randn(*shape, **kwargs):
+	"""
+	@type  dtype: dtype
+	@param dtype: C{float32} or C{float64} (default)
+	"""
+
+	return asarray(generator().standard_normal(shape or None), dtype=kwargs.get('dtype', 'float64'))
+
+
+
+def rand(*shape):
+	return generator().random_sample(shape or None)
+
+
+
+def randint(low, high=None, size=None):
+	return generator().randint(low, high, size)
+
+
+
+def permutation(x):
+	return generator().permutation(x)
+
+
+
+def multinomial(n, pvals, size=None):
+	return generator().multinomial(n, pvals, size)
+
+
+
+def logseries(p, size=None):
+	return generator().logseries(p, size)
+
+
+
+def gamma(shape, scale=1., size=None):
+	return generator().gamma(shape, scale, size)
+
+
+
+def uniform(low=0., high=1., size=None):
+	return generator().uniform(low, high, size)
+
+
+
+def _create(key):
+	"""
+	Creates a new generator from a sequence of non-negative integers.
+	"""
+
+	# split large integers into 32-bit words
+	words = []
+	for value in key:
+		value = int(value)
+		words.append(value % 2**32)
+		while value >= 2**32:
+			value //= 2**32
+			words.append(value % 2**32)
+
+	return RandomState(words)
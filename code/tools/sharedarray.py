@@ -0,0 +1,160 @@
+"""
+Arrays stored in named shared memory segments, which can be sent to other processes
+without copying their data.
+"""
+
+__license__ = 'MIT License <http://www.opensource.org/licenses/mit-license.php>'
+__author__ = 'Lucas Theis <lucas@theis.io>'
+__docformat__ = 'epytext'
+
+from numpy import ndarray, memmap, asarray, asanyarray, uint8
+from tempfile import mkstemp, gettempdir
+from os import close, unlink, getpid, statvfs, access, W_OK
+from os.path import isdir
+from threading import local
+
+class SharedArray(ndarray):
+	"""
+	An array whose data lives in a file in shared memory (C{/dev/shm}, if available).
+	When sent to L{mapp}'s worker processes, only a description of the array's location
+	within the file is pickled, so that arrays and views of arrays are passed at virtually
+	no cost. Changes made by any process are visible to all processes.
+
+	The file is removed once the array created by L{asshared} and all of its views have
+	been deleted. Shared arrays pickled for any other purpose (e.g., when saving an
+	L{Experiment}) are therefore stored as ordinary arrays.
+	"""
+
+	def __array_finalize__(self, obj):
+		self._segment = getattr(obj, '_segment', None)
+
+
+
+	def __array_wrap__(self, array, context=None):
+		# results of computations are ordinary arrays or scalars
+		array = asarray(array)
+		return array[()] if array.ndim == 0 else array
+
+
+
+	def __reduce__(self):
+		segment = self._segment
+
+		if segment is not None and getattr(by_reference.state, 'count', 0) > 0:
+			address = self.__array_interface__['data'][0]
+
+			# range of memory covered by the array
+			low = address + sum(s * (n - 1) for s, n in zip(self.strides, self.shape) if s < 0)
+			high = address + sum(s * (n - 1) for s, n in zip(self.strides, self.shape) if s > 0)
+
+			if self.size > 0 and low >= segment.address \
+				and high + self.itemsize <= segment.address + segment.size:
+				return _attach, (segment.filename, self.dtype, self.shape,
+					address - segment.address, self.strides)
+
+		# array does not live in shared memory
+		return asarray(self).__reduce__()
+
+
+
+class by_reference(object):
+	"""
+	Context manager within which shared arrays are pickled by reference. Used by L{mapp}
+	while it pickles arguments for worker processes. The context only affects pickling
+	done by the current thread, so that other threads pickling shared arrays at the same
+	time (e.g., to save them) still store their data.
+	"""
+
+	# number of active contexts of each thread
+	state = local()
+
+	def __enter__(self):
+		by_reference.state.count = getattr(by_reference.state, 'count', 0) + 1
+
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		by_reference.state.count -= 1
+
+
+
+class _Segment(object):
+	"""
+	Keeps track of a memory mapped file and removes it when no longer needed.
+	"""
+
+	def __init__(self, filename, mapping, owner=False):
+		self.filename = filename
+		self.address = mapping.__array_interface__['data'][0]
+		self.size = mapping.nbytes
+
+		# only the creating process removes the file
+		self.pid = getpid() if owner else None
+
+
+
+	def __del__(self):
+		if self.pid == getpid():
+			try:
+				unlink(self.filename)
+			except OSError:
+				pass
+
+
+
+def asshared(array):
+	"""
+	Copies an array into shared memory, if necessary.
+
+	@type  array: array_like
+	@param array: data to be shared with other processes
+
+	@rtype: SharedArray
+	@return: a shared copy of the array (or the array itself if it already is shared)
+	"""
+
+	array = asanyarray(array)
+
+	if isinstance(array, SharedArray) or array.size == 0:
+		return array
+
+	fd, filename = mkstemp(prefix='shared-', dir=_directory(array.nbytes))
+	close(fd)
+
+	mapping = memmap(filename, dtype=array.dtype, mode='w+', shape=array.shape)
+	mapping[...] = array
+
+	shared = mapping.view(SharedArray)
+	shared._segment = _Segment(filename, mapping, owner=True)
+
+	return shared
+
+
+
+def _attach(filename, dtype, shape, offset, strides):
+	"""
+	Maps an existing shared memory segment into the memory of the current process.
+	"""
+
+	mapping = memmap(filename, dtype=uint8, mode='r+')
+
+	shared = ndarray.__new__(SharedArray, shape, dtype, mapping, offset, strides)
+	shared._segment = _Segment(filename, mapping)
+
+	return shared
+
+
+
+def _directory(num_bytes):
+	"""
+	Returns C{/dev/shm} if it exists and has enough space, otherwise a temporary directory.
+	"""
+
+	if isdir('/dev/shm') and access('/dev/shm', W_OK):
+		stats = statvfs('/dev/shm')
+
+		# leave some room for other applications
+		if stats.f_bavail * stats.f_frsize > 2 * num_bytes:
+			return '/dev/shm'
+
+	return gettempdir()
@@ -0,0 +1,55 @@
+import sys
+import unittest
+
+sys.path.append('./code')
+
+from models import ISA
+from tools import Evaluation, mapp
+from numpy import all
+from tempfile import mkdtemp
+from shutil import rmtree
+from glob import glob
+from os import path, remove
+
+mapp.max_processes = 1
+
+class Tests(unittest.TestCase):
+	def test_resume(self):
+		"""
+		Tests whether an interrupted and resumed evaluation gives the same results.
+		"""
+
+		isa = ISA(2, 4)
+		data = isa.sample(50)
+
+		kwargs = {'num_samples': 2, 'sampling_method': ('ais', {'num_steps': 2})}
+
+		directory = mkdtemp()
+
+		try:
+			evaluation = Evaluation(directory, isa, data, shard_size=10, **kwargs)
+
+			self.assertEqual(evaluation.run(), 5)
+			indices, ais_weights = evaluation.merge()
+
+			# forget some of the shards as if the evaluation had been interrupted
+			for filename in sorted(glob(path.join(directory, 'shard.*.npz')))[2:]:
+				remove(filename)
+
+			evaluation = Evaluation(directory, isa, data, **kwargs)
+
+			self.assertEqual(evaluation.shard_size, 10)
+			self.assertEqual(evaluation.run(), 3)
+			self.assertTrue(all(evaluation.merge()[1] == ais_weights))
+
+			# evaluations of other models or with other parameters are not resumed
+			self.assertRaises(ValueError, Evaluation, directory, ISA(2, 4), data, **kwargs)
+			self.assertRaises(ValueError, Evaluation, directory, isa, data, num_samples=3)
+
+		finally:
+			rmtree(directory)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,103 @@
+import sys
+import unittest
+
+sys.path.append('./code')
+
+from tools.experiment import StatusReporter, ExperimentServer, ExperimentRequestHandler
+from threading import Thread
+from time import time
+import socket
+
+class _Handler(ExperimentRequestHandler):
+	"""
+	Records connections and status updates instead of rendering them.
+	"""
+
+	connections = []
+	updates = []
+
+	def handle(self):
+		_Handler.connections.append(self.client_address)
+		ExperimentRequestHandler.handle(self)
+
+
+
+	def log_message(self, *args):
+		pass
+
+
+
+	def _update(self, instance):
+		_Handler.updates.append(instance)
+
+
+
+class Tests(unittest.TestCase):
+	def test_status_reporter(self):
+		"""
+		Tests whether progress updates are coalesced and sent over a single connection.
+		"""
+
+		server = ExperimentServer(('localhost', 0), _Handler)
+
+		thread = Thread(target=server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+		reporter = StatusReporter('localhost', server.server_address[1])
+
+		try:
+			for batch in range(2):
+				# keep the reporter from sending messages until all have been queued
+				with reporter._condition:
+					for progress in range(10):
+						reporter.report({'id': 1, 'status': 'PROGRESS', 'progress': progress})
+					reporter.report({'id': 2, 'status': 'running'})
+
+				reporter.flush(5.)
+
+				# only the latest progress is sent
+				self.assertEqual([(m['id'], m.get('progress', None)) for m in _Handler.updates],
+					[(1, 9), (2, None)] * (batch + 1))
+
+			self.assertEqual(len(_Handler.connections), 1)
+
+		finally:
+			reporter.close()
+			server.shutdown()
+			server.server_close()
+
+
+
+	def test_unreachable(self):
+		"""
+		Tests whether reporting to an unreachable server blocks.
+		"""
+
+		# find a port nobody is listening on
+		sock = socket.socket()
+		sock.bind(('localhost', 0))
+		port = sock.getsockname()[1]
+		sock.close()
+
+		reporter = StatusReporter('localhost', port, timeout=5.)
+
+		try:
+			start = time()
+			for progress in range(100):
+				reporter.report({'id': 1, 'status': 'PROGRESS', 'progress': progress})
+			self.assertLess(time() - start, 1.)
+
+			reporter.flush(5.)
+
+			# messages are dropped and the server is not contacted again for a while
+			self.assertFalse(reporter._queue)
+			self.assertGreater(reporter._unreachable, 0.)
+
+		finally:
+			reporter.close()
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+import sys
+import unittest
+
+sys.path.append('./code')
+
+from tools import mapp, asshared
+from tools.sharedarray import by_reference
+from threading import current_thread, Thread
+from multiprocessing import current_process
+from cPickle import dumps, loads
+from numpy import zeros, all
+
+def _worker(i):
+	return current_process().name, current_thread().name
+
+@mapp.releases_gil
+def _blas_worker(i):
+	return current_process().name, current_thread().name
+
+def _write(array, i):
+	array[i] = i + 1
+
+class Tests(unittest.TestCase):
+	def test_auto(self):
+		"""
+		Tests whether the automatic backend runs functions releasing the GIL in threads.
+		"""
+
+		results = mapp(_blas_worker, range(4), max_processes=2, backend='auto')
+
+		self.assertTrue(all([process == 'MainProcess' for process, _ in results]))
+		self.assertTrue(all([thread != 'MainThread' for _, thread in results]))
+
+		results = mapp(_worker, range(4), max_processes=2, backend='auto')
+
+		self.assertTrue(all([process != 'MainProcess' for process, _ in results]))
+
+
+
+	def test_shared(self):
+		"""
+		Tests whether shared arrays are passed to worker processes by reference only.
+		"""
+
+		array = asshared(zeros(4))
+
+		mapp(_write, [array] * 4, range(4), max_processes=2, backend='processes')
+
+		# changes made by worker processes are visible
+		self.assertTrue(all(array == [1, 2, 3, 4]))
+
+		# other threads still pickle the data of shared arrays
+		pickled = []
+		thread = Thread(target=lambda: pickled.append(dumps(array, 2)))
+
+		with by_reference():
+			thread.start()
+			thread.join()
+
+		array[:] = 0
+
+		self.assertTrue(all(loads(pickled[0]) == [1, 2, 3, 4]))
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,44 @@
+import sys
+import unittest
+
+sys.path.append('./code')
+
+from tools import Minibatches
+from numpy import arange, vstack, hstack, all, unique
+
+class Tests(unittest.TestCase):
+	def test_epoch(self):
+		"""
+		Tests whether every data point is visited exactly once per iteration.
+		"""
+
+		# data points are identified by their entries
+		X = vstack([arange(23.), -arange(23.)])
+		Y = 2. * X[:1]
+
+		for shuffle in [True, False]:
+			minibatches = Minibatches((X, Y), 5, shuffle=shuffle, incomplete=True)
+
+			for epoch in range(2):
+				# buffers are reused, so minibatches have to be copied
+				batches = [(X_.copy(), Y_.copy()) for X_, Y_ in minibatches]
+
+				self.assertEqual(len(batches), 5)
+				self.assertEqual(batches[-1][0].shape, (2, 3))
+
+				# data points of different arrays are kept together
+				self.assertTrue(all([all(Y_ == 2. * X_[:1]) for X_, Y_ in batches]))
+				self.assertTrue(all([all(X_[1] == -X_[0]) for X_, _ in batches]))
+
+				self.assertTrue(all(sorted(hstack([X_[0] for X_, _ in batches])) == arange(23.)))
+
+			# without the incomplete minibatch, no data point is visited twice
+			visited = hstack([X_[0].copy() for X_ in Minibatches(X, 5, shuffle=shuffle)])
+
+			self.assertEqual(visited.size, 20)
+			self.assertEqual(unique(visited).size, 20)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
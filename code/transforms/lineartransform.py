@@ -6,12 +6,14 @@ from transform import Transform
 from numpy import *
 from numpy.linalg import slogdet, inv
 from scipy import indices
+from tools import profiler
 
 class LinearTransform(Transform):
 	def __init__(self, *args, **kwargs):
 		"""
 		A linear transformation. If initialized with the DCT basis, the first
-		feature corresponds to the DC component.
+		feature corresponds to the DC component. Single-precision data stays in
+		single precision when transformed.
 
 		@type  A: array_like
 		@param A: linear transform matrix
@@ -64,17 +66,31 @@ class LinearTransform(Transform):
 
 
 
+	@profiler.timed()
 	def apply(self, data):
-		return dot(self.A, data)
+		return dot(_cast(self.A, data), data)
 
 
 
+	@profiler.timed()
 	def inverse(self, data):
-		return dot(inv(self.A), data)
+		return dot(_cast(inv(self.A), data), data)
 
 
 
+	@profiler.timed()
 	def logjacobian(self, data=None):
 		if data is None:
 			return slogdet(self.A)[1]
 		return slogdet(self.A)[1] + zeros([1, data.shape[1]])
+
+
+
+def _cast(matrix, data):
+	"""
+	Converts the matrix to single precision if the data is in single precision.
+	"""
+
+	if asarray(data).dtype == float32:
+		return asarray(matrix, dtype=float32)
+	return matrix
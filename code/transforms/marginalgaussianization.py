@@ -6,6 +6,7 @@ from transform import Transform
 from univariategaussianization import UnivariateGaussianization
 from numpy.linalg import inv, slogdet
 from numpy import vstack, dot, zeros
+from tools import profiler
 
 class MarginalGaussianization(Transform):
 	def __init__(self, ica):
@@ -18,6 +19,7 @@ class MarginalGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def apply(self, data):
 		"""
 		@type  data: array_like
@@ -44,6 +46,7 @@ class MarginalGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def inverse(self, data):
 		"""
 		Apply inverse Gaussianization.
@@ -69,6 +72,7 @@ class MarginalGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def logjacobian(self, data):
 		"""
 		Returns the log-determinant of the Jabian matrix evaluated at the given
@@ -6,7 +6,7 @@ from transform import Transform
 from scipy.stats import chi
 from scipy.special import gamma, erf, erfinv
 from scipy.optimize import bisect
-from tools import gammaincinv, logsumexp
+from tools import gammaincinv, logsumexp, profiler
 from numpy import sqrt, sum, square, multiply, zeros_like, zeros, log
 
 class RadialGaussianization(Transform):
@@ -20,6 +20,7 @@ class RadialGaussianization(Transform):
 
 	
 
+	@profiler.timed()
 	def apply(self, data):
 		"""
 		Radially Gaussianizes the given data.
@@ -50,6 +51,7 @@ class RadialGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def inverse(self, data, max_iter=100):
 		"""
 		Applies the inverse transformation to the given set of data points.
@@ -97,6 +99,7 @@ class RadialGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def logjacobian(self, data):
 		"""
 		Returns the log-determinant of the Jacobian of radial Gaussianization
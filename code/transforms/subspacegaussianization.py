@@ -7,6 +7,7 @@ from radialgaussianization import RadialGaussianization
 from numpy.linalg import inv, slogdet
 from numpy import vstack, dot, zeros
 from collections import Callable
+from tools import profiler
 
 class SubspaceGaussianization(Transform):
 	def __init__(self, isa):
@@ -19,6 +20,7 @@ class SubspaceGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def apply(self, data):
 		"""
 		Subspace Gaussianize data by first applying a linear transformation and then
@@ -64,6 +66,7 @@ class SubspaceGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def inverse(self, data):
 		"""
 		Apply inverse subspace Gaussianization.
@@ -103,6 +106,7 @@ class SubspaceGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def logjacobian(self, data):
 		"""
 		Returns the log-determinant of the Jabian matrix evaluated at the given
@@ -7,6 +7,7 @@ from scipy.stats import norm
 from scipy.optimize import bisect
 from numpy import mean, sqrt, asarray, max, min, any
 from transforms import Transform
+from tools import profiler
 
 import pdb
 
@@ -16,6 +17,7 @@ class UnivariateGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def apply(self, data):
 		# make sure data has right shape
 		data = asarray(data).reshape(1, -1)
@@ -32,6 +34,7 @@ class UnivariateGaussianization(Transform):
 
 
 
+	@profiler.timed()
 	def inverse(self, data, max_iter=100):
 		# make sure data has right shape
 		data = asarray(data).reshape(1, -1)
@@ -62,6 +65,7 @@ class UnivariateGaussianization(Transform):
 
 
 	
+	@profiler.timed()
 	def logjacobian(self, data):
 		# make sure data has right shape
 		data = asarray(data).reshape(1, -1)
@@ -31,6 +31,7 @@ class WhiteningTransform(LinearTransform):
 
 		self.symmetric = symmetric
 
+		# the covariance is estimated in double precision, even for single-precision data
 		data = asarray(data, dtype='float64')
 
 		# center